@@ -0,0 +1,393 @@
+"""
+Alert management and Telegram delivery.
+
+AlertManager keeps a small state machine per device so a sustained fault
+produces one alert (plus periodic reminders) instead of one message per
+reading:
+
+    normal ──(p > raise_threshold)──▶ raised ──▶ sustained ──(p < clear_threshold)──▶ cleared ──▶ normal
+
+The gap between the raise and clear thresholds (hysteresis) stops a motor
+hovering around 80% from flapping. TelegramNotifier sends messages from a
+small thread pool over a pooled HTTP session, so alerting never blocks
+message processing; AsyncTelegramNotifier does the same on an asyncio
+event loop with httpx (async_subscriber.py).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from metrics import Histogram
+from rollups import to_epoch
+
+log = logging.getLogger(__name__)
+
+NORMAL = "normal"
+RAISED = "raised"
+SUSTAINED = "sustained"
+CLEARED = "cleared"
+
+
+def event_time(event):
+    """
+    Local time of the reading behind an alert event (an epoch number, a
+    numeric or ISO 8601 string or a datetime), or of the event itself if
+    the reading has no usable timestamp.
+    """
+    value = event["data"].get("timestamp")
+    try:
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                value = datetime.fromisoformat(value)
+        return datetime.fromtimestamp(to_epoch(value))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return datetime.fromtimestamp(event.get("time") or time.time())
+
+
+def format_alert(event):
+    """Telegram text for a single alert event."""
+    data = event["data"]
+    when = event_time(event).strftime('%Y-%m-%d %H:%M:%S')
+
+    if event["state"] == CLEARED:
+        return (
+            f"✅ *Motor Recovered* ✅\n\n"
+            f"🏭 **Motor:** {event['device_id']}\n"
+            f"⏰ **Time:** {when}\n"
+            f"📉 **Failure Probability:** {event['probability']:.1%}"
+        )
+
+    title = "CRITICAL WARNING: Motor Failure Detected"
+    if event["state"] == SUSTAINED:
+        title = "STILL CRITICAL: Motor Failure Risk Persists"
+    return (
+        f"🚨 *{title}* 🚨\n\n"
+        f"🏭 **Motor:** {event['device_id']}\n"
+        f"⏰ **Time:** {when}\n"
+        f"⚠️ **Failure Probability:** {event['probability']:.1%}\n\n"
+        f"📊 **Sensor Readings:**\n"
+        f"• Temperature: {data['temperature']:.1f} °C\n"
+        f"• Vibration: {data['vibration']:.3f} m/s²\n"
+        f"• RPM: {data['rpm']:.0f}\n\n"
+        f"Please check the equipment immediately!"
+    )
+
+
+def format_digest(events):
+    """One Telegram text summarising a burst of alert events."""
+    raised = [e for e in events if e["state"] != CLEARED]
+    cleared = [e for e in events if e["state"] == CLEARED]
+    lines = [f"🚨 *Motor Alert Digest* ({len(events)} events)\n"]
+    if raised:
+        lines.append("⚠️ **At risk:**")
+        for e in sorted(raised, key=lambda e: -e["probability"]):
+            lines.append(f"• {e['device_id']}: {e['probability']:.1%} ({e['state']})")
+    if cleared:
+        lines.append("\n✅ **Recovered:**")
+        for e in cleared:
+            lines.append(f"• {e['device_id']}: {e['probability']:.1%}")
+    return "\n".join(lines)
+
+
+class TelegramNotifier:
+    """
+    Non-blocking Telegram sender: messages go to a small thread pool that
+    posts them over one pooled requests.Session and retries failures.
+    `api_url` can point at a local stub (see telegram_stub.py). requests
+    is imported and the session opened with the first message, so a
+    subscriber that never alerts doesn't pay for either at startup.
+    """
+
+    def __init__(self, bot_token, chat_id, api_url="https://api.telegram.org",
+                 max_workers=2, max_retries=3, backoff_base=1.0, timeout=5):
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.api_url = api_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.stats = {"sent": 0, "failed": 0, "retries": 0}
+        self.latency = Histogram("telegram_send_seconds", "Telegram sendMessage request latency")
+        self.max_workers = max_workers
+        self.session = None
+        self._session_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="telegram")
+
+    def _get_session(self):
+        with self._session_lock:
+            if self.session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.session = session
+            return self.session
+
+    @property
+    def enabled(self):
+        return bool(self.bot_token and self.chat_id)
+
+    def send(self, text):
+        """Queues a message; returns a Future (or None when Telegram isn't configured)."""
+        if not self.enabled:
+            log.warning("⚠️ Telegram credentials not found. Skipping notification.")
+            return None
+        return self.executor.submit(self._post, text)
+
+    def _post(self, text):
+        url = f"{self.api_url}/bot{self.bot_token}/sendMessage"
+        payload = {
+            "chat_id": self.chat_id,
+            "text": text,
+            "parse_mode": "Markdown"
+        }
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff_base * (2 ** attempt)
+            try:
+                with self.latency.time():
+                    response = session.post(url, json=payload, timeout=self.timeout)
+                if response.status_code == 429:
+                    # Telegram rate limit: wait as long as it asks
+                    delay = max(delay, response.json().get("parameters", {}).get("retry_after", 1))
+                response.raise_for_status()
+                self.stats["sent"] += 1
+                log.info(f"telegram notification sent: {response.status_code}")
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.stats["failed"] += 1
+                    log.error(f"Failed to send Telegram notification: {e}")
+                    return False
+                self.stats["retries"] += 1
+                time.sleep(delay)
+
+    def close(self, timeout=None):
+        self.executor.shutdown(wait=True)
+        if self.session is not None:
+            self.session.close()
+
+
+class AsyncTelegramNotifier:
+    """
+    TelegramNotifier for asyncio: `send` schedules the post on the event
+    loop, where up to `max_in_flight` requests share one httpx.AsyncClient.
+    `send` may also be called from other threads (the digest loop). Create
+    it inside the running loop and `await aclose()` at shutdown.
+    """
+
+    def __init__(self, bot_token, chat_id, api_url="https://api.telegram.org",
+                 max_in_flight=4, max_retries=3, backoff_base=1.0, timeout=5):
+        import httpx
+
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.api_url = api_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.stats = {"sent": 0, "failed": 0, "retries": 0}
+        self.latency = Histogram("telegram_send_seconds", "Telegram sendMessage request latency")
+
+        self.loop = asyncio.get_running_loop()
+        self.client = httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=max_in_flight))
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._pending = set()
+
+    @property
+    def enabled(self):
+        return bool(self.bot_token and self.chat_id)
+
+    def send(self, text):
+        """Schedules a message; returns a concurrent Future (or None when Telegram isn't configured)."""
+        if not self.enabled:
+            log.warning("⚠️ Telegram credentials not found. Skipping notification.")
+            return None
+        future = asyncio.run_coroutine_threadsafe(self._post(text), self.loop)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        return future
+
+    async def _post(self, text):
+        url = f"{self.api_url}/bot{self.bot_token}/sendMessage"
+        payload = {
+            "chat_id": self.chat_id,
+            "text": text,
+            "parse_mode": "Markdown"
+        }
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                delay = self.backoff_base * (2 ** attempt)
+                try:
+                    with self.latency.time():
+                        response = await self.client.post(url, json=payload)
+                    if response.status_code == 429:
+                        # Telegram rate limit: wait as long as it asks
+                        delay = max(delay, response.json().get("parameters", {}).get("retry_after", 1))
+                    response.raise_for_status()
+                    self.stats["sent"] += 1
+                    log.info(f"telegram notification sent: {response.status_code}")
+                    return True
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        self.stats["failed"] += 1
+                        log.error(f"Failed to send Telegram notification: {e}")
+                        return False
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(delay)
+
+    def close(self, timeout=None):
+        # Called by AlertManager.close() on the loop thread, which can't block
+        # here: the pending posts are awaited in aclose()
+        pass
+
+    async def aclose(self):
+        """Waits for the scheduled messages, then closes the HTTP client."""
+        while self._pending:
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in list(self._pending)))
+        await self.client.aclose()
+
+
+class AlertManager:
+    """
+    Per-device alert state with hysteresis, cooldown and optional digests.
+
+    - raise_threshold: smoothed probability that raises an alert (original 0.8)
+    - clear_threshold: probability below which a raised alert clears
+    - cooldown: min seconds between two notifications for the same device;
+      a sustained fault gets a reminder at most once per cooldown
+    - digest_window: if > 0, events are collected and sent as one summary
+      message every `digest_window` seconds instead of one message each
+    """
+
+    def __init__(self, notifier, raise_threshold=0.8, clear_threshold=0.6,
+                 cooldown=300.0, digest_window=0.0, clock=time.monotonic):
+        self.notifier = notifier
+        self.raise_threshold = raise_threshold
+        self.clear_threshold = clear_threshold
+        self.cooldown = cooldown
+        self.digest_window = digest_window
+        self.clock = clock
+        self.states = {}
+        self.last_notified = {}
+        # Devices whose raise was actually notified (only those get a "recovered")
+        self.alerted = set()
+        self._digest = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._digest_thread = None
+        if digest_window > 0:
+            self._digest_thread = threading.Thread(target=self._digest_loop, name="alert-digest", daemon=True)
+            self._digest_thread.start()
+
+    def state(self, device_id):
+        return self.states.get(device_id, NORMAL)
+
+    def update(self, device_id, probability, data):
+        """
+        Feeds a device's latest smoothed probability. Returns the new state.
+        Notifications are sent (or queued for the digest) as a side effect.
+        """
+        previous = self.state(device_id)
+        now = self.clock()
+
+        if previous in (NORMAL, CLEARED):
+            state = RAISED if probability > self.raise_threshold else NORMAL
+        elif probability < self.clear_threshold:
+            state = CLEARED
+        else:
+            state = SUSTAINED
+        self.states[device_id] = state
+
+        last = self.last_notified.get(device_id)
+        if state == RAISED:
+            # Re-raised shortly after clearing: don't spam
+            notify = last is None or now - last >= self.cooldown
+        elif state == SUSTAINED:
+            # Reminder for a fault that is still going on
+            notify = last is not None and now - last >= self.cooldown
+        else:
+            notify = state == CLEARED and device_id in self.alerted
+
+        if notify and state in (RAISED, SUSTAINED):
+            self.alerted.add(device_id)
+        elif state == CLEARED:
+            self.alerted.discard(device_id)
+
+        if notify:
+            self.last_notified[device_id] = now
+            self._emit({"device_id": device_id, "state": state, "probability": probability, "data": data,
+                        "time": time.time()})
+        return state
+
+    def export(self, device_id):
+        """
+        A device's alert state as plain data (handed to another process, see
+        cluster.py). Cooldowns travel as "seconds since the last notification"
+        because clocks aren't comparable between processes.
+        """
+        last = self.last_notified.get(device_id)
+        return {
+            "state": self.state(device_id),
+            "alerted": device_id in self.alerted,
+            "notified_ago": None if last is None else self.clock() - last,
+        }
+
+    def restore(self, device_id, state, merge=False):
+        """
+        Adopts an exported alert state. With `merge` (the device already has
+        readings here) the local state machine is kept and only the
+        notification history is combined, so nothing is notified twice.
+        """
+        notified_ago = state.get("notified_ago")
+        last = None if notified_ago is None else self.clock() - notified_ago
+        if merge:
+            if last is not None:
+                self.last_notified[device_id] = max(last, self.last_notified.get(device_id, last))
+            if state.get("alerted"):
+                self.alerted.add(device_id)
+            return
+        self.states[device_id] = state.get("state", NORMAL)
+        if last is not None:
+            self.last_notified[device_id] = last
+        if state.get("alerted"):
+            self.alerted.add(device_id)
+
+    def drop(self, device_id):
+        self.states.pop(device_id, None)
+        self.last_notified.pop(device_id, None)
+        self.alerted.discard(device_id)
+
+    def _emit(self, event):
+        if self.digest_window > 0:
+            with self._lock:
+                self._digest.append(event)
+        else:
+            self.notifier.send(format_alert(event))
+
+    def flush_digest(self):
+        with self._lock:
+            events, self._digest = self._digest, []
+        if not events:
+            return
+        if len(events) == 1:
+            self.notifier.send(format_alert(events[0]))
+        else:
+            self.notifier.send(format_digest(events))
+
+    def _digest_loop(self):
+        while not self._stopping.wait(self.digest_window):
+            self.flush_digest()
+
+    def close(self):
+        """Sends any pending digest and waits for queued Telegram messages."""
+        self._stopping.set()
+        self.flush_digest()
+        self.notifier.close()
@@ -0,0 +1,423 @@
+"""
+asyncio entry point for the subscriber, an alternative to mqtt_subscriber.py
+with the same configuration, processing and outputs.
+
+mqtt_subscriber.py runs paho's network loop on one thread and hands the
+work to a micro-batcher, a worker pool and a writer thread. Here a single
+event loop does everything: aiomqtt receives, `firestore.AsyncClient`
+writes and httpx posts Telegram alerts, so many readings can wait on I/O at
+the same time without a thread each. ASYNC_CONCURRENCY bounds the messages
+in flight (received but not yet written and published); at the limit the
+loop stops reading from the broker until one finishes.
+
+Per reading, as in the threaded subscriber: window features (features.py)
+-> micro-batched inference -> smoothing of the raw probability -> alert
+state (raise at ALERT_RAISE_THRESHOLD, 0.8) -> drift checks (drift.py) ->
+Firestore write and the result published to motor/<device_id>/alert ->
+rollups. Readings of one device are smoothed in the order they arrived.
+
+Run (from the cloud/ folder):
+    python async_subscriber.py
+
+SPOOL_PATH, CLUSTER_GROUP (cluster.py), MQTT model commands and the USR1
+profiler are only supported by mqtt_subscriber.py.
+"""
+
+import asyncio
+import json
+import logging
+import signal
+import time
+from datetime import datetime
+import payload_codec
+from alerts import AlertManager, AsyncTelegramNotifier
+from firestore_writer import AsyncFirestoreWriter, READINGS_COLLECTION, STORAGE_MODES
+from forest_engine import CompiledForest
+from model_manager import ModelManager
+from inference import AsyncMicroBatcher, InferenceCache
+from metrics import Registry, SAMPLED, setup_logging, start_metrics_server
+from rollups import RollupAggregator
+from smoothing import SmoothingState
+from features import FeatureState
+from drift import DriftMonitor
+
+# Configuration (environment / .env)
+from config import *  # noqa: F401,F403
+
+log = logging.getLogger("async_subscriber")
+
+
+class AsyncSubscriber:
+    """
+    The subscriber's processing on one event loop. Create it inside the
+    running loop; `run()` consumes the broker until `stop()`, `close()`
+    drains everything in flight.
+    """
+
+    def __init__(self, db, model, concurrency=ASYNC_CONCURRENCY):
+        self.db = db
+        self.client = None
+        self.concurrency = concurrency
+        self.writer = AsyncFirestoreWriter(db, max_in_flight=concurrency)
+        # Flushed by a periodic task on the loop (start()) instead of a thread
+        self.rollups = RollupAggregator(self.writer, ROLLUP_RESOLUTIONS, flush_interval=0)
+        self.smoothing = SmoothingState(SMOOTHING_METHOD, SMOOTHING_WINDOW, SMOOTHING_ALPHA)
+        self.features = FeatureState(FEATURE_WINDOW, FEATURE_MIN_SAMPLES)
+        self.cache = InferenceCache(INFERENCE_CACHE_RESOLUTION, INFERENCE_CACHE_SIZE) if INFERENCE_CACHE_SIZE > 0 else None
+        self.batcher = AsyncMicroBatcher(model, INFERENCE_BATCH_WINDOW_MS / 1000.0, INFERENCE_MAX_BATCH, self.cache)
+        self.drift = DriftMonitor(DRIFT_MARGIN, DRIFT_HORIZON, DRIFT_Z_THRESHOLD) if DRIFT_MONITOR else None
+        if self.drift:
+            self.drift.model = model
+        self.alerts = AlertManager(
+            AsyncTelegramNotifier(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_API_URL),
+            raise_threshold=ALERT_RAISE_THRESHOLD,
+            clear_threshold=ALERT_CLEAR_THRESHOLD,
+            cooldown=ALERT_COOLDOWN,
+            digest_window=ALERT_DIGEST_WINDOW,
+        )
+        self._slots = asyncio.Semaphore(concurrency)
+        self._in_flight = set()
+        self._stopping = asyncio.Event()
+        self._background = []
+
+        self.metrics = Registry()
+        self.messages_total = self.metrics.counter("mqtt_messages_total", "Sensor readings received")
+        self.messages_rate = self.metrics.meter("mqtt_messages_per_second", "Sensor readings received per second (10 s window)")
+        self.decode_errors = self.metrics.counter("mqtt_decode_errors_total", "Messages that could not be decoded")
+        self.binary_frames = self.metrics.counter("mqtt_binary_frames_total", "Messages received in the binary payload format")
+        self.stage_latency = {
+            "decode": self.metrics.histogram("decode_seconds", "Payload decode time per message (JSON or binary)"),
+            "inference": self.metrics.histogram("inference_seconds", "Time from queueing a reading to its score"),
+            "total": self.metrics.histogram("message_seconds", "Time from receiving a message to its readings being written and published"),
+        }
+        self.metrics.register(self.batcher.batch_latency)
+        self.metrics.register(self.writer.commit_latency)
+        self.metrics.register(self.alerts.notifier.latency)
+        self.metrics.gauge("messages_in_flight", lambda: len(self._in_flight), "Messages being processed")
+        self.metrics.gauge("inference_queue_depth", lambda: self.batcher.queue.qsize(), "Readings waiting to be scored")
+        self.metrics.counter_fn("unscored_readings_total", lambda: self.batcher.stats["unscored"],
+                                "Readings stored without a prediction because the model failed on them")
+        if self.cache:
+            self.metrics.counter_fn("inference_cache_hits_total", lambda: self.cache.stats["hits"], "Readings scored from the cache")
+            self.metrics.counter_fn("inference_cache_misses_total", lambda: self.cache.stats["misses"], "Readings that needed the model")
+            self.metrics.gauge("inference_cache_size", lambda: len(self.cache.entries), "Quantized readings cached")
+        if self.drift:
+            self.metrics.counter_fn("ood_readings_total", lambda: self.drift.stats["ood"],
+                                    "Readings with a model input outside its training range")
+            self.metrics.counter_fn("anomalous_readings_total", lambda: self.drift.stats["anomalous"],
+                                    "Readings far outside their device's running distribution")
+            self.metrics.gauge("ood_rate", lambda: self.drift.summary()["ood_rate"],
+                               "Share of recent readings out of distribution")
+            self.metrics.gauge("prediction_mean_recent", lambda: self.drift.summary()["prediction_mean_recent"],
+                               "Mean raw failure probability of the recent readings")
+            self.metrics.gauge("prediction_drift", lambda: self.drift.summary()["prediction_drift"],
+                               "Recent minus long-run mean raw failure probability")
+
+    async def start(self):
+        """Seeds the rolling windows and starts the background tasks."""
+        try:
+            seeded = await self.smoothing.seed_from_firestore_async(
+                self.db, READINGS_COLLECTION if STORAGE_MODE == "combined" else "predictions")
+            log.info(f"✅ Rolling windows seeded for {seeded} device(s)")
+        except Exception as e:
+            log.warning(f"⚠️ Could not seed rolling window from Firestore: {e}")
+        self.batcher.start()
+        loop = asyncio.get_running_loop()
+        if self.rollups.resolutions and ROLLUP_FLUSH_INTERVAL > 0:
+            self._background.append(loop.create_task(self._every(ROLLUP_FLUSH_INTERVAL, self.rollups.flush)))
+        if STATS_INTERVAL > 0:
+            self._background.append(loop.create_task(self._every(
+                STATS_INTERVAL, lambda: log.info(f"📈 Pipeline stats: {json.dumps(self.stats())}"))))
+
+    async def _every(self, interval, fn):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                fn()
+            except Exception as e:
+                log.error(f"❌ Periodic task failed: {e}")
+
+    # ---------- Processing ----------
+    def decode(self, topic, payload):
+        """The reading dicts in one MQTT message (JSON or binary frame)."""
+        if payload_codec.is_binary(payload):
+            device_id, rows = payload_codec.decode_rows(payload)
+            device_id = device_id or payload_codec.device_id_from_topic(topic, MQTT_TOPIC)
+            self.binary_frames.inc()
+            received_ts = int(time.time())
+            readings = []
+            for row in rows:
+                data = payload_codec.to_dict(device_id, row)
+                if not data['timestamp']:
+                    data['timestamp'] = received_ts
+                readings.append(data)
+            return readings
+
+        data = json.loads(payload.decode())
+        # Ensure timestamp exists or use current
+        if 'timestamp' not in data:
+            data['timestamp'] = int(time.time())
+        # Device id from the payload if the device sends one, otherwise from the topic
+        data['device_id'] = str(data.get('device_id') or payload_codec.device_id_from_topic(topic, MQTT_TOPIC))
+        return [data]
+
+    async def handle_message(self, topic, payload):
+        received_at = time.monotonic()
+        try:
+            readings = self.decode(topic, payload)
+        except (json.JSONDecodeError, UnicodeDecodeError, payload_codec.PayloadError) as e:
+            self.decode_errors.inc()
+            log.warning(f"⚠️ Received undecodable message on {topic}: {e}")
+            return
+        except Exception as e:
+            log.error(f"❌ Error processing message: {e}")
+            return
+        self.stage_latency["decode"].observe(time.monotonic() - received_at)
+        self.messages_total.inc(len(readings))
+        self.messages_rate.mark(len(readings))
+
+        if len(readings) == 1:
+            await self.process_sensor_data(readings[0])
+        else:
+            # A batch frame: rows are submitted for scoring in frame order
+            await asyncio.gather(*(self.process_sensor_data(data) for data in readings))
+        self.stage_latency["total"].observe(time.monotonic() - received_at)
+
+    async def process_sensor_data(self, data):
+        """
+        Processes one reading:
+        1. Failure prediction (micro-batched with other in-flight readings)
+        2. Smoothing
+        3. Alert state (Telegram is sent in the background)
+        4. Firestore write and MQTT result publish, awaited together
+        """
+        try:
+            timestamp = data['timestamp'] if isinstance(data['timestamp'], (int, float)) else time.time()
+            features = self.features.row(data['device_id'], timestamp,
+                                         data['temperature'], data['vibration'], data['rpm'])
+            submitted_at = time.monotonic()
+            raw_prob = await self.batcher.predict(features)
+            self.stage_latency["inference"].observe(time.monotonic() - submitted_at)
+            if raw_prob is None:
+                await self.record_unscored(data)
+                return
+
+            # No await between scoring and smoothing: a device's readings are
+            # smoothed in submission order
+            device_id = data['device_id']
+            mean_prob = self.smoothing.update(device_id, raw_prob)
+            self.alerts.update(device_id, mean_prob, data)
+            checks = self.drift.update(device_id, features, raw_prob) if self.drift else {}
+
+            if STORAGE_MODE == "combined":
+                write = self.writer.write_combined_reading({
+                    "device_id": device_id,
+                    "temperature": data['temperature'],
+                    "vibration": data['vibration'],
+                    "rpm": data['rpm'],
+                    "failure_probability": float(mean_prob),
+                    "raw_failure_probability": float(raw_prob),
+                    "timestamp": datetime.utcnow(),
+                    **checks,
+                })
+            else:
+                write = self.writer.write_reading(
+                    {
+                        "device_id": device_id,
+                        "temperature": data['temperature'],
+                        "vibration": data['vibration'],
+                        "rpm": data['rpm'],
+                        "timestamp": datetime.utcnow()
+                    },
+                    {
+                        "device_id": device_id,
+                        "failure_probability": float(mean_prob),
+                        "raw_failure_probability": float(raw_prob),
+                        "timestamp": datetime.utcnow(),
+                        **checks,
+                    }
+                )
+
+            alert_payload = {
+                "device_id": device_id,
+                "probability": float(mean_prob)
+            }
+            # Echo the load generator's correlation fields (test_mqtt_publisher.py)
+            if 'seq' in data:
+                alert_payload["seq"] = data['seq']
+            alert_topic = MQTT_ALERT_TOPIC.format(device_id=device_id)
+            await asyncio.gather(write, self.client.publish(alert_topic, json.dumps(alert_payload)))
+
+            if self.rollups.resolutions:
+                self.rollups.add(device_id, time.time(), {
+                    "temperature": data['temperature'],
+                    "vibration": data['vibration'],
+                    "rpm": data['rpm'],
+                    "failure_probability": float(mean_prob),
+                })
+
+            log.info(
+                "✅ Data Processed [%s]: Temp=%s Vib=%s RPM=%s -> Risk=%.1f%%",
+                device_id, data['temperature'], data['vibration'], data['rpm'], mean_prob * 100,
+                extra=dict(SAMPLED, fields={"device_id": device_id, "raw_prob": raw_prob, "prob": mean_prob}),
+            )
+        except Exception as e:
+            log.error(f"❌ Error processing data: {e}")
+
+    async def record_unscored(self, data):
+        """
+        Stores a reading the model failed on without a prediction: no
+        smoothing, alert or MQTT result, but the raw values are kept (and
+        rolled up).
+        """
+        device_id = data['device_id']
+        reading = {
+            "device_id": device_id,
+            "temperature": data['temperature'],
+            "vibration": data['vibration'],
+            "rpm": data['rpm'],
+            "timestamp": datetime.utcnow(),
+        }
+        if STORAGE_MODE == "combined":
+            await self.writer.write_combined_reading(dict(reading, unscored=True))
+        else:
+            await self.writer.commit([(self.db.collection("sensor_data").document(), reading)])
+        if self.rollups.resolutions:
+            self.rollups.add(device_id, time.time(), {
+                "temperature": data['temperature'],
+                "vibration": data['vibration'],
+                "rpm": data['rpm'],
+            })
+        log.warning(f"⚠️ Reading from {device_id} stored without a prediction (inference failed)")
+
+    async def dispatch(self, topic, payload):
+        """
+        Starts processing a message once a concurrency slot is free (this
+        is the backpressure on the broker connection).
+        """
+        await self._slots.acquire()
+        task = asyncio.get_running_loop().create_task(self.handle_message(topic, payload))
+        self._in_flight.add(task)
+
+        def done(task):
+            self._in_flight.discard(task)
+            self._slots.release()
+        task.add_done_callback(done)
+
+    async def drain(self):
+        """Waits for every message in flight."""
+        while self._in_flight:
+            await asyncio.gather(*self._in_flight)
+
+    # ---------- Broker connection ----------
+    async def _read(self, client):
+        async for message in client.messages:
+            await self.dispatch(message.topic.value, message.payload)
+
+    async def run(self):
+        """Consumes MQTT_TOPIC until stop(), reconnecting after connection errors."""
+        import aiomqtt
+
+        while not self._stopping.is_set():
+            log.info(f"🚀 Connecting to broker: {MQTT_BROKER}:{MQTT_PORT}...")
+            try:
+                async with aiomqtt.Client(MQTT_BROKER, MQTT_PORT, keepalive=60) as client:
+                    self.client = client
+                    await client.subscribe(MQTT_TOPIC)
+                    log.info(f"📡 Connected to MQTT Broker, subscribed to {MQTT_TOPIC}")
+                    reader = asyncio.create_task(self._read(client))
+                    stopping = asyncio.create_task(self._stopping.wait())
+                    await asyncio.wait({reader, stopping}, return_when=asyncio.FIRST_COMPLETED)
+                    reader.cancel()
+                    stopping.cancel()
+                    await asyncio.wait({reader, stopping})
+                    # Publish the results of what was received before disconnecting
+                    await self.drain()
+                    if not reader.cancelled() and reader.exception():
+                        raise reader.exception()
+            except aiomqtt.MqttError as e:
+                if self._stopping.is_set():
+                    break
+                log.error(f"❌ Connection Failed: {e}, retrying in {MQTT_RECONNECT_DELAY:.0f}s")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), MQTT_RECONNECT_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop(self):
+        """SIGTERM / Ctrl+C: stop receiving, run() then drains what is in flight."""
+        log.info("🛑 Stop requested, draining in-flight messages...")
+        self._stopping.set()
+
+    async def close(self):
+        """Drains stage by stage so nothing in flight is lost."""
+        log.info("💾 Flushing pending predictions and Firestore writes...")
+        await self.drain()
+        await self.batcher.close()
+        for task in self._background:
+            task.cancel()
+        self.rollups.close()
+        await self.writer.flush()
+        self.alerts.close()
+        await self.alerts.notifier.aclose()
+
+    def stats(self):
+        """In-flight counts and per-stage latencies."""
+        return {
+            "messages_in_flight": len(self._in_flight),
+            "inference_queue_depth": self.batcher.queue.qsize(),
+            "inference_cache": dict(self.cache.stats, size=len(self.cache.entries)) if self.cache else None,
+            "firestore_commits_scheduled": self.writer.depth(),
+            "firestore": self.writer.stats,
+            "latency": {stage: stat.snapshot() for stage, stat in self.stage_latency.items()},
+            "drift": self.drift.summary() if self.drift else None,
+        }
+
+
+def make_db():
+    if FIRESTORE_BACKEND == "fake":
+        from fake_firestore import FakeAsyncFirestoreClient
+        return FakeAsyncFirestoreClient()
+    from google.cloud import firestore
+    return firestore.AsyncClient()
+
+
+async def main():
+    try:
+        # Hot reload by watching the registry; MQTT model commands are mqtt_subscriber.py only
+        models = ModelManager(MODEL_PATH, MODEL_FALLBACK_PATH, mode=MODEL_RELOAD,
+                              watch_interval=MODEL_WATCH_INTERVAL, threshold=ALERT_RAISE_THRESHOLD)
+        model = models.model
+        if isinstance(model, CompiledForest):
+            log.info(f"✅ Compiled Random Forest {models.version} Loaded ({len(model.roots)} trees)")
+        else:
+            log.info("✅ Random Forest Model Loaded (scikit-learn)")
+    except Exception as e:
+        log.critical(f"❌ Error loading model: {e}")
+        return 1
+
+    subscriber = AsyncSubscriber(make_db(), model)
+    models.start([subscriber.batcher, subscriber.drift] if subscriber.drift else [subscriber.batcher])
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, subscriber.stop)
+
+    await subscriber.start()
+    if METRICS_PORT:
+        start_metrics_server(subscriber.metrics, METRICS_PORT)
+        log.info(f"📊 Metrics on http://0.0.0.0:{METRICS_PORT}/metrics")
+    try:
+        await subscriber.run()
+    finally:
+        models.close()
+        await subscriber.close()
+        log.info(f"✅ Shutdown complete: {json.dumps(subscriber.stats())}")
+    return 0
+
+
+if __name__ == "__main__":
+    setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
+    if STORAGE_MODE not in STORAGE_MODES:
+        log.critical(f"❌ Unknown STORAGE_MODE {STORAGE_MODE!r} (expected one of {', '.join(STORAGE_MODES)})")
+        exit(1)
+    exit(asyncio.run(main()))
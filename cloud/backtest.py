@@ -0,0 +1,510 @@
+"""
+Backtests smoothing and alert policies by replaying sensor history.
+
+Readings go through the subscriber's steps, vectorized and without MQTT
+or Firestore: window features (features.input_rows, the same DeviceWindow
+code), the served model (inference.predict, one call per chunk),
+per-device smoothing and the AlertManager's hysteresis and cooldown rules.
+The model runs once; every smoothing / alert parameter set of the grid is
+then replayed over the same raw probabilities, in parallel across a
+process pool. Reported per parameter set:
+
+- alerts: alerts raised; notifications: Telegram messages including
+  reminders and "recovered" messages
+- detected / missed: failing devices alerted between onset and failure
+- lead_time_s: seconds from a device's first such alert to its failure
+- false_alarms: alerts on healthy devices or before a failing device's
+  onset; false_alarm_rate is their share of all alerts,
+  false_alarms_per_day the count per healthy device-day
+
+History comes from:
+- generated: simulated motors, some drifting from their operating point
+  to a fault scenario between an onset and their failure, plus single
+  glitch readings; the truth is known
+- csv: a CSV export (dashboard, GET /api/export.csv) or any CSV with
+  device_id,timestamp,temperature,vibration,rpm columns
+- firestore: sensor_data (readings in combined mode)
+
+Stored history has no ground truth unless --labels names a CSV of
+device_id,failure[,onset] rows (ISO 8601 or epoch seconds). Without an
+onset, alerts up to --horizon seconds before the failure count.
+
+Usage (from the cloud/ folder):
+    python backtest.py generated --devices 500 --length 720
+    python backtest.py generated --methods mean ewma --windows 3 5 10 --raise-thresholds 0.7 0.8 0.9
+    python backtest.py csv motor_health_health.csv --labels failures.csv
+    python backtest.py firestore --since 2026-10-01 --device health
+    python backtest.py generated --check    # the vectorized replay vs SmoothingState + AlertManager
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+from alerts import AlertManager, CLEARED, NORMAL, RAISED, SUSTAINED
+from config import (ALERT_CLEAR_THRESHOLD, ALERT_COOLDOWN, ALERT_RAISE_THRESHOLD, FEATURE_MIN_SAMPLES,
+                    FEATURE_WINDOW, MODEL_FALLBACK_PATH, MODEL_PATH, SMOOTHING_ALPHA, SMOOTHING_METHOD,
+                    SMOOTHING_WINDOW)
+from features import BASE_FEATURES, input_rows
+from firestore_writer import READINGS_COLLECTION
+from inference import predict
+from model_store import load_model, model_version
+from rollups import to_epoch
+from smoothing import DEFAULT_DEVICE_ID, SmoothingState
+
+log = logging.getLogger("backtest")
+
+FAULTS = ["HIGH TEMP", "HIGH VIB", "STALL"]
+
+# Column names of a generic CSV, then of the CSV export
+CSV_COLUMNS = {
+    "device_id": ("device_id", "Device"),
+    "timestamp": ("timestamp", "Timestamp"),
+    "temperature": ("temperature", "Temperature (C)"),
+    "vibration": ("vibration", "Vibration (m/s2)"),
+    "rpm": ("rpm", "RPM"),
+}
+
+
+class History:
+    """
+    Readings sorted by device, then time, and optionally the onset and
+    failure time of each failing device (NaN for healthy ones).
+    """
+
+    def __init__(self, device_ids, timestamps, X):
+        names, device = np.unique(np.asarray(device_ids, dtype=str), return_inverse=True)
+        timestamps = np.asarray(timestamps, dtype=float)
+        order = np.lexsort((timestamps, device))
+        self.names = names.tolist()
+        self.device = device[order]
+        self.timestamps = timestamps[order]
+        self.X = np.asarray(X, dtype=float).reshape(-1, len(BASE_FEATURES))[order]
+        self.starts = np.flatnonzero(np.r_[True, self.device[1:] != self.device[:-1]]) if len(order) else np.array([], int)
+        self.ends = np.r_[self.starts[1:], len(order)].astype(int)
+        # Index of every reading within its device's readings
+        self.position = np.arange(len(order)) - np.repeat(self.starts, self.ends - self.starts)
+        self.onsets = self.failures = None
+
+    def __len__(self):
+        return len(self.device)
+
+    def set_truth(self, labels, horizon=86400.0):
+        """`labels`: device id -> (onset or None, failure time). Unknown devices are ignored."""
+        self.onsets = np.full(len(self.names), np.nan)
+        self.failures = np.full(len(self.names), np.nan)
+        index = {name: i for i, name in enumerate(self.names)}
+        for device_id, (onset, failure) in labels.items():
+            if device_id in index:
+                self.failures[index[device_id]] = failure
+                self.onsets[index[device_id]] = failure - horizon if onset is None else onset
+
+
+def to_seconds(value):
+    """Epoch seconds of an ISO 8601 string (UTC if naive), an epoch number or a datetime."""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            value = datetime.fromisoformat(value)
+    return to_epoch(value)
+
+
+# ---------- History sources ----------
+def generate_history(devices=200, length=720, interval=2.0, failing=0.2, glitch_rate=0.002, seed=0):
+    """
+    Simulated motors, `length` readings every `interval` seconds. Healthy
+    ones hold a NORMAL operating point; failing ones drift linearly from it
+    to a fault scenario's reading between a random onset and their failure
+    (the last reading). Any reading is a glitch with `glitch_rate`: one
+    random fault reading, what smoothing is there to filter out.
+    """
+    from test_mqtt_publisher import STEADY_NOISE, generate_reading
+
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    as_row = lambda reading: [reading[name] for name in BASE_FEATURES]
+    base = np.array([as_row(generate_reading("NORMAL")) for _ in range(devices)], dtype=float)
+    target = np.array([as_row(generate_reading(random.choice(FAULTS))) for _ in range(devices)], dtype=float)
+    is_failing = rng.random(devices) < failing
+
+    t = np.arange(length) * interval
+    duration = t[-1]
+    onset = np.where(is_failing, rng.uniform(0.3, 0.8, devices) * duration, np.nan)
+    progress = np.nan_to_num(np.clip((t - onset[:, None]) / (duration - onset[:, None]), 0, 1))
+    noise = np.array([STEADY_NOISE[name] for name in BASE_FEATURES])
+    X = base[:, None] + progress[..., None] * (target - base)[:, None] + rng.standard_normal((devices, length, 3)) * noise
+    glitches = rng.random((devices, length)) < glitch_rate
+    if glitches.any():
+        X[glitches] = [as_row(generate_reading(random.choice(FAULTS))) for _ in range(int(glitches.sum()))]
+
+    names = [f"motor-{i:04d}" for i in range(devices)]
+    history = History(np.repeat(names, length), np.tile(t, devices), np.maximum(X, 0).reshape(-1, 3))
+    history.set_truth({name: (onset[i], duration) for i, name in enumerate(names) if is_failing[i]})
+    return history
+
+
+def load_csv(path, device_id=DEFAULT_DEVICE_ID):
+    """History from a CSV export; rows with a missing value are skipped."""
+    devices, timestamps, rows = [], [], []
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        columns = {}
+        for field, candidates in CSV_COLUMNS.items():
+            columns[field] = next((name for name in candidates if name in (reader.fieldnames or ())), None)
+            if columns[field] is None and field != "device_id":
+                raise ValueError(f"{path}: no {' or '.join(candidates)} column")
+        for row in reader:
+            values = [row[columns[name]] for name in BASE_FEATURES]
+            if "" in values or not row[columns["timestamp"]]:
+                continue
+            devices.append(row[columns["device_id"]] if columns["device_id"] else device_id)
+            timestamps.append(to_seconds(row[columns["timestamp"]]))
+            rows.append(values)
+    return History(devices, timestamps, np.array(rows, dtype=float))
+
+
+def load_firestore(db, storage_mode="split", since=None, device_id=None):
+    """History from the stored raw readings (sensor_data, or readings in combined mode)."""
+    query = db.collection(READINGS_COLLECTION if storage_mode == "combined" else "sensor_data")
+    if since is not None:
+        query = query.where("timestamp", ">=", since)
+    if device_id is not None:
+        query = query.where("device_id", "==", device_id)
+    devices, timestamps, rows = [], [], []
+    for snapshot in query.stream():
+        doc = snapshot.to_dict()
+        if doc.get("timestamp") is None or any(doc.get(name) is None for name in BASE_FEATURES):
+            continue
+        devices.append(doc.get("device_id") or DEFAULT_DEVICE_ID)
+        timestamps.append(to_epoch(doc["timestamp"]))
+        rows.append([doc[name] for name in BASE_FEATURES])
+    return History(devices, timestamps, np.array(rows, dtype=float))
+
+
+def load_labels(path):
+    """device_id,failure[,onset] rows -> {device_id: (onset or None, failure)}."""
+    labels = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            onset = row.get("onset")
+            labels[row["device_id"]] = (to_seconds(onset) if onset else None, to_seconds(row["failure"]))
+    return labels
+
+
+# ---------- Replay ----------
+def score(model, history, window=FEATURE_WINDOW, min_samples=FEATURE_MIN_SAMPLES, chunk_size=256):
+    """
+    Raw failure probabilities of every reading, as the subscriber computes
+    them. The compiled forest is fastest on batches that stay in cache.
+    """
+    X = input_rows(history.device, history.timestamps, history.X, window, min_samples)
+    return np.concatenate([predict(model, X[i:i + chunk_size]) for i in range(0, len(X), chunk_size)])
+
+
+def smooth(raw, history, method="mean", window=5, alpha=0.4, chunk_size=100_000):
+    """SmoothingState.update over every device's raw probabilities, vectorized."""
+    rows = np.arange(len(raw))
+    if method == "mean":
+        sums = np.r_[0.0, np.cumsum(raw)]
+        first = rows - np.minimum(history.position, window - 1)
+        return (sums[rows + 1] - sums[first]) / (rows + 1 - first)
+    if method == "median":
+        # Each row's window as a (rows, window) block, NaN before the device's first reading
+        out = np.empty(len(raw))
+        offsets = np.arange(window)
+        for lo in range(0, len(raw), chunk_size):
+            i = rows[lo:lo + chunk_size, None]
+            block = np.where(offsets <= history.position[i], raw[np.maximum(i - offsets, 0)], np.nan)
+            out[lo:lo + chunk_size] = np.nanmedian(block, axis=1)
+        return out
+    if method == "ewma":
+        from scipy.signal import lfilter
+
+        # y[0] = x[0], then y[k] = alpha * x[k] + (1 - alpha) * y[k-1]
+        out = np.empty(len(raw))
+        for start, end in zip(history.starts.tolist(), history.ends.tolist()):
+            x = raw[start:end]
+            out[start:end] = lfilter([alpha], [1.0, alpha - 1.0], x, zi=[(1 - alpha) * x[0]])[0]
+        return out
+    raise ValueError(f"Unknown smoothing method: {method}")
+
+
+def alert_states(prob, history, raise_threshold, clear_threshold):
+    """
+    AlertManager's hysteresis, vectorized: (active, raised, cleared) per
+    reading. A reading above the raise threshold activates, one below the
+    clear threshold deactivates, anything in between keeps the device's
+    previous state, so the state is the last such event carried forward.
+    """
+    n = len(prob)
+    event = np.full(n, -1, dtype=np.int8)
+    event[prob < clear_threshold] = 0
+    event[prob > raise_threshold] = 1
+    # Devices start normal: only a raise activates them
+    event[history.starts] = prob[history.starts] > raise_threshold
+    last_event = np.maximum.accumulate(np.where(event >= 0, np.arange(n), 0))
+    active = event[last_event] == 1
+    previous = np.r_[False, active[:-1]]
+    previous[history.starts] = False
+    return active, active & ~previous, previous & ~active
+
+
+def count_notifications(history, active, cleared, raised, cooldown):
+    """Messages AlertManager would send (raises outside the cooldown, reminders, recoveries)."""
+    sent, last_notified, alerted = 0, {}, set()
+    # Only alerted readings and clears can notify: a few rows, replayed in order
+    for i in np.flatnonzero(active | cleared).tolist():
+        device, now = int(history.device[i]), float(history.timestamps[i])
+        last = last_notified.get(device)
+        if raised[i]:
+            notify = last is None or now - last >= cooldown
+        elif active[i]:
+            notify = last is not None and now - last >= cooldown
+        else:
+            notify = device in alerted
+        if notify and active[i]:
+            alerted.add(device)
+        elif cleared[i]:
+            alerted.discard(device)
+        if notify:
+            last_notified[device] = now
+            sent += 1
+    return sent
+
+
+def evaluate(history, prob, raise_threshold, clear_threshold, cooldown):
+    """Alert counts and, with ground truth, detection, lead time and false alarms of one policy."""
+    active, raised, cleared = alert_states(prob, history, raise_threshold, clear_threshold)
+    alert_rows = np.flatnonzero(raised)
+    result = {
+        "alerts": len(alert_rows),
+        "notifications": count_notifications(history, active, cleared, raised, cooldown),
+        "devices_alerted": len(np.unique(history.device[alert_rows])),
+        "alert_share": round(float(active.mean()), 4) if len(prob) else 0.0,
+    }
+    if history.failures is None:
+        return result
+
+    device, t = history.device[alert_rows], history.timestamps[alert_rows]
+    onset, failure = history.onsets[device], history.failures[device]
+    # NaN onsets (healthy devices) compare False: every alert there is false
+    early = ~(t >= onset)
+    in_time = ~early & (t <= failure)
+    # Rows are sorted by device, then time: the first hit per device is its earliest
+    detected, first = np.unique(device[in_time], return_index=True)
+    lead = history.failures[detected] - t[in_time][first]
+
+    present = np.zeros(len(history.names), dtype=bool)
+    present[history.device] = True
+    failing = present & ~np.isnan(history.failures)
+    first_ts, last_ts = history.timestamps[history.starts], history.timestamps[history.ends - 1]
+    healthy_until = np.fmin(history.onsets[history.device[history.starts]], last_ts)
+    healthy_days = float(np.clip(healthy_until - first_ts, 0, None).sum()) / 86400
+    false_alarms = int(early.sum())
+    result.update({
+        "failing_devices": int(failing.sum()),
+        "detected": len(detected),
+        "missed": int(failing.sum()) - len(detected),
+        "detection_rate": round(len(detected) / failing.sum(), 4) if failing.any() else None,
+        "lead_time_s": {
+            "mean": round(float(lead.mean()), 1),
+            "p50": round(float(np.median(lead)), 1),
+            "min": round(float(lead.min()), 1),
+        } if len(lead) else None,
+        "false_alarms": false_alarms,
+        "false_alarm_rate": round(false_alarms / len(alert_rows), 4) if len(alert_rows) else 0.0,
+        "false_alarms_per_day": round(false_alarms / healthy_days, 3) if healthy_days else None,
+    })
+    return result
+
+
+def reference(history, raw, method, window, alpha, raise_threshold, clear_threshold, cooldown):
+    """
+    The same replay through SmoothingState and AlertManager, one reading at
+    a time, with the readings' timestamps as the alert clock. Returns
+    (smoothed probabilities, states, notifications sent).
+    """
+    class CountingNotifier:
+        sent = 0
+
+        def send(self, text):
+            self.sent += 1
+
+    now = [0.0]
+    notifier = CountingNotifier()
+    smoothing = SmoothingState(method, window, alpha)
+    alerts = AlertManager(notifier, raise_threshold=raise_threshold, clear_threshold=clear_threshold,
+                          cooldown=cooldown, clock=lambda: now[0])
+    probs, states = np.empty(len(raw)), []
+    for i, (device, timestamp, values, raw_prob) in enumerate(zip(history.device.tolist(), history.timestamps.tolist(),
+                                                                  history.X.tolist(), raw.tolist())):
+        now[0] = timestamp
+        probs[i] = smoothing.update(device, raw_prob)
+        states.append(alerts.update(device, probs[i], dict(zip(BASE_FEATURES, values), timestamp=timestamp)))
+    return probs, states, notifier.sent
+
+
+def check(history, raw, smoothing, raise_threshold, clear_threshold, cooldown):
+    """Compares the vectorized replay of one policy with reference()."""
+    smooth(raw, history, **smoothing)  # warm up (lazy imports)
+    start = time.perf_counter()
+    prob = smooth(raw, history, **smoothing)
+    active, raised, cleared = alert_states(prob, history, raise_threshold, clear_threshold)
+    sent = count_notifications(history, active, cleared, raised, cooldown)
+    vectorized = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ref_probs, ref_states, ref_sent = reference(history, raw, smoothing["method"], smoothing.get("window", 5),
+                                                smoothing.get("alpha", 0.4), raise_threshold, clear_threshold, cooldown)
+    sequential = time.perf_counter() - start
+    states = np.where(raised, RAISED, np.where(active, SUSTAINED, np.where(cleared, CLEARED, NORMAL)))
+    return dict(smoothing, **{
+        "smoothing_max_diff": float(np.abs(prob - ref_probs).max()),
+        "state_mismatches": int(np.count_nonzero(states != np.array(ref_states))),
+        "notifications": [sent, ref_sent],
+        "speedup": round(sequential / vectorized, 1),
+    })
+
+
+# ---------- Parameter grid ----------
+def policy_grid(methods, windows, alphas, raise_thresholds, clear_thresholds, cooldowns):
+    """(smoothing parameter sets, alert parameter sets); clear thresholds above the raise one are skipped."""
+    smoothings = []
+    for method in methods:
+        if method == "ewma":
+            smoothings += [{"method": method, "alpha": alpha} for alpha in alphas]
+        else:
+            smoothings += [{"method": method, "window": window} for window in windows]
+    policies = [(r, c, cooldown) for r, c, cooldown in itertools.product(raise_thresholds, clear_thresholds, cooldowns)
+                if c <= r]
+    return smoothings, policies
+
+
+_replay = {}
+
+
+def _init_worker(history, raw):
+    _replay["history"] = history
+    _replay["raw"] = raw
+
+
+def _run(smoothing, policies):
+    history, raw = _replay["history"], _replay["raw"]
+    prob = smooth(raw, history, **smoothing)
+    return [dict(smoothing, raise_threshold=r, clear_threshold=c, cooldown=cooldown,
+                 **evaluate(history, prob, r, c, cooldown))
+            for r, c, cooldown in policies]
+
+
+def run_grid(history, raw, smoothings, policies, workers=None):
+    """Every smoothing x alert policy over the raw probabilities, in grid order."""
+    workers = workers or os.cpu_count() or 1
+    # Enough tasks to keep every worker busy; a task smooths once for its policies
+    parts = max(1, min(len(policies), math.ceil(2 * workers / max(1, len(smoothings)))))
+    step = math.ceil(len(policies) / parts)
+    tasks = [(smoothing, policies[i:i + step]) for smoothing in smoothings for i in range(0, len(policies), step)]
+    if workers == 1:
+        _init_worker(history, raw)
+        return [result for task in tasks for result in _run(*task)]
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(history, raw)) as pool:
+        futures = [pool.submit(_run, *task) for task in tasks]
+        return [result for future in futures for result in future.result()]
+
+
+def parse_args():
+    grid = argparse.ArgumentParser(add_help=False)
+    grid.add_argument("--methods", nargs="+", choices=["mean", "median", "ewma"], default=[SMOOTHING_METHOD])
+    grid.add_argument("--windows", type=int, nargs="+", default=[SMOOTHING_WINDOW], help="mean/median window sizes")
+    grid.add_argument("--alphas", type=float, nargs="+", default=[SMOOTHING_ALPHA], help="ewma alphas")
+    grid.add_argument("--raise-thresholds", type=float, nargs="+", default=[ALERT_RAISE_THRESHOLD])
+    grid.add_argument("--clear-thresholds", type=float, nargs="+", default=[ALERT_CLEAR_THRESHOLD])
+    grid.add_argument("--cooldowns", type=float, nargs="+", default=[ALERT_COOLDOWN], help="seconds")
+    grid.add_argument("--workers", type=int, default=None, help="processes for the grid (default: CPU count)")
+    grid.add_argument("--model", default=MODEL_PATH, help="registry, artifact, .npz or .pkl (default: served model)")
+    grid.add_argument("--model-version", help="registry version instead of CURRENT")
+    grid.add_argument("--labels", help="CSV of device_id,failure[,onset] for stored history")
+    grid.add_argument("--horizon", type=float, default=86400.0,
+                      help="seconds before a labelled failure that count as its onset if none is given")
+    grid.add_argument("--check", action="store_true",
+                      help="compare the vectorized replay with SmoothingState + AlertManager")
+    grid.add_argument("--json-out", help="write the results JSON to this file")
+
+    parser = argparse.ArgumentParser(description="Backtest smoothing and alert policies")
+    sub = parser.add_subparsers(dest="source", required=True)
+    gen = sub.add_parser("generated", parents=[grid], help="simulated motors with known failures")
+    gen.add_argument("--devices", type=int, default=200)
+    gen.add_argument("--length", type=int, default=720, help="readings per device")
+    gen.add_argument("--interval", type=float, default=2.0, help="seconds between readings")
+    gen.add_argument("--failing", type=float, default=0.2, help="share of devices that fail")
+    gen.add_argument("--glitch-rate", type=float, default=0.002, help="share of single fault readings")
+    gen.add_argument("--seed", type=int, default=0)
+    from_csv = sub.add_parser("csv", parents=[grid], help="a CSV export")
+    from_csv.add_argument("path")
+    from_csv.add_argument("--device", default=DEFAULT_DEVICE_ID, help="device id of rows without one")
+    fs = sub.add_parser("firestore", parents=[grid], help="the stored raw readings")
+    fs.add_argument("--since", help="only readings at or after this ISO date/time (UTC)")
+    fs.add_argument("--device", help="only this device id")
+    fs.add_argument("--storage-mode", choices=["split", "combined"], default=os.getenv("STORAGE_MODE", "split"))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from metrics import setup_logging
+
+    args = parse_args()
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+
+    if args.source == "generated":
+        history = generate_history(args.devices, args.length, args.interval, args.failing, args.glitch_rate, args.seed)
+    elif args.source == "csv":
+        history = load_csv(args.path, args.device)
+    else:
+        if os.getenv("FIRESTORE_BACKEND", "firestore") == "fake":
+            from fake_firestore import FakeFirestoreClient
+            db = FakeFirestoreClient()
+        else:
+            from google.cloud import firestore
+            db = firestore.Client()
+        since = None
+        if args.since:
+            since = datetime.fromisoformat(args.since)
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+        history = load_firestore(db, args.storage_mode, since, args.device)
+    if args.labels:
+        history.set_truth(load_labels(args.labels), args.horizon)
+    if not len(history):
+        raise SystemExit("❌ No readings to replay")
+
+    model = load_model(args.model, MODEL_FALLBACK_PATH, args.model_version)
+    start = time.perf_counter()
+    raw = score(model, history)
+    scored = time.perf_counter() - start
+    log.info(f"🚀 {len(history)} readings from {len(history.names)} devices scored by model "
+             f"{model_version(model)} in {scored:.2f}s")
+
+    smoothings, policies = policy_grid(args.methods, args.windows, args.alphas, args.raise_thresholds,
+                                       args.clear_thresholds, args.cooldowns)
+    if not policies:
+        raise SystemExit("❌ No alert policy: every clear threshold is above the raise thresholds")
+    if args.check:
+        for smoothing in smoothings:
+            print(json.dumps(check(history, raw, smoothing, *policies[0])))
+
+    start = time.perf_counter()
+    results = run_grid(history, raw, smoothings, policies, args.workers)
+    log.info(f"📈 {len(results)} parameter sets replayed in {time.perf_counter() - start:.2f}s")
+    for result in results:
+        print(json.dumps(result))
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,114 @@
+"""
+Load test: the FastAPI service (htpp_old_code/main.py), single vs batch
+/predict, no server or network needed.
+
+Requests go through FastAPI's TestClient, so validation, the event loop,
+inference and the side effects run as in production. Firestore is the
+in-memory fake, answering every commit after `--latency` seconds: with the
+writes off the response path the latency should not show in the response
+times. `--readings` readings from `--devices` simulated motors are sent
+
+- single: one POST /predict per reading from `--concurrency` threads
+- batch-N: POST /predict/batch with N readings per request, for each N in `--batch-sizes`
+
+Reported per mode:
+
+- req_per_sec / readings_per_sec: throughput of the run
+- latency_ms: p50/p99 time of one request
+- commits: Firestore batches committed for the run's documents
+- drain_s: time after the last response until every document is committed
+
+Usage (from the cloud/ folder):
+    python benchmarks/api_load_test.py
+    python benchmarks/api_load_test.py --readings 5000 --concurrency 16 --batch-sizes 10 100 200 --latency 0.05
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+sys.path.insert(0, os.path.join(CLOUD_DIR, "htpp_old_code"))
+os.chdir(CLOUD_DIR)
+os.environ["FIRESTORE_BACKEND"] = "fake"
+
+from fastapi.testclient import TestClient
+import main
+from test_mqtt_publisher import DEFAULT_MIX, generate_reading, parse_mix
+
+
+def make_readings(count, devices, mix, seed=0):
+    random.seed(seed)
+    scenarios, weights = parse_mix(mix)
+    readings = []
+    for i in range(count):
+        reading = generate_reading(random.choices(scenarios, weights)[0])
+        readings.append({
+            "device_id": f"motor-{i % devices:04d}",
+            "timestamp": i // devices * 2,
+            "temperature": reading["temperature"],
+            "vibration": reading["vibration"],
+            "rpm": reading["rpm"],
+        })
+    return readings
+
+
+def timed_post(client, path, body):
+    start = time.perf_counter()
+    response = client.post(path, json=body)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run(client, mode, readings, batch_size, concurrency):
+    before = dict(main.writer.stats)
+    start = time.perf_counter()
+    if batch_size is None:
+        with ThreadPoolExecutor(concurrency) as pool:
+            times = list(pool.map(lambda reading: timed_post(client, "/predict", reading), readings))
+    else:
+        times = [timed_post(client, "/predict/batch", {"readings": readings[i:i + batch_size]})
+                 for i in range(0, len(readings), batch_size)]
+    elapsed = time.perf_counter() - start
+    main.writer.flush(60)
+    drain_s = time.perf_counter() - start - elapsed
+
+    ms = lambda q: round(float(np.percentile(times, q)) * 1000, 2)
+    return {
+        "mode": mode,
+        "requests": len(times),
+        "readings": len(readings),
+        "req_per_sec": round(len(times) / elapsed, 1),
+        "readings_per_sec": round(len(readings) / elapsed, 1),
+        "latency_ms": {"p50": ms(50), "p99": ms(99)},
+        "commits": main.writer.stats["commits"] - before["commits"],
+        "drain_s": round(drain_s, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=2000)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--concurrency", type=int, default=8, help="threads sending single /predict requests")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 50, main.MAX_BATCH_READINGS])
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per Firestore commit")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    main.db.latency = args.latency
+    readings = make_readings(args.readings, args.devices, args.mix)
+    print(f"🚀 {len(readings)} readings from {args.devices} devices, Firestore commit latency {args.latency}s\n")
+    with TestClient(main.app) as client:
+        print(json.dumps(run(client, "single", readings, None, args.concurrency)))
+        for size in args.batch_sizes:
+            size = min(size, main.MAX_BATCH_READINGS)
+            print(json.dumps(run(client, f"batch-{size}", readings, size, args.concurrency)))
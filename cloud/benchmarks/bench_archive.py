@@ -0,0 +1,126 @@
+"""
+Benchmark: retention job and archive reads (retention.py).
+
+`--devices` simulated motors have `--days` days of readings, one every
+`--interval` seconds, in the in-memory Firestore (STORAGE_MODE split:
+sensor_data + predictions). Everything is archived and deleted. Reported:
+
+- job: seconds and readings/second of archive_readings (files, rollups,
+  batched deletes), the day files written and the Firestore documents deleted
+- storage: archive bytes per reading against the documents' JSON size
+- read_ms: ReadingArchive.read of one device (p50 over `--queries` random
+  ranges) for an hour of every column, a day of one column and the whole
+  device
+- exact: the archived readings equal the ones generated
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_archive.py
+    python benchmarks/bench_archive.py --devices 20 --days 7 --interval 2
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+
+from fake_firestore import FakeFirestoreClient
+from firestore_writer import BatchedFirestoreWriter, reading_group
+from retention import ReadingArchive, archive_readings
+from test_mqtt_publisher import generate_reading
+
+START = datetime(2026, 1, 1)
+
+
+def populate(db, devices, days, interval, seed=0):
+    """Readings of every device; returns {device_id: temperatures in time order} and the documents' JSON bytes."""
+    random.seed(seed)
+    temperatures, json_bytes = {}, 0
+    batch = db.batch()
+    for device in range(devices):
+        device_id = f"motor-{device:04d}"
+        values = temperatures[device_id] = []
+        for k in range(int(days * 86400 / interval)):
+            timestamp = START + timedelta(seconds=k * interval)
+            reading = generate_reading("NORMAL")
+            sensor_doc = {"device_id": device_id, "temperature": reading["temperature"],
+                          "vibration": reading["vibration"], "rpm": reading["rpm"], "timestamp": timestamp}
+            prediction_doc = {"device_id": device_id, "failure_probability": random.random(),
+                              "raw_failure_probability": random.random(), "timestamp": timestamp}
+            for ref, doc in reading_group(db, sensor_doc, prediction_doc):
+                batch.set(ref, doc)
+                json_bytes += len(json.dumps(doc, default=str))
+            values.append(reading["temperature"])
+            if len(batch) >= 400:
+                batch.commit()
+                batch = db.batch()
+    batch.commit()
+    return temperatures, json_bytes
+
+
+def p50_ms(fn, ranges):
+    times = []
+    for start, end in ranges:
+        begin = time.perf_counter()
+        fn(start, end)
+        times.append(time.perf_counter() - begin)
+    return round(float(np.percentile(times, 50)) * 1000, 3)
+
+
+def run(devices, days, interval, queries):
+    db = FakeFirestoreClient()
+    temperatures, json_bytes = populate(db, devices, days, interval)
+    readings = sum(len(values) for values in temperatures.values())
+
+    with tempfile.TemporaryDirectory() as root:
+        archive = ReadingArchive(root)
+        writer = BatchedFirestoreWriter(db, block_timeout=300)
+        start = time.perf_counter()
+        stats = archive_readings(db, archive, START + timedelta(days=days), writer=writer)
+        elapsed = time.perf_counter() - start
+        writer.close()
+        archive_bytes = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+
+        device_id = "motor-0000"
+        span = days * 86400
+        hours = [(t, t + 3600) for t in (START.timestamp() + random.uniform(0, span - 3600) for _ in range(queries))]
+        read_ms = {
+            "hour_all_columns": p50_ms(lambda s, e: archive.read(device_id, s, e), hours),
+            "day_one_column": p50_ms(lambda s, e: archive.read(device_id, s, s + 86400, ["temperature"]), hours),
+            "whole_device": p50_ms(lambda s, e: archive.read(device_id), hours[:5]),
+        }
+        stored = archive.read(device_id, columns=["temperature"])["temperature"]
+        exact = bool(np.allclose(stored, temperatures[device_id], atol=1e-4))
+
+    return {
+        "readings": readings,
+        "job": {"seconds": round(elapsed, 2), "readings_per_sec": round(readings / elapsed, 1),
+                "files": stats["files"], "rollups": stats["rollups"], "deleted": stats["deleted"]},
+        "storage": {"archive_bytes_per_reading": round(archive_bytes / readings, 1),
+                    "json_bytes_per_reading": round(json_bytes / readings, 1),
+                    "ratio": round(json_bytes / archive_bytes, 1)},
+        "read_ms": read_ms,
+        "exact": exact,
+        "firestore_left": db.count("sensor_data") + db.count("predictions"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=5)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--interval", type=float, default=10, help="seconds between readings")
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"🚀 {args.devices} devices, {args.days} days, a reading every {args.interval}s\n")
+    print(json.dumps(run(args.devices, args.days, args.interval, args.queries)))
@@ -0,0 +1,181 @@
+"""
+Benchmark: threaded subscriber (mqtt_subscriber.py) vs the asyncio one
+(async_subscriber.py), no broker needed.
+
+Both process the same JSON readings from simulated devices through their
+real message path, with a stub MQTT client and the in-memory Firestore fake
+(sync or async) answering every commit after `--latency` seconds, so the
+effect of Firestore round trips can be compared. Readings are fed at
+`--rate` messages/second (0 = as fast as possible). Reported per mode:
+
+- msgs_per_sec: readings processed per second of the run
+- publish_ms: time from handing a message to the subscriber until its
+  result is published on motor/<device_id>/alert
+- drain_s: time after the last message until every document is committed
+- threads: threads alive while processing
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_async_vs_threaded.py
+    python benchmarks/bench_async_vs_threaded.py --messages 5000 --rate 0 --latency 0.01 0.1 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+os.chdir(CLOUD_DIR)
+os.environ["FIRESTORE_BACKEND"] = "fake"
+
+import async_subscriber
+import mqtt_subscriber as sub
+from fake_firestore import FakeAsyncFirestoreClient, FakeFirestoreClient
+from firestore_writer import BatchedFirestoreWriter
+from pipeline import Pipeline
+from rollups import RollupAggregator
+from smoothing import SmoothingState
+
+# Loads the model (the subscriber does it while connecting)
+sub.warm_up()
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class StubMqttClient:
+    """Records when each result (by seq) is published."""
+
+    def __init__(self):
+        self.published_at = {}
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published_at[json.loads(payload)["seq"]] = time.perf_counter()
+
+
+class AsyncStubMqttClient(StubMqttClient):
+    async def publish(self, topic, payload, qos=0, retain=False):
+        super().publish(topic, payload)
+
+
+def make_messages(devices, count, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for seq in range(count):
+        payload = {
+            "temperature": round(rng.uniform(20, 80), 1),
+            "vibration": round(rng.uniform(0.1, 6.0), 3),
+            "rpm": int(rng.uniform(0, 3000)),
+            "timestamp": int(time.time()),
+            "seq": seq,
+        }
+        messages.append(Message(f"motor/dev-{seq % devices:05d}/data", json.dumps(payload).encode()))
+    return messages
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+def summarize(mode, latency, messages, sent_at, published_at, elapsed, drain, threads, docs):
+    delays = sorted(published_at[seq] - sent_at[seq] for seq in published_at)
+    return {
+        "mode": mode,
+        "firestore_latency_ms": latency * 1000,
+        "messages": len(messages),
+        "published": len(published_at),
+        "sensor_docs": docs,
+        "msgs_per_sec": round(len(published_at) / elapsed, 1),
+        "publish_ms": {
+            "p50": round(percentile(delays, 50) * 1000, 2),
+            "p99": round(percentile(delays, 99) * 1000, 2),
+        },
+        "drain_s": round(drain, 2),
+        "threads": threads,
+    }
+
+
+def pace(start, i, rate):
+    """Seconds to wait before sending message `i`."""
+    return start + i / rate - time.perf_counter() if rate else 0
+
+
+def run_threaded(messages, latency, rate):
+    sub.client = StubMqttClient()
+    sub.db = FakeFirestoreClient(latency=latency)
+    sub.writer = BatchedFirestoreWriter(sub.db, sub.FIRESTORE_BATCH_SIZE, sub.FIRESTORE_BATCH_AGE,
+                                        max_queue_size=len(messages) + 1000)
+    sub.rollups = RollupAggregator(sub.writer, sub.ROLLUP_RESOLUTIONS, flush_interval=0)
+    sub.smoothing = SmoothingState(sub.SMOOTHING_METHOD, sub.SMOOTHING_WINDOW, sub.SMOOTHING_ALPHA)
+    sub.batcher = sub.MicroBatcher(sub.models.model, sub.INFERENCE_BATCH_WINDOW_MS / 1000.0, sub.INFERENCE_MAX_BATCH)
+    sub.workers = Pipeline(sub.handle_prediction, sub.PIPELINE_WORKERS, max_queue_size=len(messages))
+
+    sent_at = {}
+    start = time.perf_counter()
+    for i, msg in enumerate(messages):
+        wait = pace(start, i, rate)
+        if wait > 0:
+            time.sleep(wait)
+        sent_at[i] = time.perf_counter()
+        sub.on_message(sub.client, None, msg)
+    threads = threading.active_count()
+    sub.batcher.close(timeout=600)
+    sub.workers.close(timeout=600)
+    processed = time.perf_counter()
+    sub.rollups.close()
+    sub.writer.close(timeout=600)
+    drained = time.perf_counter()
+
+    return summarize("threaded", latency, messages, sent_at, sub.client.published_at,
+                     processed - start, drained - processed, threads, sub.db.count("sensor_data"))
+
+
+async def run_async(messages, latency, rate):
+    db = FakeAsyncFirestoreClient(latency=latency)
+    subscriber = async_subscriber.AsyncSubscriber(db, sub.models.model)
+    subscriber.client = AsyncStubMqttClient()
+    await subscriber.start()
+
+    sent_at = {}
+    start = time.perf_counter()
+    for i, msg in enumerate(messages):
+        wait = pace(start, i, rate)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        sent_at[i] = time.perf_counter()
+        await subscriber.dispatch(msg.topic, msg.payload)
+    threads = threading.active_count()
+    await subscriber.drain()
+    processed = time.perf_counter()
+    await subscriber.close()
+    drained = time.perf_counter()
+
+    return summarize(f"async x{subscriber.concurrency}", latency, messages, sent_at, subscriber.client.published_at,
+                     processed - start, drained - processed, threads, db.count("sensor_data"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=1000, help="messages/second, 0 = as fast as possible")
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.005, 0.05, 0.2],
+                        help="seconds per fake Firestore commit")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    messages = make_messages(args.devices, args.messages)
+    print(f"🚀 {len(messages)} messages from {args.devices} simulated devices at "
+          f"{args.rate or 'max'} msg/s\n")
+    for latency in args.latency:
+        print(json.dumps(run_threaded(messages, latency, args.rate)))
+        print(json.dumps(asyncio.run(run_async(messages, latency, args.rate))))
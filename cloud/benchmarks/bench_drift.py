@@ -0,0 +1,90 @@
+"""
+Benchmark: drift / out-of-distribution stage (drift.DriftMonitor).
+
+`--devices` simulated motors hold a NORMAL operating point (sensor noise
+only) for `--readings` readings each, interleaved like the publisher sends
+them. A share `--ood-rate` of the readings is pushed outside the training
+ranges (e.g. 120 °C), and from `--shift-at` on every motor's failure
+probability rises by `--shift`. Reported:
+
+- update_us: DriftMonitor.update per reading (p50 / p99 / mean)
+- ood_recall / ood_false: injected readings flagged / normal readings flagged
+- stats_match: the running mean / variance of a device against NumPy's over
+  the same readings (exact while under the horizon)
+- summary: the totals the metrics expose, after the shift
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_drift.py
+    python benchmarks/bench_drift.py --devices 1000 --readings 200 --ood-rate 0.01
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+
+from drift import DriftMonitor
+from features import FeatureState, INPUT_FEATURES
+from model_store import load_model
+from config import MODEL_FALLBACK_PATH, MODEL_PATH
+from test_mqtt_publisher import generate_reading, steady_reading
+
+
+def run(devices, readings, ood_rate, shift_at, shift, horizon, seed=0):
+    random.seed(seed)
+    monitor = DriftMonitor(horizon=horizon)
+    monitor.model = load_model(MODEL_PATH, MODEL_FALLBACK_PATH)
+    features = FeatureState()
+    bases = [generate_reading("NORMAL") for _ in range(devices)]
+
+    times, injected, flagged, history = [], [], [], []
+    for k in range(readings):
+        prob = 0.05 + (shift if k >= shift_at else 0.0)
+        for device, base in enumerate(bases):
+            reading = steady_reading(base)
+            outlier = random.random() < ood_rate
+            if outlier:
+                reading["temperature"] = random.uniform(110, 150)
+            row = features.row(device, k * 2.0, reading["temperature"], reading["vibration"], reading["rpm"])
+            start = time.perf_counter()
+            result = monitor.update(device, row, prob + random.gauss(0, 0.01))
+            times.append(time.perf_counter() - start)
+            injected.append(outlier)
+            flagged.append(result["ood"])
+            if device == 0:
+                history.append(row[:3])
+
+    injected, flagged = np.array(injected), np.array(flagged)
+    us = np.array(times) * 1e6
+    device_stats = monitor.devices[0]
+    window = np.array(history[-horizon:]) if readings <= horizon else None
+    return {
+        "readings": len(times),
+        "update_us": {"p50": round(float(np.percentile(us, 50)), 2), "p99": round(float(np.percentile(us, 99)), 2),
+                      "mean": round(float(us.mean()), 2)},
+        "ood_recall": round(float(flagged[injected].mean()), 4) if injected.any() else None,
+        "ood_false": round(float(flagged[~injected].mean()), 4),
+        "stats_match": bool(np.allclose(device_stats.mean, window.mean(axis=0)) and
+                            np.allclose(device_stats.var, window.var(axis=0))) if window is not None else None,
+        "summary": monitor.summary(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--readings", type=int, default=100, help="readings per device")
+    parser.add_argument("--ood-rate", type=float, default=0.02)
+    parser.add_argument("--shift-at", type=int, default=80, help="reading from which the probabilities shift")
+    parser.add_argument("--shift", type=float, default=0.2)
+    parser.add_argument("--horizon", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"🚀 {args.devices * args.readings} readings from {args.devices} devices, inputs {INPUT_FEATURES}\n")
+    print(json.dumps(run(args.devices, args.readings, args.ood_rate, args.shift_at, args.shift, args.horizon)))
@@ -0,0 +1,50 @@
+"""
+Benchmark: sklearn predict_proba vs the flattened NumPy forest (forest_engine.py).
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_forest_engine.py
+"""
+
+import os
+import pickle
+import sys
+import time
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+
+from forest_engine import CompiledForest, export_forest
+
+BATCH_SIZES = [1, 8, 64, 512]
+
+
+def time_call(fn, X, repeats):
+    fn(X)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(X)
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    with open(os.path.join(CLOUD_DIR, "ml-model", "motor_model.pkl"), "rb") as f:
+        model = pickle.load(f)
+    compiled = CompiledForest(export_forest(model))
+
+    rng = np.random.default_rng(1)
+    X_all = np.column_stack([
+        rng.uniform(0, 100, 10000),
+        rng.uniform(0, 10, 10000),
+        rng.uniform(0, 3500, 10000),
+    ])
+    diff = np.abs(model.predict_proba(X_all)[:, 1] - compiled.predict_proba(X_all)[:, 1]).max()
+    print(f"Max |p_sklearn - p_compiled| over {len(X_all)} rows: {diff:.2e}\n")
+
+    print(f"{'batch':>6} {'sklearn ms':>12} {'compiled ms':>12} {'speedup':>8}")
+    for batch_size in BATCH_SIZES:
+        X = X_all[:batch_size]
+        repeats = max(5, 200 // batch_size)
+        t_sk = time_call(model.predict_proba, X, repeats)
+        t_np = time_call(compiled.predict_proba, X, repeats)
+        print(f"{batch_size:>6} {t_sk * 1000:>12.3f} {t_np * 1000:>12.3f} {t_sk / t_np:>7.1f}x")
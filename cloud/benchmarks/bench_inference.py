@@ -0,0 +1,74 @@
+"""
+Benchmark: model throughput (rows/second) against inference batch size.
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_inference.py
+    python benchmarks/bench_inference.py --rows 2000 --batch-sizes 1 8 32 128
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+
+from inference import MicroBatcher
+
+
+def random_readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.uniform(20, 80, n),
+        rng.uniform(0.1, 6.0, n),
+        rng.uniform(0, 3000, n),
+    ])
+
+
+def bench_direct(model, X, batch_size):
+    """Calls predict_proba directly on consecutive slices of X."""
+    start = time.perf_counter()
+    for i in range(0, len(X), batch_size):
+        model.predict_proba(X[i:i + batch_size])
+    return len(X) / (time.perf_counter() - start)
+
+
+def bench_batcher(model, X, window, max_batch_size):
+    """Pushes every row through the MicroBatcher and waits for all callbacks."""
+    done = []
+    batcher = MicroBatcher(model, window, max_batch_size)
+    start = time.perf_counter()
+    for row in X:
+        batcher.submit(list(row), done.append)
+    batcher.close(timeout=600)
+    elapsed = time.perf_counter() - start
+    return len(done) / elapsed, batcher.stats["batches"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.path.join(CLOUD_DIR, "ml-model", "motor_model.pkl"))
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 64, 256])
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+
+    X = random_readings(args.rows)
+    model.predict_proba(X[:1])  # warm up
+
+    print(f"📊 Direct predict_proba ({args.rows} rows)")
+    print(f"{'batch':>8} {'rows/s':>12}")
+    for batch_size in args.batch_sizes:
+        print(f"{batch_size:>8} {bench_direct(model, X, batch_size):>12.1f}")
+
+    print(f"\n📊 MicroBatcher (window={args.window_ms} ms, {args.rows} rows submitted at once)")
+    print(f"{'max batch':>10} {'rows/s':>12} {'batches':>8}")
+    for batch_size in args.batch_sizes:
+        rate, batches = bench_batcher(model, X, args.window_ms / 1000.0, batch_size)
+        print(f"{batch_size:>10} {rate:>12.1f} {batches:>8}")
@@ -0,0 +1,105 @@
+"""
+Benchmark: inference cache (inference.InferenceCache) on a steady-state stream.
+
+Builds the stream test_mqtt_publisher.py --steady sends: every simulated
+motor keeps one scenario and operating point, and its readings only differ
+by sensor noise. Readings are interleaved across devices as the publisher
+sends them and scored in micro-batches of `--batch-size`, once by the model
+directly and once through the cache, for each set of quantization steps in
+`--resolutions`. Reported per resolution:
+
+- hit_rate: share of readings answered from the cache
+- batch_ms: p50/p99 time to score one micro-batch, model vs cache
+- speedup: total scoring time, model / cache
+- abs_error: |cached - exact| probability, mean / p99 / max
+- alert_flips: readings whose raw probability lands on the other side of
+  the 0.8 alert threshold because of the quantization
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_inference_cache.py
+    python benchmarks/bench_inference_cache.py --devices 500 --readings 40 --resolutions 0.1,0.01,10 0.5,0.05,50
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+
+from config import ALERT_RAISE_THRESHOLD, MODEL_FALLBACK_PATH, MODEL_PATH
+from inference import InferenceCache
+from model_store import load_model
+from test_mqtt_publisher import DEFAULT_MIX, generate_reading, parse_mix, steady_reading
+
+
+def steady_stream(devices, readings, mix, steady=True, seed=0):
+    """Rows [temperature, vibration, rpm], interleaved across devices like the publisher."""
+    random.seed(seed)
+    scenarios, weights = parse_mix(mix)
+    bases = [generate_reading(random.choices(scenarios, weights)[0]) for _ in range(devices)]
+    rows = []
+    for _ in range(readings):
+        for base in bases:
+            reading = steady_reading(base) if steady else generate_reading(random.choices(scenarios, weights)[0])
+            rows.append([reading["temperature"], reading["vibration"], reading["rpm"]])
+    return np.array(rows, dtype=float)
+
+
+def score(fn, X, batch_size):
+    probs, times = [], []
+    for i in range(0, len(X), batch_size):
+        start = time.perf_counter()
+        probs.append(fn(X[i:i + batch_size]))
+        times.append(time.perf_counter() - start)
+    return np.concatenate(probs), np.array(times)
+
+
+def run(model, X, resolutions, batch_size, cache_size):
+    exact, exact_times = score(lambda batch: model.predict_proba(batch)[:, 1], X, batch_size)
+    cache = InferenceCache(resolutions, cache_size)
+    cached, cached_times = score(lambda batch: cache.predict(model, batch), X, batch_size)
+
+    error = np.abs(cached - exact)
+    ms = lambda times, q: round(float(np.percentile(times, q)) * 1000, 3)
+    return {
+        "resolutions": list(resolutions),
+        "rows": len(X),
+        "hit_rate": round(cache.hit_rate(), 4),
+        "cached_cells": len(cache.entries),
+        "batch_ms": {
+            "model": {"p50": ms(exact_times, 50), "p99": ms(exact_times, 99)},
+            "cache": {"p50": ms(cached_times, 50), "p99": ms(cached_times, 99)},
+        },
+        "speedup": round(exact_times.sum() / cached_times.sum(), 2),
+        "abs_error": {
+            "mean": round(float(error.mean()), 5),
+            "p99": round(float(np.percentile(error, 99)), 5),
+            "max": round(float(error.max()), 5),
+        },
+        "alert_flips": int(np.count_nonzero((cached >= ALERT_RAISE_THRESHOLD) != (exact >= ALERT_RAISE_THRESHOLD))),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--readings", type=int, default=30, help="readings per device")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--random", action="store_true", help="independent random readings instead of steady state")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--resolutions", nargs="+", default=["0.05,0.005,5", "0.1,0.01,10", "0.5,0.05,50"],
+                        help="quantization steps 'temperature,vibration,rpm', one set per run")
+    args = parser.parse_args()
+
+    model = load_model(MODEL_PATH, MODEL_FALLBACK_PATH)
+    X = steady_stream(args.devices, args.readings, args.mix, steady=not args.random)
+    print(f"🚀 {len(X)} {'random' if args.random else 'steady-state'} readings from {args.devices} devices, "
+          f"batches of {args.batch_size}\n")
+    for text in args.resolutions:
+        print(json.dumps(run(model, X, [float(v) for v in text.split(",")], args.batch_size, args.cache_size)))
@@ -0,0 +1,131 @@
+"""
+Benchmark: model load time per artifact format, and hot reload under load.
+
+1. Loads the deployed model as the sklearn pickle, a single .npz export and
+   a versioned artifact (model_store.py, memory-mapped, with and without
+   the sha256 check) and reports the median load time of each.
+2. Builds a temporary registry with the deployed model and a second, smaller
+   forest. Rows are fed through a MicroBatcher at `--rate` rows/second while
+   CURRENT flips between the two every `--flip` seconds. The run reports how
+   many rows were scored (should equal the rows sent) and how many swaps
+   happened. It is repeated in shadow mode, which reports the shadow model's
+   agreement with the serving model instead.
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_model_reload.py
+    python benchmarks/bench_model_reload.py --rows 20000 --rate 5000 --flip 0.1
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+sys.path.insert(0, os.path.join(CLOUD_DIR, "ml-model"))
+
+import model_store
+from forest_engine import CompiledForest, export_forest
+from inference import MicroBatcher
+from model_manager import ModelManager
+
+PICKLE_PATH = os.path.join(CLOUD_DIR, "ml-model", "motor_model.pkl")
+
+
+def median_ms(fn, repeats=20):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 3)
+
+
+def bench_load(tmp):
+    with open(PICKLE_PATH, "rb") as f:
+        model = pickle.load(f)
+    npz = os.path.join(tmp, "motor_model.npz")
+    export_forest(model, npz)
+    artifact = model_store.save_artifact(model, os.path.join(tmp, "load"), "bench")
+
+    def load_pickle():
+        with open(PICKLE_PATH, "rb") as f:
+            pickle.load(f)
+    return {
+        "pickle_ms": median_ms(load_pickle),
+        "npz_ms": median_ms(lambda: CompiledForest.load(npz)),
+        "artifact_ms": median_ms(lambda: model_store.load_artifact(artifact)),
+        "artifact_no_checksum_ms": median_ms(lambda: model_store.load_artifact(artifact, verify=False)),
+    }
+
+
+def run_reload(registry, versions, mode, args):
+    model_store.set_current(registry, versions[0])
+    manager = ModelManager(registry, mode=mode, watch_interval=args.flip / 4)
+    batcher = MicroBatcher(manager.model, 0.002, 64)
+    manager.start([batcher])
+
+    scored = []
+    lock = threading.Lock()
+
+    def on_score(prob):
+        with lock:
+            scored.append(prob)
+
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(20, 90, args.rows), rng.uniform(0, 9, args.rows), rng.uniform(0, 3000, args.rows)])
+    start = time.perf_counter()
+    next_flip, flips = start + args.flip, 0
+    for i, row in enumerate(X):
+        wait = start + i / args.rate - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        if time.perf_counter() >= next_flip:
+            flips += 1
+            model_store.set_current(registry, versions[flips % 2])
+            next_flip += args.flip
+        batcher.submit(row.tolist(), on_score)
+    batcher.close(timeout=60)
+    manager.close()
+
+    status = manager.status()
+    return {
+        "mode": mode,
+        "rows_sent": args.rows,
+        "rows_scored": len(scored),
+        "current_flips": flips,
+        "swaps": status["reloads"],
+        "failures": status["failures"],
+        "shadow": status["shadow"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=2000, help="rows/second")
+    parser.add_argument("--flip", type=float, default=0.5, help="seconds between CURRENT changes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(json.dumps(bench_load(tmp)))
+
+        from train_model import DEFAULT_MIX, make_dataset, parse_mix, train
+        registry = os.path.join(tmp, "models")
+        with open(PICKLE_PATH, "rb") as f:
+            model_store.save_artifact(pickle.load(f), registry, "deployed")
+        X, y = make_dataset(20000, parse_mix(DEFAULT_MIX), seed=7)
+        small, _ = train({"n_estimators": 25, "max_depth": 8, "min_samples_leaf": 5}, X, y, seed=7)
+        model_store.save_artifact(small, registry, "small")
+
+        for mode in ("swap", "shadow"):
+            print(json.dumps(run_reload(registry, ["deployed", "small"], mode, args)))
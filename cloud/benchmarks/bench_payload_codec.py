@@ -0,0 +1,96 @@
+"""
+Benchmark: JSON vs binary payloads, decode cost and bytes on the wire.
+
+For each format it reports the payload size per reading and the time to
+decode a reading into what the subscriber's decode stage produces (a dict
+for JSON, row tuples for binary), plus the raw NumPy record view.
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_payload_codec.py
+    python benchmarks/bench_payload_codec.py --readings 50000 --frame-sizes 1 10 50
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+
+import payload_codec
+
+
+def random_readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    now = int(time.time())
+    return [
+        (round(float(t), 1), round(float(v), 3), int(r), now + i, i)
+        for i, (t, v, r) in enumerate(zip(rng.uniform(20, 80, n), rng.uniform(0.1, 6.0, n), rng.uniform(0, 3000, n)))
+    ]
+
+
+def json_payloads(readings):
+    # Same shape as the ESP32 firmware / test_mqtt_publisher.py
+    return [
+        json.dumps({"temperature": t, "vibration": v, "rpm": r, "timestamp": ts, "seq": seq}).encode()
+        for t, v, r, ts, seq in readings
+    ]
+
+
+def binary_payloads(readings, frame_size):
+    if frame_size == 1:
+        return [payload_codec.encode_reading(t, v, r, ts, seq) for t, v, r, ts, seq in readings]
+    return [
+        payload_codec.encode_batch(readings[i:i + frame_size])
+        for i in range(0, len(readings), frame_size)
+    ]
+
+
+def bench(decode, payloads, n_readings, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for payload in payloads:
+            decode(payload)
+        best = min(best, time.perf_counter() - start)
+    return best / n_readings
+
+
+def decode_json(payload):
+    return json.loads(payload.decode())
+
+
+def decode_binary(payload):
+    # What the subscriber's decode stage does
+    return payload_codec.decode_rows(payload)
+
+
+def decode_binary_numpy(payload):
+    # Zero-copy view only (bulk consumers that stay in NumPy)
+    return payload_codec.decode(payload)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--frame-sizes", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    readings = random_readings(args.readings)
+
+    rows = [("json", json_payloads(readings), decode_json)]
+    for frame_size in args.frame_sizes:
+        payloads = binary_payloads(readings, frame_size)
+        rows.append((f"binary x{frame_size}", payloads, decode_binary))
+        rows.append((f"numpy x{frame_size}", payloads, decode_binary_numpy))
+
+    print(f"📊 Payload formats ({args.readings} readings, best of {args.repeat})")
+    print(f"{'format':>12} {'publishes':>10} {'bytes/reading':>14} {'µs/reading':>11}")
+    for name, payloads, decode in rows:
+        size = sum(len(p) for p in payloads) / args.readings
+        cost = bench(decode, payloads, args.readings, args.repeat) * 1e6
+        print(f"{name:>12} {len(payloads):>10} {size:>14.1f} {cost:>11.2f}")
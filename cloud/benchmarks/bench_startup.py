@@ -0,0 +1,132 @@
+"""
+Benchmark: subscriber startup (mqtt_subscriber.py), imports and time to
+the first processed message.
+
+- imports: `python -X importtime -c "import mqtt_subscriber"`, self time
+  summed per top-level package (the `--top` slowest), and whether the
+  packages the subscriber should not import at startup got imported
+  (scikit-learn, google-cloud-firestore, requests)
+- startup: `--runs` cold starts of `python mqtt_subscriber.py` against a
+  broker, Firestore in memory. A reading is published every `--interval`
+  seconds from the moment the process is spawned; first_result_s is the
+  time until its first result comes back on the alert topic. phases_at
+  is when each startup phase of the subscriber ended (its "⏱️ Startup"
+  log lines, seconds from its first import), buffered the readings that
+  arrived while the model was loading.
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --broker 127.0.0.1:1883 --runs 5
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+os.chdir(CLOUD_DIR)
+
+from cluster_scaling_test import start_mosquitto
+from test_mqtt_publisher import generate_reading, make_client
+
+# Imported on first use, not at startup
+LAZY_PACKAGES = {"sklearn": "sklearn", "firestore": "google.cloud.firestore_v1", "requests": "requests"}
+PHASE = re.compile(r"⏱️ Startup (\w+): [\d.]+s \(at ([\d.]+)s\)")
+READY = re.compile(r"replayed (\d+) buffered")
+
+
+def subscriber_env(**extra):
+    return dict(os.environ, FIRESTORE_BACKEND="fake", METRICS_PORT="0", STATS_INTERVAL="0",
+                MODEL_COMMAND_TOPIC="", CLUSTER_GROUP="", LOG_SAMPLE_RATE="0", **extra)
+
+
+def import_report(top):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import mqtt_subscriber"],
+                            env=subscriber_env(), capture_output=True, text=True, check=True)
+    per_package, loaded = defaultdict(int), set()
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[0].startswith("import time:") or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        loaded.add(name)
+        per_package[name.split(".")[0]] += int(parts[0].split(":")[1])
+    slowest = sorted(per_package.items(), key=lambda item: -item[1])[:top]
+    return {
+        "total_ms": round(sum(per_package.values()) / 1000, 1),
+        "slowest_ms": {package: round(us / 1000, 1) for package, us in slowest},
+        "imported": {name: module in loaded for name, module in LAZY_PACKAGES.items()},
+    }
+
+
+def cold_start(host, port, interval, timeout):
+    prefix = f"startup-{os.getpid()}"
+    first = threading.Event()
+    client = make_client()
+    client.on_message = lambda client, userdata, msg: first.set()
+    client.connect(host, port)
+    client.subscribe(f"{prefix}/+/alert")
+    client.loop_start()
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "mqtt_subscriber.py"],
+        env=subscriber_env(MQTT_BROKER=host, MQTT_PORT=str(port), MQTT_TOPIC=f"{prefix}/+/data",
+                           MQTT_ALERT_TOPIC=f"{prefix}/{{device_id}}/alert"),
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    reading = generate_reading("NORMAL")
+    while not first.is_set() and time.perf_counter() - start < timeout and process.poll() is None:
+        client.publish(f"{prefix}/motor-1/data", json.dumps(reading))
+        first.wait(interval)
+    first_result_s = time.perf_counter() - start if first.is_set() else None
+
+    process.send_signal(signal.SIGTERM)
+    output, _ = process.communicate(timeout=60)
+    client.loop_stop()
+    client.disconnect()
+    buffered = READY.search(output)
+    return {
+        "first_result_s": round(first_result_s, 3) if first_result_s is not None else None,
+        "phases_at": {name: float(at) for name, at in PHASE.findall(output)},
+        "buffered": int(buffered.group(1)) if buffered else None,
+        "exit_code": process.returncode,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--broker", help="host:port of an existing broker (default: start mosquitto)")
+    parser.add_argument("--port", type=int, default=18883, help="port for the local mosquitto")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between published readings")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for the first result")
+    parser.add_argument("--top", type=int, default=8, help="slowest packages to report")
+    args = parser.parse_args()
+
+    print(f"🚀 Subscriber startup, {args.runs} cold start(s)\n")
+    print(json.dumps({"imports": import_report(args.top)}))
+    with tempfile.TemporaryDirectory() as tmp:
+        broker = None
+        if args.broker:
+            host, _, port = args.broker.partition(":")
+            port = int(port or 1883)
+        else:
+            host, port = "127.0.0.1", args.port
+            broker = start_mosquitto(port, tmp)
+        try:
+            for run in range(args.runs):
+                print(json.dumps(dict(run=run, **cold_start(host, port, args.interval, args.timeout))))
+        finally:
+            if broker is not None:
+                broker.terminate()
+                broker.wait()
@@ -0,0 +1,102 @@
+"""
+Benchmark: sliding-window features (features.py), incremental vs recomputed.
+
+For each window size in `--windows`, `--devices` simulated motors send
+`--readings` readings each, interleaved like the publisher sends them.
+Reported per window size:
+
+- incremental_us: FeatureState.update per reading (ring buffer + running sums)
+- recompute_us: the same features recomputed from the device's last
+  `window` readings for every reading (NumPy, what reading the history
+  back would cost before any I/O)
+- max_abs_diff: largest difference between the two
+- offline_matches: history_features over the stored readings gives the
+  same values as the online windows
+
+Usage (from the cloud/ folder):
+    python benchmarks/bench_window_features.py
+    python benchmarks/bench_window_features.py --devices 500 --readings 200 --windows 10 30 120
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+
+from features import FeatureState, history_features
+
+
+def stream(devices, readings, seed=0):
+    """(device_ids, timestamps, X) of a steady stream with slow trends, in arrival order."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(readings) * 2.0 + rng.uniform(0, 0.5, (devices, readings))
+    temperature = rng.uniform(25, 35, (devices, 1)) + rng.uniform(-1, 3, (devices, 1)) * t / 60 \
+        + rng.normal(0, 0.1, (devices, readings))
+    vibration = np.abs(rng.uniform(0.2, 0.8, (devices, 1)) + rng.normal(0, 0.05, (devices, readings)))
+    rpm = rng.uniform(2000, 3000, (devices, 1)) - rng.uniform(0, 300, (devices, 1)) * t / 60 \
+        + rng.normal(0, 15, (devices, readings))
+    # Interleave: reading k of every device before reading k+1 of any
+    order = lambda a: a.T.ravel()
+    device_ids = order(np.repeat(np.arange(devices)[:, None], readings, axis=1))
+    return device_ids, order(t), np.column_stack([order(temperature), order(vibration), order(rpm)])
+
+
+def recompute(history, min_samples):
+    """The window features from scratch, as features.DeviceWindow defines them."""
+    window = np.asarray(history)
+    ts = window[:, 0] - window[0, 0]
+    vib_mean, vib_std = window[:, 2].mean(), window[:, 2].std()
+    if len(window) < min_samples or np.ptp(ts) == 0:
+        return (0.0, vib_mean, vib_std, 0.0)
+    temp_slope = np.polyfit(ts, window[:, 1], 1)[0] * 60
+    rpm_slope = np.polyfit(ts, window[:, 3], 1)[0] * 60
+    return (temp_slope, vib_mean, vib_std, max(0.0, -rpm_slope))
+
+
+def run(device_ids, timestamps, X, size, min_samples):
+    rows = list(zip(device_ids.tolist(), timestamps.tolist(), *X.T.tolist()))
+
+    state = FeatureState(size, min_samples)
+    start = time.perf_counter()
+    online = [state.update(*row) for row in rows]
+    incremental = time.perf_counter() - start
+
+    histories = {}
+    start = time.perf_counter()
+    recomputed = []
+    for device_id, *reading in rows:
+        history = histories.setdefault(device_id, [])
+        history.append(reading)
+        del history[:-size]
+        recomputed.append(recompute(history, min_samples))
+    recomputed_seconds = time.perf_counter() - start
+
+    online = np.array(online)
+    offline = history_features(device_ids, timestamps, X, size, min_samples)
+    return {
+        "window": size,
+        "readings": len(rows),
+        "incremental_us": round(incremental / len(rows) * 1e6, 2),
+        "recompute_us": round(recomputed_seconds / len(rows) * 1e6, 2),
+        "max_abs_diff": float(np.abs(online - np.array(recomputed)).max()),
+        "offline_matches": bool(np.allclose(online, offline, rtol=0, atol=1e-9)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--readings", type=int, default=100, help="readings per device")
+    parser.add_argument("--windows", type=int, nargs="+", default=[10, 30, 120])
+    parser.add_argument("--min-samples", type=int, default=5)
+    args = parser.parse_args()
+
+    data = stream(args.devices, args.readings)
+    print(f"🚀 {len(data[0])} readings from {args.devices} devices\n")
+    for size in args.windows:
+        print(json.dumps(run(*data, size, args.min_samples)))
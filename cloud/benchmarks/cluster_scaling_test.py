@@ -0,0 +1,134 @@
+"""
+End-to-end scale-out test: throughput of the subscriber cluster
+(launch_cluster.py) for different numbers of subscriber processes.
+
+For every process count it starts a fresh cluster (own CLUSTER_GROUP, fake
+Firestore), waits for the members to join, then runs `--publishers`
+test_mqtt_publisher.py processes at full speed, each simulating its own
+range of devices, and sums their results. Reported per process count:
+sent/received per second, end-to-end latency percentiles (worst publisher),
+drops and the scaling efficiency throughput_N / (N * throughput_1).
+
+A local Mosquitto (`mosquitto` on the PATH) is started on `--port` unless
+`--broker` is given. The test is only meaningful on a machine with at least
+as many free cores as the largest process count, plus some for the broker
+and publishers. `--intake all` runs it against brokers without shared
+subscriptions (every member reads every message and skips most).
+
+Usage (from the cloud/ folder):
+    python benchmarks/cluster_scaling_test.py
+    python benchmarks/cluster_scaling_test.py --processes 1 2 4 8 --rate 20000 --duration 30
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(CLOUD_DIR)
+
+
+def start_mosquitto(port, tmp):
+    if shutil.which("mosquitto") is None:
+        sys.exit("❌ mosquitto not found on the PATH (or pass --broker host:port)")
+    conf = os.path.join(tmp, "mosquitto.conf")
+    with open(conf, "w") as f:
+        f.write(f"listener {port} 127.0.0.1\nallow_anonymous true\nmax_queued_messages 100000\n")
+    process = subprocess.Popen(["mosquitto", "-c", conf], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1)
+    if process.poll() is not None:
+        sys.exit(f"❌ mosquitto exited with {process.returncode}")
+    return process
+
+
+def run(n, args, host, port, tmp):
+    env = dict(os.environ,
+               MQTT_BROKER=host, MQTT_PORT=str(port),
+               CLUSTER_INTAKE=args.intake, FIRESTORE_BACKEND="fake",
+               LOG_SAMPLE_RATE="0", STATS_INTERVAL="0", LOG_LEVEL="WARNING")
+    group = f"scale{n}-{os.getpid()}"
+    cluster = subprocess.Popen(
+        [sys.executable, "launch_cluster.py", "--processes", str(n), "--group", group,
+         "--metrics-port", "0"], env=env)
+    # Let every member connect, load the model and see the others
+    time.sleep(args.warmup)
+
+    per_publisher = args.devices // args.publishers
+    publishers = []
+    for i in range(args.publishers):
+        out = os.path.join(tmp, f"n{n}-p{i}.json")
+        command = [sys.executable, "test_mqtt_publisher.py", "--broker", host, "--port", str(port),
+                   "--devices", str(per_publisher), "--device-offset", str(i * per_publisher),
+                   "--rate", str(args.rate / args.publishers), "--duration", str(args.duration),
+                   "--format", args.format, "--frame-size", str(args.frame_size),
+                   "--quiet", "--json-out", out]
+        publishers.append((subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL), out))
+    for process, _ in publishers:
+        process.wait()
+
+    cluster.send_signal(signal.SIGTERM)
+    cluster.wait(120)
+
+    results = []
+    for _, out in publishers:
+        with open(out) as f:
+            results.append(json.load(f))
+    sent = sum(r["sent"] for r in results)
+    received = sum(r["received"] for r in results)
+    return {
+        "processes": n,
+        "sent": sent,
+        "received": received,
+        "dropped": sum(r["dropped"] for r in results),
+        "sent_per_sec": round(sum(r["sent_per_sec"] or 0 for r in results), 1),
+        "received_per_sec": round(sum(r["received_per_sec"] or 0 for r in results), 1),
+        "latency_ms": {
+            q: max(r["latency_ms"][q] for r in results if r["latency_ms"].get(q) is not None)
+            for q in ("p50", "p99")
+            if any(r["latency_ms"].get(q) is not None for r in results)
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--broker", help="host:port of an existing broker (default: start mosquitto)")
+    parser.add_argument("--port", type=int, default=18883, help="port for the local mosquitto")
+    parser.add_argument("--intake", choices=["shared", "all"], default="shared")
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--publishers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=10000, help="target messages/second across all publishers")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to publish per run")
+    parser.add_argument("--format", choices=["json", "binary"], default="json")
+    parser.add_argument("--frame-size", type=int, default=1)
+    parser.add_argument("--warmup", type=float, default=8, help="seconds for the cluster to start")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        broker = None
+        if args.broker:
+            host, _, port = args.broker.partition(":")
+            port = int(port or 1883)
+        else:
+            host, port = "127.0.0.1", args.port
+            broker = start_mosquitto(port, tmp)
+        try:
+            results = []
+            for n in args.processes:
+                result = run(n, args, host, port, tmp)
+                base = results[0] if results else result
+                per_process = base["received_per_sec"] / base["processes"]
+                result["efficiency"] = round(result["received_per_sec"] / (n * per_process), 2) if per_process else None
+                results.append(result)
+                print(json.dumps(result))
+        finally:
+            if broker is not None:
+                broker.terminate()
+                broker.wait()
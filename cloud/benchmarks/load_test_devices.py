@@ -0,0 +1,116 @@
+"""
+Synthetic multi-motor load test (no broker, no Firestore).
+
+Feeds readings from thousands of simulated devices through the real
+mqtt_subscriber.on_message path, with the in-memory Firestore fake and a
+stub MQTT client, and reports throughput for different worker counts.
+
+Usage (from the cloud/ folder):
+    python benchmarks/load_test_devices.py --devices 5000 --messages 4 --workers 1 2 4 8
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+os.chdir(CLOUD_DIR)
+os.environ["FIRESTORE_BACKEND"] = "fake"
+
+import mqtt_subscriber as sub
+from fake_firestore import FakeFirestoreClient
+from firestore_writer import BatchedFirestoreWriter
+from pipeline import Pipeline
+from rollups import RollupAggregator
+from smoothing import SmoothingState
+
+# Loads the model (the subscriber does it while connecting)
+sub.warm_up()
+
+
+class StubMqttClient:
+    """Records publishes instead of sending them."""
+
+    def __init__(self):
+        self.published = {}
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.setdefault(topic, []).append(payload)
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def make_messages(devices, per_device, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(per_device):
+        for d in range(devices):
+            payload = {
+                "temperature": round(rng.uniform(20, 80), 1),
+                "vibration": round(rng.uniform(0.1, 6.0), 3),
+                "rpm": int(rng.uniform(0, 3000)),
+                "timestamp": int(time.time()),
+                "seq": i,
+            }
+            messages.append(Message(f"motor/dev-{d:05d}/data", json.dumps(payload).encode()))
+    return messages
+
+
+def run(messages, n_workers, firestore_latency):
+    # Fresh per-run state so runs don't share windows or queues
+    sub.client = StubMqttClient()
+    sub.db = FakeFirestoreClient(latency=firestore_latency)
+    sub.writer = BatchedFirestoreWriter(sub.db, max_batch_age=0.2)
+    sub.rollups = RollupAggregator(sub.writer, sub.ROLLUP_RESOLUTIONS, flush_interval=0)
+    sub.smoothing = SmoothingState(sub.SMOOTHING_METHOD, sub.SMOOTHING_WINDOW, sub.SMOOTHING_ALPHA)
+    sub.batcher = sub.MicroBatcher(sub.models.model, sub.INFERENCE_BATCH_WINDOW_MS / 1000.0, sub.INFERENCE_MAX_BATCH)
+    sub.workers = Pipeline(sub.handle_prediction, n_workers, max_queue_size=len(messages))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for msg in messages:
+            sub.on_message(sub.client, None, msg)
+        sub.batcher.close(timeout=600)
+        sub.workers.close(timeout=600)
+        elapsed = time.perf_counter() - start
+        sub.rollups.close()
+        sub.writer.close(timeout=600)
+
+    return {
+        "workers": n_workers,
+        "messages": len(messages),
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(len(messages) / elapsed, 1),
+        "devices_tracked": len(sub.smoothing.devices),
+        "alert_topics": len(sub.client.published),
+        "sensor_docs": sub.db.count("sensor_data"),
+        "rollup_docs": sub.db.count("rollups"),
+        "worker_errors": sub.workers.errors,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=5, help="messages per device")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--firestore-latency", type=float, default=0.0, help="seconds per fake commit")
+    args = parser.parse_args()
+
+    messages = make_messages(args.devices, args.messages)
+    print(f"🚀 {len(messages)} messages from {args.devices} simulated devices\n")
+    for n_workers in args.workers:
+        result = run(messages, n_workers, args.firestore_latency)
+        print(json.dumps(result))
+        if result["devices_tracked"] != args.devices or result["alert_topics"] != args.devices:
+            print("❌ Per-device state does not match the number of devices")
@@ -0,0 +1,96 @@
+"""
+Offline Firestore outage test: in-memory writer vs the durable spool.
+
+Writes readings at a steady rate into a fake Firestore client that goes
+down for a while in the middle of the run, then reports for each writer:
+how long `write()` blocked the caller, how many readings were lost, and how
+long it took until everything was committed.
+
+Usage (from the cloud/ folder):
+    python benchmarks/spool_outage_test.py
+    python benchmarks/spool_outage_test.py --rate 500 --duration 20 --outage-at 5 --outage-seconds 10
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+CLOUD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLOUD_DIR)
+
+from fake_firestore import FakeFirestoreClient
+from firestore_writer import BatchedFirestoreWriter
+from spool import SpooledFirestoreWriter, WriteSpool
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+def run(name, make_writer, args):
+    db = FakeFirestoreClient(latency=args.latency)
+    writer = make_writer(db)
+    latencies = []
+    total = int(args.rate * args.duration)
+    start = time.monotonic()
+    outage_started = False
+
+    for i in range(total):
+        target = start + i / args.rate
+        delay = target - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if not outage_started and time.monotonic() - start >= args.outage_at:
+            db.outage(args.outage_seconds)
+            outage_started = True
+
+        t = time.perf_counter()
+        writer.write_reading(
+            {"device_id": "health", "temperature": 30.0, "vibration": 0.3, "rpm": 2800, "timestamp": datetime.utcnow()},
+            {"device_id": "health", "failure_probability": 0.1, "timestamp": datetime.utcnow()},
+        )
+        latencies.append(time.perf_counter() - t)
+
+    ingest_end = time.monotonic()
+    writer.flush(timeout=args.outage_seconds + 120)
+    drained = time.monotonic()
+    writer.close()
+
+    latencies.sort()
+    return {
+        "writer": name,
+        "readings": total,
+        "committed": db.count("predictions"),
+        "lost": total - db.count("predictions"),
+        "write_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+        "drain_after_ingest_s": round(drained - ingest_end, 2),
+        "failed_commits": db.failed_commits,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=300, help="readings/second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of ingest")
+    parser.add_argument("--outage-at", type=float, default=2, help="seconds into the run")
+    parser.add_argument("--outage-seconds", type=float, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per fake commit")
+    parser.add_argument("--replay-rate", type=float, default=2000, help="spool replay writes/second")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    options = dict(max_batch_age=0.2, backoff_base=0.2, backoff_max=1.0, max_retries=3)
+    results = [run("memory", lambda db: BatchedFirestoreWriter(db, **options), args)]
+    with tempfile.TemporaryDirectory() as tmp:
+        results.append(run("spool", lambda db: SpooledFirestoreWriter(
+            db, WriteSpool(os.path.join(tmp, "spool.db")), replay_rate=args.replay_rate, **options), args))
+    print(json.dumps(results, indent=2))
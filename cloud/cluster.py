@@ -0,0 +1,308 @@
+"""
+Scale-out over several subscriber processes with MQTT shared subscriptions.
+
+Every process started with the same CLUSTER_GROUP is a member of one
+cluster. The members subscribe to the sensor topic as an MQTT shared
+subscription ($share/<group>/motor/+/data), so the broker hands each
+message to one of them. Per-device state (rolling window, alert state) must
+stay with one process, so every device has an owner, chosen by consistent
+hashing of the device id over the live members (sharding.HashRing). A member
+processes the readings of the devices it owns and forwards the others,
+unchanged, to their owner's inbox topic.
+
+Cluster topics (prefix cluster/<group>):
+
+    members/<member>          retained presence, refreshed every heartbeat and
+                              cleared on leave (or by the broker's will on a crash)
+    inbox/<member>/<topic>    readings forwarded to their owner (original topic appended)
+    handoff/<member>          per-device state moved to a new owner
+
+When a member joins or leaves, only the devices next to its ring points move
+(consistent hashing), and their previous owner hands their state over after
+finishing the readings it already queued. After a crash, its devices start
+with an empty window on their new owner.
+
+With CLUSTER_INTAKE=all (brokers without shared subscriptions) every member
+subscribes to the full topic and simply skips the devices it doesn't own.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from sharding import HashRing
+
+log = logging.getLogger(__name__)
+
+INTAKES = ("shared", "all")
+
+
+def default_member_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Cluster:
+    """
+    Membership, device ownership and forwarding for one member.
+
+    The state callbacks connect it to the subscriber:
+    - export_state(device_id) -> dict: the device's state, JSON serializable
+    - import_state(device_id, state, recent): adopt a handed-off state;
+      `recent` readings of the device were already processed here since
+    - drop_state(device_id): forget a device
+    - known_devices() -> iterable of devices with local state
+    - schedule(device_id, fn): run fn after the device's readings received so far
+    """
+
+    def __init__(self, group, member_id, data_topic, intake="shared",
+                 export_state=None, import_state=None, drop_state=None,
+                 known_devices=lambda: (), schedule=lambda device_id, fn: fn(),
+                 heartbeat=10.0, replicas=100):
+        if intake not in INTAKES:
+            raise ValueError(f"Unknown cluster intake: {intake}")
+        if any(c in member_id for c in "/+#"):
+            raise ValueError(f"Invalid member id {member_id!r}")
+        self.group = group
+        self.member_id = member_id
+        self.data_topic = data_topic
+        self.intake = intake
+        self.prefix = f"cluster/{group}"
+        self.export_state = export_state
+        self.import_state = import_state
+        self.drop_state = drop_state
+        self.known_devices = known_devices
+        self.schedule = schedule
+        self.heartbeat = heartbeat
+        self.replicas = replicas
+
+        self.ring = HashRing([member_id], replicas)
+        # Member -> monotonic time its presence was last seen
+        self.members = {member_id: time.monotonic()}
+        # Devices whose state is authoritative here -> readings processed since taking them over
+        self.active = {}
+        self.stats = {"forwarded": 0, "skipped": 0, "handoffs_sent": 0, "handoffs_received": 0, "rebalances": 0}
+        self.client = None
+        self.leaving = False
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._heartbeat_thread = None
+
+    # ---------- Topics ----------
+    @property
+    def intake_topic(self):
+        if self.intake == "shared":
+            return f"$share/{self.group}/{self.data_topic}"
+        return self.data_topic
+
+    def presence_topic(self, member_id=None):
+        return f"{self.prefix}/members/{member_id or self.member_id}"
+
+    def inbox_topic(self, member_id):
+        return f"{self.prefix}/inbox/{member_id}"
+
+    def handoff_topic(self, member_id):
+        return f"{self.prefix}/handoff/{member_id}"
+
+    def subscriptions(self):
+        return [
+            self.intake_topic,
+            f"{self.prefix}/members/+",
+            f"{self.inbox_topic(self.member_id)}/#",
+            self.handoff_topic(self.member_id),
+        ]
+
+    # ---------- Membership ----------
+    def configure(self, client):
+        """Sets the will that clears our presence if we vanish (call before connect)."""
+        client.will_set(self.presence_topic(), None, qos=1, retain=True)
+
+    def join(self, client):
+        """Subscribes and announces this member (call from on_connect)."""
+        self.client = client
+        client.subscribe([(topic, 0 if topic == self.intake_topic else 1) for topic in self.subscriptions()])
+        self._announce()
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="cluster", daemon=True)
+            self._heartbeat_thread.start()
+        log.info(f"🧩 Joined cluster {self.group} as {self.member_id} (intake: {self.intake_topic})")
+
+    def _announce(self):
+        payload = json.dumps({"member": self.member_id, "host": socket.gethostname(), "pid": os.getpid()})
+        self.client.publish(self.presence_topic(), payload, qos=1, retain=True)
+
+    def _heartbeat_loop(self):
+        while not self._stopping.wait(self.heartbeat):
+            if self.leaving:
+                continue
+            self._announce()
+            # A member that stopped refreshing without a will (e.g. a partitioned
+            # broker) must not keep owning devices
+            with self._lock:
+                expired = [m for m, seen in self.members.items()
+                           if m != self.member_id and time.monotonic() - seen > 3 * self.heartbeat]
+            for member_id in expired:
+                log.warning(f"⚠️ Cluster member {member_id} expired")
+                self._update_members(remove=member_id)
+
+    def _update_members(self, add=None, remove=None):
+        if self.leaving:
+            # Our ring already excludes us; the devices are being handed off
+            return
+        with self._lock:
+            now = time.monotonic()
+            if add is not None:
+                known = add in self.members
+                self.members[add] = now
+                if known:
+                    return
+                self.ring.add(add)
+            if remove is not None:
+                if remove not in self.members or remove == self.member_id:
+                    return
+                del self.members[remove]
+                self.ring.remove(remove)
+            self.stats["rebalances"] += 1
+            members = sorted(self.members)
+        log.info(f"🧩 Cluster {self.group} rebalanced: {len(members)} member(s) {members}")
+        self._rebalance()
+
+    def _rebalance(self):
+        """Hands off the devices that moved away and forgets stale ones."""
+        for device_id in list(self.known_devices()):
+            if self.owns(device_id):
+                continue
+            if device_id in self.active:
+                self.schedule(device_id, lambda d=device_id: self._hand_off(d))
+            else:
+                # Seeded at startup but never ours: would be stale if it comes back
+                self.schedule(device_id, lambda d=device_id: self.drop_state(d) if not self.owns(d) else None)
+
+    def leave(self, timeout=10.0):
+        """
+        Leaves the cluster before shutting down: stops the intake, clears our
+        presence and hands every active device to its next owner. Returns once
+        the handoffs are published (or after `timeout`).
+        """
+        self.leaving = True
+        self._stopping.set()
+        client = self.client
+        if client is None:
+            return 0
+        client.unsubscribe(self.intake_topic)
+        client.publish(self.presence_topic(), None, qos=1, retain=True)
+        with self._lock:
+            others = [m for m in self.members if m != self.member_id]
+            if not others:
+                return 0
+            self.ring = HashRing(others, self.replicas)
+
+        devices = list(self.active)
+        done = threading.Semaphore(0)
+        published = []
+
+        def hand_off(device_id):
+            try:
+                published.append(self._hand_off(device_id))
+            finally:
+                done.release()
+        for device_id in devices:
+            self.schedule(device_id, lambda d=device_id: hand_off(d))
+        deadline = time.monotonic() + timeout
+        for _ in devices:
+            if not done.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                log.warning("⚠️ Timed out handing off device state")
+                break
+        # The caller disconnects next: make sure the broker has the handoffs
+        for info in published:
+            if info is not None and not info.is_published():
+                info.wait_for_publish(max(0.1, deadline - time.monotonic()))
+        return sum(info is not None for info in published)
+
+    # ---------- Ownership ----------
+    def owner(self, device_id):
+        with self._lock:
+            return self.ring.get(device_id)
+
+    def owns(self, device_id):
+        return self.owner(device_id) == self.member_id
+
+    def accepts(self, device_id, forwarded=False):
+        """
+        Whether to process a reading here: we own the device, or another
+        member forwarded it to us (its view of the ring wins, so a reading
+        never bounces between members) and we aren't leaving.
+        """
+        return (forwarded and not self.leaving) or self.owns(device_id)
+
+    def touch(self, device_id):
+        """Counts a reading processed here (call from the device's worker)."""
+        self.active[device_id] = self.active.get(device_id, 0) + 1
+
+    def forward(self, topic, payload, device_id):
+        """Passes a reading of a device we don't own on to its owner."""
+        if self.intake == "all":
+            # The owner got its own copy
+            self.stats["skipped"] += 1
+            return
+        self.client.publish(f"{self.inbox_topic(self.owner(device_id))}/{topic}", payload)
+        self.stats["forwarded"] += 1
+
+    # ---------- State handoff ----------
+    def _hand_off(self, device_id):
+        """Runs on the device's worker after its queued readings."""
+        owner = self.owner(device_id)
+        if owner == self.member_id or device_id not in self.active:
+            return None
+        state = self.export_state(device_id)
+        self.active.pop(device_id, None)
+        self.drop_state(device_id)
+        info = self.client.publish(self.handoff_topic(owner), json.dumps({
+            "device_id": device_id,
+            "from": self.member_id,
+            "state": state,
+        }), qos=1)
+        self.stats["handoffs_sent"] += 1
+        log.debug(f"📦 Handed {device_id} to {owner}")
+        return info
+
+    def _take_over(self, device_id, state):
+        """Runs on the device's worker."""
+        recent = self.active.get(device_id, 0)
+        self.import_state(device_id, state, recent)
+        self.active[device_id] = 0
+        self.stats["handoffs_received"] += 1
+
+    # ---------- Incoming messages ----------
+    def intercept(self, msg):
+        """
+        Handles the cluster's own topics. Returns (topic, forwarded) for a
+        reading to process (`topic` is the original sensor topic), or None
+        when the message was consumed here.
+        """
+        topic = msg.topic
+        if not topic.startswith(self.prefix + "/"):
+            return topic, False
+        kind, _, rest = topic[len(self.prefix) + 1:].partition("/")
+
+        if kind == "inbox":
+            member_id, _, original = rest.partition("/")
+            return original, True
+        if kind == "members":
+            if rest != self.member_id:
+                if msg.payload:
+                    self._update_members(add=rest)
+                else:
+                    self._update_members(remove=rest)
+            return None
+        if kind == "handoff":
+            try:
+                handoff = json.loads(msg.payload)
+                device_id = handoff["device_id"]
+            except (ValueError, KeyError) as e:
+                log.warning(f"⚠️ Invalid handoff message: {e}")
+                return None
+            self.schedule(device_id, lambda: self._take_over(device_id, handoff["state"]))
+            return None
+        return None
@@ -0,0 +1,105 @@
+"""
+Subscriber configuration, read from the environment (and .env).
+
+Shared by both entry points, mqtt_subscriber.py (threads) and
+async_subscriber.py (asyncio); see the README for what each setting does.
+"""
+
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+# Default to public broker for testing if not set
+MQTT_BROKER = os.getenv("MQTT_BROKER", "test.mosquitto.org") 
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+# "+" matches the device id, e.g. motor/pump-7/data. The original single motor
+# publishes to motor/health/data and is simply the device "health".
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "motor/+/data")
+MQTT_ALERT_TOPIC = os.getenv("MQTT_ALERT_TOPIC", "motor/{device_id}/alert")
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")  # point at telegram_stub.py for testing
+ALERT_RAISE_THRESHOLD = float(os.getenv("ALERT_RAISE_THRESHOLD", 0.8))
+ALERT_CLEAR_THRESHOLD = float(os.getenv("ALERT_CLEAR_THRESHOLD", 0.6))
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", 300))  # seconds between notifications per motor
+ALERT_DIGEST_WINDOW = float(os.getenv("ALERT_DIGEST_WINDOW", 0))  # seconds, 0 = one message per alert
+SMOOTHING_METHOD = os.getenv("SMOOTHING_METHOD", "mean")  # mean | median | ewma
+SMOOTHING_WINDOW = int(os.getenv("SMOOTHING_WINDOW", 5))
+SMOOTHING_ALPHA = float(os.getenv("SMOOTHING_ALPHA", 0.4))
+# Sliding-window features per device (features.py): readings per window, readings before slopes count
+FEATURE_WINDOW = int(os.getenv("FEATURE_WINDOW", 30))
+FEATURE_MIN_SAMPLES = int(os.getenv("FEATURE_MIN_SAMPLES", 5))
+# Drift / out-of-distribution stage (drift.py)
+DRIFT_MONITOR = os.getenv("DRIFT_MONITOR", "1") == "1"
+DRIFT_MARGIN = float(os.getenv("DRIFT_MARGIN", 0.1))  # share of a training range tolerated outside it
+DRIFT_HORIZON = int(os.getenv("DRIFT_HORIZON", 1000))  # readings in a device's running statistics
+DRIFT_Z_THRESHOLD = float(os.getenv("DRIFT_Z_THRESHOLD", 6.0))  # anomaly score that counts as anomalous
+FIRESTORE_BATCH_SIZE = int(os.getenv("FIRESTORE_BATCH_SIZE", 400))
+FIRESTORE_BATCH_AGE = float(os.getenv("FIRESTORE_BATCH_AGE", 1.0))  # seconds
+FIRESTORE_QUEUE_SIZE = int(os.getenv("FIRESTORE_QUEUE_SIZE", 10000))
+FIRESTORE_OVERFLOW_POLICY = os.getenv("FIRESTORE_OVERFLOW_POLICY", "block")  # block | drop_newest | drop_oldest
+# Durable local spool (spool.py): writes survive Firestore outages and restarts. Empty = in-memory queue
+SPOOL_PATH = os.getenv("SPOOL_PATH", "")
+SPOOL_MAX_MB = float(os.getenv("SPOOL_MAX_MB", 512))
+SPOOL_REPLAY_RATE = float(os.getenv("SPOOL_REPLAY_RATE", 500))  # writes/s while replaying a backlog, 0 = unlimited
+SPOOL_SYNC = os.getenv("SPOOL_SYNC", "normal")  # normal | full (fsync every append)
+# split: sensor_data + predictions documents (original layout)
+# combined: one `readings` document per reading (half the writes, no join; see migrate_readings.py)
+STORAGE_MODE = os.getenv("STORAGE_MODE", "split")
+# Dashboard history rollups (rollups.py); empty disables
+ROLLUP_RESOLUTIONS = [r for r in os.getenv("ROLLUP_RESOLUTIONS", "1m,1h,1d").split(",") if r]
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", 10))  # seconds
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", 5))
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", 64))
+# Probability cache for repeated readings (inference.InferenceCache); 0 disables
+INFERENCE_CACHE_SIZE = int(os.getenv("INFERENCE_CACHE_SIZE", 10000))
+# Quantization step per feature: temperature (°C), vibration (m/s²), rpm, then for
+# models on window features: temperature slope (°C/min), vibration mean and std (m/s²), rpm drop (rpm/min)
+INFERENCE_CACHE_RESOLUTION = dict(zip(
+    ["temperature", "vibration", "rpm", "temperature_slope", "vibration_mean", "vibration_std", "rpm_drop_rate"],
+    [float(v) for v in os.getenv("INFERENCE_CACHE_RESOLUTION", "0.1,0.01,10").split(",")
+     + os.getenv("INFERENCE_CACHE_WINDOW_RESOLUTION", "0.1,0.01,0.01,10").split(",")],
+))
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 4))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 1000))
+# Scale-out over several processes (cluster.py, launch_cluster.py); empty = single process
+CLUSTER_GROUP = os.getenv("CLUSTER_GROUP", "")
+CLUSTER_INTAKE = os.getenv("CLUSTER_INTAKE", "shared")  # shared ($share subscription) | all (broker without them)
+CLUSTER_MEMBER = os.getenv("CLUSTER_MEMBER", "")  # default <hostname>-<pid>
+CLUSTER_HEARTBEAT = float(os.getenv("CLUSTER_HEARTBEAT", 10))  # seconds between presence refreshes
+# "5" or "3.1.1"; shared subscriptions are an MQTTv5 feature
+MQTT_PROTOCOL = os.getenv("MQTT_PROTOCOL", "5" if CLUSTER_GROUP and CLUSTER_INTAKE == "shared" else "3.1.1")
+# async_subscriber.py: readings in flight (received, not yet written and published)
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", 256))
+MQTT_RECONNECT_DELAY = float(os.getenv("MQTT_RECONNECT_DELAY", 5))  # seconds
+# mqtt_subscriber.py: messages held while the model loads (after connecting), oldest dropped beyond
+STARTUP_BUFFER_SIZE = int(os.getenv("STARTUP_BUFFER_SIZE", 10000))
+# Model paths are relative to this folder, whatever the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Versioned model registry (model_store.py); an .npz export or a .pkl also work
+MODEL_PATH = os.path.join(BASE_DIR, os.getenv("MODEL_PATH", "ml-model/models"))
+MODEL_FALLBACK_PATH = os.path.join(BASE_DIR, "ml-model", "motor_model.pkl")
+# Hot reload (model_manager.py): what a new CURRENT version does, swap | shadow
+MODEL_RELOAD = os.getenv("MODEL_RELOAD", "swap")
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 10))  # seconds, 0 disables
+# Anyone who can publish here controls the served model: only set it on a broker with access control
+MODEL_COMMAND_TOPIC = os.getenv("MODEL_COMMAND_TOPIC", "")  # e.g. motor/model/command, empty disables
+MODEL_STATUS_TOPIC = os.getenv("MODEL_STATUS_TOPIC", "motor/model/status")
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", 60))  # seconds, 0 disables
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))  # Prometheus /metrics, 0 disables
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))  # fraction of per-message log lines kept
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # kill -USR1 <pid> toggles profiling
+
+FIRESTORE_BACKEND = os.getenv("FIRESTORE_BACKEND", "firestore")  # firestore | fake (in-memory, for local testing)
+
+# Read API (query_api.py, served by htpp_old_code/main.py)
+API_CACHE_TTL = float(os.getenv("API_CACHE_TTL", 15))  # seconds, 0 disables
+API_CACHE_SIZE = int(os.getenv("API_CACHE_SIZE", 256))
+API_CORS_ORIGINS = [o for o in os.getenv("API_CORS_ORIGINS", "*").split(",") if o]
+# /predict has always alerted above 0.7, below the subscriber's ALERT_RAISE_THRESHOLD
+API_ALERT_RAISE_THRESHOLD = float(os.getenv("API_ALERT_RAISE_THRESHOLD", 0.7))
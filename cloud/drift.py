@@ -0,0 +1,180 @@
+"""
+Online drift and out-of-distribution checks next to the model.
+
+The model was trained on synthetic ranges (ml-model/train_model.py), so it
+can be confidently wrong about readings outside them. Each reading gets,
+in constant memory per device and a few µs:
+
+    ood                 a model input outside its training range, widened
+                        by `margin` of the range on both sides
+                        (ood_features names them)
+    anomaly_score       largest |z| of temperature / vibration / rpm
+                        against the device's own running mean and variance
+    prediction_drift    the device's recent mean raw probability minus its
+                        long-run mean
+
+Running statistics are Welford's updates. Up to `horizon` readings they
+are exact, and after that they weigh every reading 1/horizon, so older
+readings fade out and a device's new operating point becomes its normal.
+The z-scores use a floor on the standard deviation (the sensors'
+resolution), so a motor holding perfectly steady doesn't turn every
+rounding step into an anomaly.
+
+Training ranges come from the model manifest (train_model.py records
+them); models without them are checked against TRAINING_RANGES, the
+union of the training scenarios. Across all devices, the recent and
+long-run mean probability and the share of OOD readings feed the
+metrics; they restart from the first readings a new model scores.
+"""
+
+import math
+import threading
+from features import BASE_FEATURES, INPUT_FEATURES
+from model_store import model_features, training_ranges
+
+# Union of the scenario ranges of ml-model/train_model.py
+TRAINING_RANGES = {"temperature": [20.0, 90.0], "vibration": [0.0, 9.0], "rpm": [0.0, 3000.0]}
+# Sensor resolution: the smallest standard deviation a z-score divides by
+MIN_STD = (0.1, 0.01, 1.0)
+# Readings in the device's recent probability mean
+RECENT = 20
+# Readings in the recent / long-run means across all devices
+GLOBAL_RECENT = 1000
+GLOBAL_BASELINE = 100_000
+
+
+class DeviceStats:
+    """Running mean / variance of one device's base features and its raw probability."""
+
+    __slots__ = ("count", "mean", "var", "recent", "baseline")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = [0.0] * len(BASE_FEATURES)
+        self.var = [0.0] * len(BASE_FEATURES)
+        self.recent = self.baseline = 0.0
+
+    def update(self, values, raw_prob, horizon, min_samples):
+        """Adds a reading; returns (anomaly score before adding it, prediction drift)."""
+        score = 0.0
+        count = self.count = self.count + 1
+        a = 1.0 / count if count < horizon else 1.0 / horizon
+        scored = count > min_samples
+        mean, var = self.mean, self.var
+        for i, min_std in enumerate(MIN_STD):
+            delta = values[i] - mean[i]
+            if scored:
+                std = math.sqrt(var[i])
+                z = abs(delta) / (std if std > min_std else min_std)
+                if z > score:
+                    score = z
+            mean[i] += a * delta
+            # Welford: var_n = (1 - 1/n) * (var_n-1 + delta^2 / n)
+            var[i] = (1.0 - a) * (var[i] + a * delta * delta)
+        self.recent += (raw_prob - self.recent) / (count if count < RECENT else RECENT)
+        self.baseline += a * (raw_prob - self.baseline)
+        return score, self.recent - self.baseline
+
+    def export(self):
+        return {"count": self.count, "mean": list(self.mean), "var": list(self.var),
+                "recent": self.recent, "baseline": self.baseline}
+
+    def restore(self, state):
+        self.count = state["count"]
+        self.mean = list(state["mean"])
+        self.var = list(state["var"])
+        self.recent = state["recent"]
+        self.baseline = state["baseline"]
+
+
+class DriftMonitor:
+    """
+    Per-device DeviceStats plus the checks against the served model's
+    training ranges. Served like a batcher (ModelManager.start): setting
+    `model` re-reads the ranges. A device is only updated from its own
+    worker; the totals across devices are shared, hence the lock.
+    """
+
+    def __init__(self, margin=0.1, horizon=1000, z_threshold=6.0, min_samples=10):
+        self.margin = margin
+        self.horizon = horizon
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.devices = {}
+        self.shadow = None
+        self.stats = {"readings": 0, "ood": 0, "anomalous": 0}
+        self._checks = []
+        self._model = None
+        self._lock = threading.Lock()
+        self._reset_totals()
+
+    def _reset_totals(self):
+        self.count = 0
+        self.recent = self.baseline = self.ood_rate = 0.0
+
+    @property
+    def model(self):
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        ranges = training_ranges(model) or TRAINING_RANGES
+        checks = []
+        for name in model_features(model):
+            if name in ranges:
+                low, high = ranges[name]
+                slack = self.margin * (high - low)
+                checks.append((INPUT_FEATURES.index(name), low - slack, high + slack, name))
+        self._checks = checks
+        with self._lock:
+            self._reset_totals()
+
+    def update(self, device_id, row, raw_prob):
+        """
+        Checks a scored reading (`row`: its INPUT_FEATURES) and adds it to
+        the statistics. Returns the fields stored with the prediction.
+        """
+        ood = [name for i, low, high, name in self._checks if not low <= row[i] <= high]
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices.setdefault(device_id, DeviceStats())
+        score, drift = device.update(row, raw_prob, self.horizon, self.min_samples)
+
+        stats = self.stats
+        with self._lock:
+            count = self.count = self.count + 1
+            recent = count if count < GLOBAL_RECENT else GLOBAL_RECENT
+            self.recent += (raw_prob - self.recent) / recent
+            self.baseline += (raw_prob - self.baseline) / (count if count < GLOBAL_BASELINE else GLOBAL_BASELINE)
+            stats["readings"] += 1
+            if ood:
+                self.ood_rate += (1.0 - self.ood_rate) / recent
+                stats["ood"] += 1
+            else:
+                self.ood_rate -= self.ood_rate / recent
+            if score > self.z_threshold:
+                stats["anomalous"] += 1
+
+        fields = {"ood": bool(ood), "anomaly_score": round(score, 2), "prediction_drift": round(drift, 4)}
+        if ood:
+            fields["ood_features"] = ood
+        return fields
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, prediction_mean_recent=round(self.recent, 4),
+                        prediction_mean_baseline=round(self.baseline, 4),
+                        prediction_drift=round(self.recent - self.baseline, 4), ood_rate=round(self.ood_rate, 4))
+
+    def export(self, device_id):
+        stats = self.devices.get(device_id)
+        return stats.export() if stats is not None else None
+
+    def restore(self, device_id, state):
+        stats = DeviceStats()
+        stats.restore(state)
+        self.devices[device_id] = stats
+
+    def drop(self, device_id):
+        self.devices.pop(device_id, None)
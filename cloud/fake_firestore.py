@@ -0,0 +1,372 @@
+"""
+In-memory stand-in for `google.cloud.firestore.Client`.
+
+Implements the small subset of the Firestore API used by this project
+(collections, documents, simple queries, write batches, merges and the
+Increment / Maximum / Minimum transforms) so the subscriber and its writer
+can be exercised offline. FakeAsyncFirestoreClient does the same for
+`google.cloud.firestore.AsyncClient` (async_subscriber.py).
+"""
+
+import asyncio
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+
+class FakeFirestoreError(Exception):
+    """Raised by the fake client when a fault is injected."""
+
+
+class FakeInvalidArgument(FakeFirestoreError):
+    """A write Firestore rejects however often it is retried (like google.api_core's InvalidArgument)."""
+    code = 400
+
+
+FIELD_TYPES = (type(None), bool, int, float, str, bytes, datetime, list, dict)
+
+
+_transforms = None
+
+
+def _transform_types():
+    """Increment, Maximum, Minimum; imported on first use, the Firestore package is slow to import."""
+    global _transforms
+    if _transforms is None:
+        from google.cloud.firestore_v1.transforms import Increment, Maximum, Minimum
+        _transforms = (Increment, Maximum, Minimum)
+    return _transforms
+
+
+def _apply(current, value):
+    """Resolves a field write against the field's current value."""
+    Increment, Maximum, Minimum = _transform_types()
+    if isinstance(value, Increment):
+        return (current or 0) + value.value
+    if isinstance(value, Maximum):
+        return value.value if current is None else max(current, value.value)
+    if isinstance(value, Minimum):
+        return value.value if current is None else min(current, value.value)
+    if isinstance(value, dict):
+        return _merge({}, value, replace=True)
+    return value
+
+
+def _merge(target, data, replace=False):
+    """Merges `data` into `target` like set(merge=True): nested maps merge field by field."""
+    for key, value in data.items():
+        current = target.get(key)
+        if isinstance(value, dict) and isinstance(current, dict) and not replace:
+            _merge(current, value)
+        else:
+            target[key] = _apply(current, value)
+    return target
+
+
+def _check(data, path):
+    """Rejects values Firestore can't store, before any write of the batch is applied."""
+    for key, value in data.items():
+        if isinstance(value, dict):
+            _check(value, path)
+        elif not isinstance(value, FIELD_TYPES + _transform_types()):
+            raise FakeInvalidArgument(f"Cannot convert {type(value).__name__} to a Firestore value: {path}.{key}")
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = None if data is None else dict(data)
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection_name, doc_id):
+        self._client = client
+        self._collection_name = collection_name
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection_name}/{self.id}"
+
+    def set(self, data, merge=False):
+        self._client._commit([("set", self, data, merge)])
+
+    def update(self, data):
+        self._client._commit([("update", self, data, False)])
+
+    def delete(self):
+        self._client._commit([("delete", self, None, False)])
+
+    def get(self):
+        docs = self._client._collections.get(self._collection_name, {})
+        return FakeDocumentSnapshot(self, docs.get(self.id))
+
+
+def _field(doc_id, data, field):
+    """A document's value of `field`; "__name__" is the document id."""
+    return doc_id if field == "__name__" else data.get(field)
+
+
+class FakeQuery:
+    def __init__(self, client, collection_name, filters=(), orders=(), limit=None, start_after=None):
+        self._client = client
+        self._collection_name = collection_name
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        args = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "start_after": self._start_after,
+        }
+        args.update(changes)
+        return FakeQuery(self._client, self._collection_name, **args)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, fields):
+        """Cursor: {field: value} of the order_by fields, in order ("__name__" = document id)."""
+        return self._copy(start_after=dict(fields))
+
+    def _after_cursor(self, doc_id, data):
+        for field, direction in self._orders:
+            if field not in self._start_after:
+                break
+            value, cursor = _field(doc_id, data, field), self._start_after[field]
+            if value != cursor:
+                return value > cursor if direction == "ASCENDING" else value < cursor
+        return False
+
+    def stream(self):
+        ops = {
+            "==": lambda a, b: a == b,
+            "!=": lambda a, b: a != b,
+            "<": lambda a, b: a is not None and a < b,
+            "<=": lambda a, b: a is not None and a <= b,
+            ">": lambda a, b: a is not None and a > b,
+            ">=": lambda a, b: a is not None and a >= b,
+            "in": lambda a, b: a in b,
+        }
+        with self._client._lock:
+            docs = list(self._client._collections.get(self._collection_name, {}).items())
+
+        results = [
+            (doc_id, data) for doc_id, data in docs
+            if all(ops[op](data.get(field), value) for field, op, value in self._filters)
+        ]
+        # Apply orders from last to first so the first order_by wins (stable sort)
+        for field, direction in reversed(self._orders):
+            results.sort(key=lambda item: _field(*item, field), reverse=(direction == "DESCENDING"))
+        if self._start_after is not None:
+            results = [item for item in results if self._after_cursor(*item)]
+        if self._limit is not None:
+            results = results[:self._limit]
+
+        for doc_id, data in results:
+            ref = FakeDocumentReference(self._client, self._collection_name, doc_id)
+            yield FakeDocumentSnapshot(ref, data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._client, self.id, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return time.time(), ref
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(("set", reference, data, merge))
+
+    def update(self, reference, data):
+        self._ops.append(("update", reference, data, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False))
+
+    def commit(self):
+        self._client._commit(self._ops)
+        return [time.time()] * len(self._ops)
+
+
+class FakeFirestoreClient:
+    """
+    Thread-safe in-memory Firestore client.
+
+    Fault injection for offline testing:
+    - `latency`: seconds slept on every commit (simulates a slow network)
+    - `fail_next(n)`: make the next `n` commits raise FakeFirestoreError
+    - `fail_rate`: probability that any commit fails
+    - `outage(seconds)`: every commit fails for a while
+    - a value Firestore can't store (e.g. a set) fails its commit with
+      FakeInvalidArgument, a permanent error
+    """
+
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=None):
+        self._collections = {}
+        self._lock = threading.Lock()
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self._fail_next = 0
+        self._outage_until = 0.0
+        self._random = random.Random(seed)
+        self.commit_count = 0
+        self.write_count = 0
+        self.failed_commits = 0
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def document(self, path):
+        collection_name, doc_id = path.split("/", 1)
+        return FakeDocumentReference(self, collection_name, doc_id)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def fail_next(self, n=1):
+        self._fail_next += n
+
+    def outage(self, seconds):
+        """Every commit fails for the next `seconds` (simulates Firestore being unreachable)."""
+        self._outage_until = time.monotonic() + seconds
+
+    def _commit(self, ops):
+        if self.latency:
+            time.sleep(self.latency)
+        self._apply_ops(ops)
+
+    def _apply_ops(self, ops):
+        with self._lock:
+            if time.monotonic() < self._outage_until:
+                self.failed_commits += 1
+                raise FakeFirestoreError("Injected Firestore outage")
+            if self._fail_next > 0 or (self.fail_rate and self._random.random() < self.fail_rate):
+                self._fail_next = max(0, self._fail_next - 1)
+                self.failed_commits += 1
+                raise FakeFirestoreError("Injected Firestore failure")
+            for op, ref, data, merge in ops:
+                if data is not None:
+                    _check(data, ref.path)
+
+            for op, ref, data, merge in ops:
+                docs = self._collections.setdefault(ref._collection_name, {})
+                if op == "set":
+                    if merge and ref.id in docs:
+                        _merge(docs[ref.id], data)
+                    else:
+                        docs[ref.id] = _merge({}, data)
+                elif op == "update":
+                    if ref.id not in docs:
+                        raise FakeFirestoreError(f"No document to update: {ref.path}")
+                    _merge(docs[ref.id], data, replace=True)
+                elif op == "delete":
+                    docs.pop(ref.id, None)
+            self.commit_count += 1
+            self.write_count += len(ops)
+
+    # Helpers for inspection in tests and benchmarks
+    def documents(self, collection_name):
+        with self._lock:
+            return {k: dict(v) for k, v in self._collections.get(collection_name, {}).items()}
+
+    def count(self, collection_name):
+        with self._lock:
+            return len(self._collections.get(collection_name, {}))
+
+
+class FakeAsyncQuery:
+    """Async view of a FakeQuery: `get()` is a coroutine, `stream()` an async iterator."""
+
+    def __init__(self, query):
+        self._query = query
+
+    def where(self, *args, **kwargs):
+        return FakeAsyncQuery(self._query.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return FakeAsyncQuery(self._query.order_by(*args, **kwargs))
+
+    def limit(self, count):
+        return FakeAsyncQuery(self._query.limit(count))
+
+    async def stream(self):
+        for snapshot in self._query.stream():
+            yield snapshot
+
+    async def get(self):
+        return self._query.get()
+
+
+class FakeAsyncCollectionReference(FakeAsyncQuery):
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.id = collection.id
+
+    def document(self, doc_id=None):
+        return self._query.document(doc_id)
+
+
+class FakeAsyncWriteBatch(FakeWriteBatch):
+    async def commit(self):
+        if self._client.latency:
+            # Waits without blocking the event loop, so commits overlap
+            await asyncio.sleep(self._client.latency)
+        self._client._apply_ops(self._ops)
+        return [time.time()] * len(self._ops)
+
+
+class FakeAsyncFirestoreClient(FakeFirestoreClient):
+    """
+    In-memory stand-in for `google.cloud.firestore.AsyncClient`: queries and
+    batch commits are awaitable. Same fault injection as FakeFirestoreClient;
+    `latency` is awaited instead of slept. Document references stay
+    synchronous (only batches and queries are used asynchronously).
+    """
+
+    def collection(self, name):
+        return FakeAsyncCollectionReference(super().collection(name))
+
+    def batch(self):
+        return FakeAsyncWriteBatch(self)
@@ -0,0 +1,259 @@
+"""
+Streaming features over per-device sliding windows.
+
+A single reading says how hot a motor is, not that it has been heating up
+for the last minute. Each device keeps a ring buffer of its last `size`
+readings (an `array` of doubles) plus running sums over it. A new reading
+adds its terms and subtracts those of the reading it evicts, so the
+features cost O(1) per sample and nothing is read back from Firestore:
+
+    temperature_slope   °C per minute, least-squares slope over the window
+    vibration_mean      m/s², mean over the window
+    vibration_std       m/s², standard deviation over the window
+    rpm_drop_rate       rpm per minute the speed is falling (0 when steady or rising)
+
+Times are the readings' own timestamps, relative to the window, so epoch
+seconds and the ESP32's uptime seconds both work; a timestamp going
+backwards (device reboot) starts a new window. Slopes stay 0 until the
+window holds `min_samples` readings. Once per window the sums are rebuilt
+from the buffer, which keeps floating-point drift bounded.
+
+The subscribers use FeatureState (online, one window per device);
+training and replays run history_features over stored readings, which
+goes through the same DeviceWindow code, so a model sees the same values
+in both.
+"""
+
+import math
+import threading
+from array import array
+import numpy as np
+
+# Model input columns, in the order the subscribers build them
+BASE_FEATURES = ["temperature", "vibration", "rpm"]
+WINDOW_FEATURES = ["temperature_slope", "vibration_mean", "vibration_std", "rpm_drop_rate"]
+INPUT_FEATURES = BASE_FEATURES + WINDOW_FEATURES
+
+
+def input_columns(features):
+    """Indexes of `features` in a full input row (INPUT_FEATURES)."""
+    unknown = [name for name in features if name not in INPUT_FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown model features {unknown}, expected some of {INPUT_FEATURES}")
+    return [INPUT_FEATURES.index(name) for name in features]
+
+
+class DeviceWindow:
+    """One device's last `size` readings and the running sums over them."""
+
+    __slots__ = ("size", "min_samples", "buffer", "count", "head", "origin", "last", "updates",
+                 "st", "stt", "s_temp", "st_temp", "s_vib", "s_vib2", "s_rpm", "st_rpm")
+
+    def __init__(self, size=30, min_samples=5):
+        if size < 2:
+            raise ValueError("Feature window needs at least 2 readings")
+        self.size = size
+        self.min_samples = max(2, min(min_samples, size))
+        # time, temperature, vibration, rpm per slot
+        self.buffer = array("d", bytes(8 * 4 * size))
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.head = 0
+        self.origin = None
+        self.last = None
+        self.updates = 0
+        self.st = self.stt = 0.0
+        self.s_temp = self.st_temp = 0.0
+        self.s_vib = self.s_vib2 = 0.0
+        self.s_rpm = self.st_rpm = 0.0
+
+    def update(self, timestamp, temperature, vibration, rpm):
+        """Adds a reading (evicting the oldest once full) and returns the window features."""
+        if self.last is not None and timestamp < self.last:
+            self.reset()
+        if self.origin is None:
+            self.origin = timestamp
+        self.last = timestamp
+        t = float(timestamp - self.origin)
+        temperature, vibration, rpm = float(temperature), float(vibration), float(rpm)
+
+        b, i = self.buffer, self.head * 4
+        if self.count == self.size:
+            old_t, old_temp, old_vib, old_rpm = b[i], b[i + 1], b[i + 2], b[i + 3]
+            self.st -= old_t
+            self.stt -= old_t * old_t
+            self.s_temp -= old_temp
+            self.st_temp -= old_t * old_temp
+            self.s_vib -= old_vib
+            self.s_vib2 -= old_vib * old_vib
+            self.s_rpm -= old_rpm
+            self.st_rpm -= old_t * old_rpm
+        else:
+            self.count += 1
+        b[i], b[i + 1], b[i + 2], b[i + 3] = t, temperature, vibration, rpm
+        self.st += t
+        self.stt += t * t
+        self.s_temp += temperature
+        self.st_temp += t * temperature
+        self.s_vib += vibration
+        self.s_vib2 += vibration * vibration
+        self.s_rpm += rpm
+        self.st_rpm += t * rpm
+        self.head = (self.head + 1) % self.size
+
+        self.updates += 1
+        if self.updates % self.size == 0:
+            self._rebase()
+        return self.features()
+
+    def _rebase(self):
+        """Times relative to the oldest reading again, sums rebuilt from the buffer (O(size), once per window)."""
+        b = self.buffer
+        slots = self._slots()
+        shift = b[slots[0] * 4]
+        self.origin += shift
+        self.st = self.stt = self.s_temp = self.st_temp = 0.0
+        self.s_vib = self.s_vib2 = self.s_rpm = self.st_rpm = 0.0
+        for slot in slots:
+            i = slot * 4
+            t = b[i] - shift
+            b[i] = t
+            temperature, vibration, rpm = b[i + 1], b[i + 2], b[i + 3]
+            self.st += t
+            self.stt += t * t
+            self.s_temp += temperature
+            self.st_temp += t * temperature
+            self.s_vib += vibration
+            self.s_vib2 += vibration * vibration
+            self.s_rpm += rpm
+            self.st_rpm += t * rpm
+
+    def _slots(self):
+        """Buffer slots in use, oldest first."""
+        if self.count < self.size:
+            return range(self.count)
+        return [(self.head + k) % self.size for k in range(self.size)]
+
+    def features(self):
+        """(temperature_slope, vibration_mean, vibration_std, rpm_drop_rate) of the current window."""
+        n = self.count
+        if n == 0:
+            return (0.0, 0.0, 0.0, 0.0)
+        vib_mean = self.s_vib / n
+        vib_std = math.sqrt(max(0.0, self.s_vib2 / n - vib_mean * vib_mean))
+        denom = n * self.stt - self.st * self.st
+        # All readings in the same second carry no slope
+        if n < self.min_samples or denom <= 1e-6 * n * n:
+            return (0.0, vib_mean, vib_std, 0.0)
+        temp_slope = 60.0 * (n * self.st_temp - self.st * self.s_temp) / denom
+        rpm_slope = 60.0 * (n * self.st_rpm - self.st * self.s_rpm) / denom
+        return (temp_slope, vib_mean, vib_std, max(0.0, -rpm_slope))
+
+    def copy(self):
+        """An independent window with the same readings and sums."""
+        window = DeviceWindow.__new__(DeviceWindow)
+        for name in self.__slots__:
+            setattr(window, name, getattr(self, name))
+        window.buffer = array("d", self.buffer)
+        return window
+
+    def export(self):
+        """The window as plain data, oldest reading first (see cluster.py)."""
+        b = self.buffer
+        return {"readings": [[self.origin + b[s * 4], b[s * 4 + 1], b[s * 4 + 2], b[s * 4 + 3]]
+                             for s in self._slots()]}
+
+    def restore(self, state):
+        self.reset()
+        for reading in state["readings"]:
+            self.update(*reading)
+
+
+class FeatureState:
+    """
+    One DeviceWindow per device, created on first use. Updated from the
+    thread that receives readings while cluster handoffs export and
+    restore from worker threads, hence the lock.
+    """
+
+    def __init__(self, size=30, min_samples=5):
+        self.size = size
+        self.min_samples = min_samples
+        self.devices = {}
+        self._lock = threading.Lock()
+
+    def update(self, device_id, timestamp, temperature, vibration, rpm):
+        """Adds a reading and returns the device's window features (a tuple in WINDOW_FEATURES order)."""
+        with self._lock:
+            window = self.devices.get(device_id)
+            if window is None:
+                window = self.devices[device_id] = DeviceWindow(self.size, self.min_samples)
+            return window.update(timestamp, temperature, vibration, rpm)
+
+    def row(self, device_id, timestamp, temperature, vibration, rpm):
+        """A full model input row (INPUT_FEATURES) for the reading."""
+        return [temperature, vibration, rpm, *self.update(device_id, timestamp, temperature, vibration, rpm)]
+
+    def preview_rows(self, readings):
+        """
+        Full input rows for (device_id, timestamp, temperature, vibration, rpm)
+        readings, in order, as `row` would return them, without changing any
+        window: for a caller that only `update`s once the rows were scored.
+        """
+        windows = {}
+        with self._lock:
+            for device_id, *_ in readings:
+                if device_id not in windows:
+                    window = self.devices.get(device_id)
+                    windows[device_id] = (window.copy() if window is not None
+                                          else DeviceWindow(self.size, self.min_samples))
+        return [[temperature, vibration, rpm, *windows[device_id].update(timestamp, temperature, vibration, rpm)]
+                for device_id, timestamp, temperature, vibration, rpm in readings]
+
+    def export(self, device_id):
+        with self._lock:
+            window = self.devices.get(device_id)
+            return window.export() if window is not None else None
+
+    def restore(self, device_id, state, recent=()):
+        """
+        Replaces a device's window with an exported one, then re-applies the
+        `recent` readings (seen here since, oldest first).
+        """
+        window = DeviceWindow(self.size, self.min_samples)
+        window.restore(state)
+        with self._lock:
+            for reading in recent:
+                window.update(*reading)
+            self.devices[device_id] = window
+
+    def drop(self, device_id):
+        with self._lock:
+            self.devices.pop(device_id, None)
+
+
+def history_features(device_ids, timestamps, X, size=30, min_samples=5):
+    """
+    Window features for stored readings (offline: training, replays), as a
+    float array with one row per reading in WINDOW_FEATURES order. Rows
+    are fed to one DeviceWindow per device in the order given, so pass
+    them sorted by time; X holds the BASE_FEATURES columns.
+    """
+    X = np.asarray(X, dtype=float)
+    out = np.empty((len(X), len(WINDOW_FEATURES)))
+    windows = {}
+    for i, (device_id, timestamp, (temperature, vibration, rpm)) in enumerate(
+            zip(np.asarray(device_ids).tolist(), np.asarray(timestamps, dtype=float).tolist(), X[:, :3].tolist())):
+        window = windows.get(device_id)
+        if window is None:
+            window = windows[device_id] = DeviceWindow(size, min_samples)
+        out[i] = window.update(timestamp, temperature, vibration, rpm)
+    return out
+
+
+def input_rows(device_ids, timestamps, X, size=30, min_samples=5):
+    """BASE_FEATURES columns of X followed by their window features (INPUT_FEATURES)."""
+    X = np.asarray(X, dtype=float)
+    return np.hstack([X[:, :3], history_features(device_ids, timestamps, X, size, min_samples)])
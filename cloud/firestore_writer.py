@@ -0,0 +1,419 @@
+"""
+Batched, asynchronous Firestore writer.
+
+Documents are queued by the MQTT processing code and committed in the
+background with Firestore `WriteBatch` commits, either when a batch is full
+or when its oldest document reaches the age limit.
+
+AsyncFirestoreWriter is the asyncio counterpart for `firestore.AsyncClient`
+(async_subscriber.py).
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from metrics import Histogram
+
+log = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_MAX_BATCH = 500
+
+# Storage modes: "split" keeps the original sensor_data + predictions pair
+# (joined on sensor_data_id), "combined" writes one `readings` document
+STORAGE_MODES = ("split", "combined")
+READINGS_COLLECTION = "readings"
+# Optional prediction fields joined into a reading besides failure_probability (drift.py adds the last four)
+PREDICTION_FIELDS = ("raw_failure_probability", "ood", "ood_features", "anomaly_score", "prediction_drift")
+
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+class BatchedFirestoreWriter:
+    """
+    Buffers writes in a bounded queue and flushes them from a background thread.
+
+    Each queued item is a *group* of writes that always lands in the same
+    batch, in order (e.g. a sensor_data document followed by its prediction).
+
+    overflow_policy controls what happens when the queue is full:
+    - "block":       wait up to `block_timeout` seconds for space, then drop
+    - "drop_newest": drop the incoming group
+    - "drop_oldest": discard the oldest queued group to make room
+    """
+
+    STATS = ("enqueued", "written", "dropped", "failed", "commits", "retries")
+
+    def __init__(self, db, max_batch_size=400, max_batch_age=1.0, max_queue_size=10000,
+                 overflow_policy="block", block_timeout=5.0, max_retries=5,
+                 backoff_base=0.5, backoff_max=10.0, on_failure=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.db = db
+        self.max_batch_size = min(max_batch_size, FIRESTORE_MAX_BATCH)
+        self.max_batch_age = max_batch_age
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Called with the list of failed write groups once retries are exhausted
+        self.on_failure = on_failure
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stats = dict.fromkeys(self.STATS, 0)
+        # Producers and the writer thread both update the stats
+        self._stats_lock = threading.Lock()
+        # Groups queued or in flight, used by flush()
+        self._pending = 0
+        self._idle = threading.Condition()
+        self.commit_latency = Histogram("firestore_commit_seconds", "Firestore WriteBatch commit latency")
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="firestore-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- Producer side ----------
+    def write(self, writes, block=True):
+        """
+        Queues a group of writes: a list of (document_reference, data) tuples,
+        or (document_reference, data, merge) for set(..., merge=True) writes.
+        Returns False if the group was dropped because the queue is full.
+        `block=False` never waits for room, even with the "block" policy
+        (for callers on an event loop).
+        """
+        group = list(writes)
+        if len(group) > self.max_batch_size:
+            raise ValueError("Write group is larger than the batch size")
+
+        self._add_pending(1)
+        try:
+            if self.overflow_policy == "block" and block:
+                self.queue.put(group, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(group)
+        except queue.Full:
+            if self.overflow_policy != "drop_oldest":
+                self._drop(1)
+                return False
+            try:
+                self.queue.get_nowait()
+                self._drop(1)
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(group)
+            except queue.Full:
+                self._drop(1)
+                return False
+
+        self._count(enqueued=1)
+        return True
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def _add_pending(self, count):
+        with self._idle:
+            self._pending += count
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _drop(self, count):
+        self._count(dropped=count)
+        self._add_pending(-count)
+
+    def write_reading(self, sensor_doc, prediction_doc):
+        """
+        Queues a sensor_data document and its prediction as one ordered group.
+        The sensor_data id is allocated client-side so the prediction can
+        reference it before anything is committed. Returns the sensor_data id.
+        """
+        group = reading_group(self.db, sensor_doc, prediction_doc)
+        self.write(group)
+        return group[0][0].id
+
+    def write_combined_reading(self, reading_doc, doc_id=None):
+        """
+        Queues one `readings` document holding the raw values and the raw
+        and smoothed probability (STORAGE_MODE=combined). Returns its id.
+        """
+        ref = self.db.collection(READINGS_COLLECTION).document(doc_id)
+        self.write([(ref, reading_doc)])
+        return ref.id
+
+    def depth(self):
+        return self.queue.qsize()
+
+    # ---------- Flush loop ----------
+    def _collect_batch(self):
+        """Blocks for the first group, then gathers more until size or age limit."""
+        try:
+            first = self.queue.get(timeout=0.2)
+        except queue.Empty:
+            return []
+
+        groups = [first]
+        size = len(first)
+        deadline = time.monotonic() + self.max_batch_age
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not self._stopping.is_set():
+                break
+            try:
+                if self._stopping.is_set():
+                    group = self.queue.get_nowait()
+                else:
+                    group = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(group) > self.max_batch_size:
+                # Keep the group intact: it starts the next batch
+                self._commit(groups)
+                groups, size = [], 0
+            groups.append(group)
+            size += len(group)
+        return groups
+
+    def _commit_once(self, groups):
+        """One WriteBatch commit attempt for `groups` (raises on failure)."""
+        batch = self.db.batch()
+        for group in groups:
+            for ref, data, *merge in group:
+                batch.set(ref, data, merge=bool(merge and merge[0]))
+        with self.commit_latency.time():
+            batch.commit()
+
+    def _commit(self, groups):
+        if not groups:
+            return
+        attempt = 0
+        while True:
+            try:
+                self._commit_once(groups)
+                self._count(commits=1, written=sum(len(g) for g in groups))
+                self._add_pending(-len(groups))
+                return
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    log.error(f"❌ Firestore batch failed after {self.max_retries} retries: {e}")
+                    self._count(failed=len(groups))
+                    if self.on_failure:
+                        self.on_failure(groups)
+                    self._add_pending(-len(groups))
+                    return
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+                self._count(retries=1)
+                log.warning(f"⚠️ Firestore batch commit failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            self._commit(self._collect_batch())
+
+    def flush(self, timeout=None):
+        """Waits until everything queued so far has been committed (or failed)."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=30.0):
+        """Stops the flush loop after draining the queue."""
+        self._stopping.set()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+
+class AsyncFirestoreWriter:
+    """
+    Firestore writes for asyncio code, over a `firestore.AsyncClient`.
+
+    Instead of collecting groups into large batches on one thread, every
+    group is committed as its own WriteBatch right away and up to
+    `max_in_flight` commits are awaited concurrently, so the latency of one
+    commit doesn't hold up the next. Failed commits are retried with
+    backoff like in BatchedFirestoreWriter.
+
+    `await commit(group)` / `await write_reading(...)` wait for the commit;
+    `write(group)` (used by RollupAggregator) schedules it and returns, and
+    `await flush()` waits for everything scheduled.
+    """
+
+    def __init__(self, db, max_in_flight=256, max_retries=5, backoff_base=0.5, backoff_max=10.0):
+        self.db = db
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "commits": 0,
+            "retries": 0,
+        }
+        self.commit_latency = Histogram("firestore_commit_seconds", "Firestore WriteBatch commit latency")
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+
+    async def commit(self, writes):
+        """Commits one group of writes (same tuples as BatchedFirestoreWriter.write). Returns success."""
+        group = list(writes)
+        if len(group) > FIRESTORE_MAX_BATCH:
+            raise ValueError("Write group is larger than the batch size")
+        self.stats["enqueued"] += 1
+
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                batch = self.db.batch()
+                for ref, data, *merge in group:
+                    batch.set(ref, data, merge=bool(merge and merge[0]))
+                try:
+                    with self.commit_latency.time():
+                        await batch.commit()
+                    self.stats["commits"] += 1
+                    self.stats["written"] += len(group)
+                    return True
+                except Exception as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        log.error(f"❌ Firestore commit failed after {self.max_retries} retries: {e}")
+                        self.stats["failed"] += 1
+                        return False
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+                    self.stats["retries"] += 1
+                    log.warning(f"⚠️ Firestore commit failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    def write(self, writes):
+        """Schedules a commit without waiting for it (must be called on the event loop)."""
+        task = asyncio.get_running_loop().create_task(self.commit(writes))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def write_reading(self, sensor_doc, prediction_doc):
+        """Commits a sensor_data document and its prediction in one batch. Returns the sensor_data id."""
+        group = reading_group(self.db, sensor_doc, prediction_doc)
+        await self.commit(group)
+        return group[0][0].id
+
+    async def write_combined_reading(self, reading_doc, doc_id=None):
+        """Commits one `readings` document (STORAGE_MODE=combined). Returns its id."""
+        ref = self.db.collection(READINGS_COLLECTION).document(doc_id)
+        await self.commit([(ref, reading_doc)])
+        return ref.id
+
+    def depth(self):
+        """Commits scheduled with write() that haven't finished."""
+        return len(self._tasks)
+
+    async def flush(self):
+        """Waits for every commit scheduled with write()."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+class LazyClient:
+    """
+    A Firestore client created on first use: `factory()` runs once, on
+    whichever thread touches the client first, and every attribute is the
+    client's. Importing google-cloud-firestore and finding credentials
+    takes a while, so the subscriber does it off its startup path.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def reading_group(db, sensor_doc, prediction_doc):
+    """
+    The write group for a sensor_data document and its prediction
+    (STORAGE_MODE=split): the sensor_data id is allocated client-side and
+    stored on the prediction as sensor_data_id.
+    """
+    sensor_ref = db.collection("sensor_data").document()
+    prediction_ref = db.collection("predictions").document()
+    prediction_doc = dict(prediction_doc, sensor_data_id=sensor_ref.id)
+    return [(sensor_ref, sensor_doc), (prediction_ref, prediction_doc)]
+
+
+def iter_readings(db, storage_mode="split", since=None, device_id=None, until=None, unpaired=False):
+    """
+    Yields every stored reading (at or after `since`, before `until`) as
+    (reading_id, reading, prediction_id), where `reading` has the combined
+    document fields whatever the storage mode. In split mode the pairs are joined on sensor_data_id (readings
+    without a prediction are skipped, or with `unpaired` yielded with prediction_id None, e.g. readings
+    the model failed on) and reading_id is the sensor_data id; prediction_id is None in combined mode.
+    """
+    def query(name):
+        q = db.collection(name)
+        if since is not None:
+            q = q.where("timestamp", ">=", since)
+        if until is not None:
+            q = q.where("timestamp", "<", until)
+        if device_id is not None:
+            q = q.where("device_id", "==", device_id)
+        return q.stream()
+
+    if storage_mode == "combined":
+        for snapshot in query(READINGS_COLLECTION):
+            yield snapshot.id, snapshot.to_dict(), None
+        return
+
+    predictions = {}
+    for snapshot in query("predictions"):
+        prediction = snapshot.to_dict()
+        if prediction.get("sensor_data_id"):
+            predictions[prediction["sensor_data_id"]] = (snapshot.id, prediction)
+
+    for snapshot in query("sensor_data"):
+        match = predictions.get(snapshot.id)
+        if match is None:
+            if unpaired:
+                yield snapshot.id, snapshot.to_dict(), None
+            continue
+        prediction_id, prediction = match
+        reading = snapshot.to_dict()
+        reading["failure_probability"] = prediction.get("failure_probability")
+        for field in PREDICTION_FIELDS:
+            if field in prediction:
+                reading[field] = prediction[field]
+        if not reading.get("device_id") and prediction.get("device_id"):
+            reading["device_id"] = prediction["device_id"]
+        yield snapshot.id, reading, prediction_id
+
+
+def delete_documents(db, refs, batch_size=FIRESTORE_MAX_BATCH):
+    """Deletes document references with WriteBatch commits. Returns the count."""
+    deleted = 0
+    batch = db.batch()
+    for ref in refs:
+        batch.delete(ref)
+        if len(batch) >= batch_size:
+            batch.commit()
+            deleted += len(batch)
+            batch = db.batch()
+    if len(batch):
+        batch.commit()
+        deleted += len(batch)
+    return deleted
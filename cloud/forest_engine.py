@@ -0,0 +1,142 @@
+"""
+Flattened RandomForest inference engine.
+
+`export_forest` turns a fitted sklearn RandomForestClassifier into a handful
+of flat NumPy arrays (one concatenated node table for all trees).
+`CompiledForest` evaluates those arrays with pure NumPy, stepping every tree
+for every row of a batch at once. It needs neither sklearn nor pickle, and
+avoids sklearn's per-call validation and per-tree dispatch overhead.
+
+Usage (from the cloud/ folder):
+    python forest_engine.py ml-model/motor_model.pkl ml-model/motor_model.npz
+"""
+
+import sys
+import numpy as np
+
+TREE_LEAF = -1
+
+
+def export_forest(model, path=None):
+    """
+    Flattens a fitted RandomForestClassifier into NumPy arrays.
+
+    sklearn builds trees depth-first, so a left child is always `node + 1` and
+    only the right children need storing. Leaves point to themselves and
+    compare against -inf (always "go right"), so a fixed number of traversal
+    steps leaves every row on a leaf without any branching.
+    Returns the arrays and saves them as .npz if `path` is given.
+    """
+    features, thresholds, rights, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    positive = list(model.classes_).index(1) if 1 in list(model.classes_) else 1
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        node_ids = np.arange(n)
+        is_leaf = tree.children_left == TREE_LEAF
+        if not np.array_equal(tree.children_left[~is_leaf], node_ids[~is_leaf] + 1):
+            raise ValueError("Unsupported tree layout: left child is not node + 1")
+
+        counts = tree.value[:, 0, :]
+        totals = counts.sum(axis=1)
+        totals[totals == 0] = 1.0
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, -np.inf, tree.threshold))
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        values.append(counts[:, positive] / totals)
+        roots.append(offset)
+
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "right": np.concatenate(rights).astype(np.int32),
+        "value": np.concatenate(values).astype(np.float64),
+        "roots": np.array(roots, dtype=np.int32),
+        "max_depth": np.array(max_depth, dtype=np.int32),
+        "n_features": np.array(model.n_features_in_, dtype=np.int32),
+    }
+    if path:
+        np.savez(path, **arrays)
+    return arrays
+
+
+class CompiledForest:
+    """Drop-in replacement for the forest's predict_proba, built from exported arrays."""
+
+    def __init__(self, arrays, manifest=None):
+        self.feature = np.asarray(arrays["feature"], dtype=np.intp)
+        self.threshold = np.asarray(arrays["threshold"])
+        self.right = np.asarray(arrays["right"], dtype=np.intp)
+        self.value = np.asarray(arrays["value"])
+        self.roots = np.asarray(arrays["roots"], dtype=np.intp)
+        self.max_depth = int(arrays["max_depth"])
+        self.n_features_in_ = int(arrays["n_features"])
+        self.classes_ = np.array([0.0, 1.0])
+        # Versioned artifact description (model_store.py), None for a bare .npz
+        self.manifest = manifest
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        with np.load(path, mmap_mode=mmap_mode) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def predict_positive(self, X):
+        """Failure (class 1) probability for each row of X."""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows = X.shape[0]
+        flat_X = X.ravel()
+
+        # One column per tree, one row per sample
+        nodes = np.broadcast_to(self.roots, (n_rows, self.roots.size)).copy()
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * self.n_features_in_)[:, None]
+        for _ in range(self.max_depth):
+            go_left = flat_X[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, nodes + 1, self.right[nodes])
+
+        return self.value[nodes].mean(axis=1)
+
+    def predict_proba(self, X):
+        positive = self.predict_positive(X)
+        return np.column_stack([1.0 - positive, positive])
+
+
+if __name__ == "__main__":
+    import pickle
+    import time
+
+    src = sys.argv[1] if len(sys.argv) > 1 else "ml-model/motor_model.pkl"
+    dst = sys.argv[2] if len(sys.argv) > 2 else "ml-model/motor_model.npz"
+
+    with open(src, "rb") as f:
+        model = pickle.load(f)
+    arrays = export_forest(model, dst)
+    compiled = CompiledForest.load(dst)
+    print(f"✓ Exported {len(arrays['roots'])} trees / {arrays['feature'].size} nodes to {dst}")
+
+    # Check the compiled engine against sklearn
+    rng = np.random.default_rng(0)
+    X = np.column_stack([
+        rng.uniform(0, 100, 5000),
+        rng.uniform(0, 10, 5000),
+        rng.uniform(0, 3500, 5000),
+    ])
+    diff = np.abs(model.predict_proba(X)[:, 1] - compiled.predict_positive(X)).max()
+    print(f"✓ Max probability difference vs sklearn: {diff:.2e}")
+    if diff > 1e-9:
+        print("❌ Compiled forest does not match sklearn")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    for row in X[:200]:
+        compiled.predict_proba(row.reshape(1, -1))
+    print(f"✓ Single-row latency: {(time.perf_counter() - start) / 200 * 1000:.3f} ms")
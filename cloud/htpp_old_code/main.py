@@ -1,129 +1,243 @@
-import pickle
+"""
+Motor Health HTTP API.
+
+POST /predict scores one reading (the original HTTP ingestion path),
+POST /predict/batch scores many readings (of one or many devices) in one
+call, and the read API under /api (query_api.py) serves the dashboard's
+statistics, chart series, reading lists and CSV export.
+
+Readings go through the same steps as in the MQTT subscriber: window
+features, the served model (model registry, hot reload), per-device
+smoothing in memory and alert state. Only scoring is on the response
+path. The Firestore documents are queued on the batched writer and
+Telegram alerts on the notifier's thread (one pooled session), so a
+response never waits on either: a request gets a 503 instead when the
+Firestore queue is full. Concurrent /predict requests share
+micro-batched inference; a batch is scored in one vectorized call and its
+documents are committed in one Firestore batch.
+
+Run (from the cloud/ folder):
+    uvicorn htpp_old_code.main:app --host 0.0.0.0 --port 8080
+"""
+
+import asyncio
+import logging
 import os
-import numpy as np
-from fastapi import FastAPI
-from pydantic import BaseModel
-from google.cloud import firestore
+import sys
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-import requests
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Telegram Configuration
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-
-def send_failure_notification(probability, sensor_data):
-    """Sends a Telegram notification for high failure risk."""
-    failure_time = datetime.fromtimestamp(sensor_data.timestamp).strftime('%Y-%m-%d %H:%M:%S')
-    
-    message = (
-        f"🚨 *CRITICAL WARNING: Motor Failure Detected* 🚨\n\n"
-        f"⏰ **Time:** {failure_time}\n"
-        f"⚠️ **Failure Probability:** {probability:.1%}\n\n"
-        f"📊 **Sensor Readings:**\n"
-        f"• Temperature: {sensor_data.temperature:.1f} °C\n"
-        f"• Vibration: {sensor_data.vibration:.3f} m/s²\n"
-        f"• RPM: {sensor_data.rpm:.0f}\n\n"
-        f"Please check the equipment immediately!"
-    )
-    
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": message,
-        "parse_mode": "Markdown"
-    }
-    
+import numpy as np
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel, Field
+
+# Shared modules (query_api.py, config.py, ...) live in cloud/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import *  # noqa: F401,F403
+from alerts import AlertManager, TelegramNotifier
+from features import FeatureState
+from firestore_writer import BatchedFirestoreWriter, FIRESTORE_MAX_BATCH, READINGS_COLLECTION, reading_group
+from inference import AsyncMicroBatcher, predict as predict_rows
+from model_manager import ModelManager
+from query_api import ReadStore, make_router
+from rollups import RollupAggregator
+from smoothing import DEFAULT_DEVICE_ID, SmoothingState
+from metrics import setup_logging
+
+setup_logging(LOG_LEVEL, LOG_FORMAT)
+log = logging.getLogger("api")
+
+# Readings per /predict/batch request: all of their documents fit one Firestore batch
+MAX_BATCH_READINGS = min(FIRESTORE_BATCH_SIZE, FIRESTORE_MAX_BATCH) // (1 if STORAGE_MODE == "combined" else 2)
+
+if FIRESTORE_BACKEND == "fake":
+    from fake_firestore import FakeFirestoreClient
+    db = FakeFirestoreClient()
+else:
+    from google.cloud import firestore
+    db = firestore.Client()
+
+models = ModelManager(MODEL_PATH, MODEL_FALLBACK_PATH, mode=MODEL_RELOAD,
+                      watch_interval=MODEL_WATCH_INTERVAL, threshold=API_ALERT_RAISE_THRESHOLD)
+batcher = AsyncMicroBatcher(models.model, INFERENCE_BATCH_WINDOW_MS / 1000.0, INFERENCE_MAX_BATCH)
+feature_state = FeatureState(FEATURE_WINDOW, FEATURE_MIN_SAMPLES)
+smoothing = SmoothingState(SMOOTHING_METHOD, SMOOTHING_WINDOW, SMOOTHING_ALPHA)
+alerts = AlertManager(
+    TelegramNotifier(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_API_URL),
+    raise_threshold=API_ALERT_RAISE_THRESHOLD,
+    clear_threshold=ALERT_CLEAR_THRESHOLD,
+    cooldown=ALERT_COOLDOWN,
+    digest_window=ALERT_DIGEST_WINDOW,
+)
+writer = BatchedFirestoreWriter(
+    db,
+    max_batch_size=FIRESTORE_BATCH_SIZE,
+    max_batch_age=FIRESTORE_BATCH_AGE,
+    max_queue_size=FIRESTORE_QUEUE_SIZE,
+    overflow_policy=FIRESTORE_OVERFLOW_POLICY,
+)
+rollups = RollupAggregator(writer, ROLLUP_RESOLUTIONS, ROLLUP_FLUSH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
     try:
-        response = requests.post(url, json=payload, timeout=5)
-        print(f"Telegram notification sent: status={response.status_code}, response={response.text[:100]}")
+        seeded = smoothing.seed_from_firestore(db, READINGS_COLLECTION if STORAGE_MODE == "combined" else "predictions")
+        log.info(f"✅ Rolling windows seeded for {seeded} device(s)")
     except Exception as e:
-        print(f"Failed to send Telegram notification: {e}")
+        log.warning(f"⚠️ Could not seed rolling window from Firestore: {e}")
+    models.start([batcher])
+    batcher.start()
+    log.info(f"✅ Serving model {models.version}")
+    yield
+    # Score what is in flight, then drain the side effects
+    await batcher.close()
+    models.close()
+    rollups.close()
+    writer.close()
+    alerts.close()
+    log.info(f"✅ Shutdown complete, Firestore writer: {writer.stats}")
+
 
-app = FastAPI()
-db = firestore.Client()
+app = FastAPI(lifespan=lifespan)
+
+# Dashboard read API: aggregates from the rollups, paginated readings, CSV export
+store = ReadStore(db, STORAGE_MODE, API_CACHE_TTL, API_CACHE_SIZE)
+app.include_router(make_router(store))
+# The dashboard is served from Firebase Hosting, a different origin
+app.add_middleware(CORSMiddleware, allow_origins=API_CORS_ORIGINS, allow_methods=["GET"], allow_headers=["*"])
 
-# Load trained model from ml-model folder
-with open("ml-model/motor_model.pkl", "rb") as f:
-    model = pickle.load(f)
 
 # ---------- Data schema ----------
 class SensorData(BaseModel):
     temperature: float
     vibration: float
     rpm: float
-    timestamp: int
+    timestamp: int | None = None
+    device_id: str | None = None
 
-# ---------- Endpoint ----------
-@app.post("/predict")
-def predict(data: SensorData):
-    try:
-        X = np.array([[ 
-            data.temperature,
-            data.vibration,
-            data.rpm
-        ]])
-
-        raw_prob = model.predict_proba(X)[0][1]
-        
-        # Rolling Window Smoothing (Mean of last 5 data points)
-        # Fetch last 4 predictions to average with current one
-        previous_preds = db.collection("predictions")\
-            .order_by("timestamp", direction=firestore.Query.DESCENDING)\
-            .limit(4)\
-            .get()
-
-        rolling_values = [raw_prob]
-        for doc in previous_preds:
-            p_data = doc.to_dict()
-            # Use raw if available (new schema), otherwise fallback to stored value (old schema)
-            val = p_data.get("raw_failure_probability", p_data.get("failure_probability", 0.0))
-            rolling_values.append(val)
-            
-        # Calculate mean
-        mean_prob = sum(rolling_values) / len(rolling_values)
-
-        # Store sensor data and get document reference
-        # Use server timestamp to avoid issues with ESP32's relative millis-based timestamps
-        sensor_ref = db.collection("sensor_data").add({
-            "temperature": data.temperature,
-            "vibration": data.vibration,
-            "rpm": data.rpm,
-            "timestamp": datetime.utcnow()
-        })
-        
-        # Get the document ID
-        sensor_doc_id = sensor_ref[1].id
-
-        # Check for high failure probability and send alert (Use Smoothed Value)
-        if mean_prob > 0.7:
-            send_failure_notification(mean_prob, data)
-
-        # Store prediction with reference to sensor data
-        # Store BOTH raw and smoothed probability
-        db.collection("predictions").add({
-            "sensor_data_id": sensor_doc_id,
-            "failure_probability": float(mean_prob),      # Smoothed value (used by Dashboard)
-            "raw_failure_probability": float(raw_prob),   # Raw value (used for next calculation)
-            "timestamp": datetime.utcnow()
+
+class BatchRequest(BaseModel):
+    readings: list[SensorData] = Field(min_length=1, max_length=MAX_BATCH_READINGS)
+
+
+def reading_dict(data, received_at):
+    reading = data.model_dump()
+    reading["device_id"] = reading["device_id"] or DEFAULT_DEVICE_ID
+    # ESP32 timestamps are seconds since boot: only the window features use them
+    if reading["timestamp"] is None:
+        reading["timestamp"] = received_at
+    return reading
+
+
+def window_reading(reading):
+    return reading["device_id"], reading["timestamp"], reading["temperature"], reading["vibration"], reading["rpm"]
+
+
+def check_queue():
+    """
+    503 before anything is scored if the Firestore queue is full: the event
+    loop must not wait for room, and a retried request must not be counted
+    twice in the windows and smoothing.
+    """
+    if writer.overflow_policy != "drop_oldest" and writer.queue.full():
+        raise HTTPException(503, "Firestore queue full, retry later")
+
+
+def record(readings, raw_probs):
+    """
+    Smoothing, alert state and Firestore documents of scored readings, in
+    order. The documents are queued as one write group (one Firestore
+    batch); returns the per-reading results.
+    """
+    results, group = [], []
+    for reading, raw_prob in zip(readings, raw_probs):
+        raw_prob = float(raw_prob)
+        device_id = reading["device_id"]
+        mean_prob = smoothing.update(device_id, raw_prob)
+        # Telegram is posted by the notifier thread
+        state = alerts.update(device_id, mean_prob, reading)
+
+        # Server timestamps: ESP32 timestamps are relative
+        now = datetime.utcnow()
+        values = {"temperature": reading["temperature"], "vibration": reading["vibration"], "rpm": reading["rpm"]}
+        if STORAGE_MODE == "combined":
+            ref = db.collection(READINGS_COLLECTION).document()
+            group.append((ref, dict(values, device_id=device_id, failure_probability=mean_prob,
+                                    raw_failure_probability=raw_prob, timestamp=now)))
+        else:
+            writes = reading_group(
+                db,
+                dict(values, device_id=device_id, timestamp=now),
+                {"device_id": device_id, "failure_probability": mean_prob,
+                 "raw_failure_probability": raw_prob, "timestamp": now},
+            )
+            ref = writes[0][0]
+            group.extend(writes)
+        if rollups.resolutions:
+            rollups.add(device_id, time.time(), dict(values, failure_probability=mean_prob))
+        results.append({
+            "device_id": device_id,
+            "id": ref.id,
+            "failure_probability": mean_prob,
+            "raw_failure_probability": raw_prob,
+            "alert": state,
         })
+    if not writer.write(group, block=False):
+        log.warning(f"⚠️ Firestore queue full, dropped {len(results)} reading(s)")
+    return results
+
 
+# ---------- Endpoints ----------
+@app.post("/predict")
+async def predict(data: SensorData):
+    try:
+        check_queue()
+        reading = reading_dict(data, time.time())
+        # Like /predict/batch: the window only takes the reading once it is scored
+        raw_prob = await batcher.predict(feature_state.preview_rows([window_reading(reading)])[0])
+        if raw_prob is None:
+            raise RuntimeError("Inference failed")
+        feature_state.update(*window_reading(reading))
+        result = record([reading], [raw_prob])[0]
         return {
-            "failure_probability": float(mean_prob),
-            "raw_failure_probability": float(raw_prob)
+            "device_id": result["device_id"],
+            "failure_probability": result["failure_probability"],  # Smoothed value (used by Dashboard)
+            "raw_failure_probability": result["raw_failure_probability"],
         }
-    
+    except HTTPException:
+        raise
     except Exception as e:
         # Return a proper error response
-        print(f"Error in prediction endpoint: {e}")
+        log.error(f"❌ Error in prediction endpoint: {e}")
         return {
             "error": str(e),
             "failure_probability": None
         }
 
+
+@app.post("/predict/batch")
+async def predict_batch(request: BatchRequest):
+    """Scores up to MAX_BATCH_READINGS readings in one call; results are in request order."""
+    check_queue()
+    received_at = time.time()
+    readings = [reading_dict(data, received_at) for data in request.readings]
+    # The windows only take the readings once they are scored: a client
+    # retrying after a 503 must not feed them twice
+    X = np.array(feature_state.preview_rows([window_reading(reading) for reading in readings]), dtype=float)
+    try:
+        # One vectorized call, off the event loop
+        raw_probs = await asyncio.get_running_loop().run_in_executor(None, predict_rows, models.model, X)
+    except Exception as e:
+        log.error(f"❌ Batch inference failed ({len(readings)} readings): {e}")
+        raise HTTPException(503, f"Inference failed: {e}")
+    for reading in readings:
+        feature_state.update(*window_reading(reading))
+    results = record(readings, raw_probs)
+    return {"count": len(results), "results": results}
+
+
 @app.get("/")
 def health_check():
-    return {"status": "ok", "message": "Motor Health API is running", "model": "trained_logistic_regression"}
+    return {"status": "ok", "message": "Motor Health API is running", "model": models.version}
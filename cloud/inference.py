@@ -0,0 +1,323 @@
+"""
+Micro-batched model inference.
+
+Messages that arrive within a short window are scored together with one
+vectorized `predict_proba` call instead of one call per message.
+MicroBatcher serves the threaded subscriber, AsyncMicroBatcher the asyncio
+one (async_subscriber.py).
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from features import input_columns
+from metrics import Histogram
+from model_store import model_features
+
+log = logging.getLogger(__name__)
+
+
+def model_input(model, X):
+    """The columns of full input rows (features.INPUT_FEATURES) `model` was trained on."""
+    columns = input_columns(model_features(model))
+    if X.shape[1] == len(columns) and columns == list(range(len(columns))):
+        return X
+    return X[:, columns]
+
+
+def predict(model, X, cache=None):
+    """Failure probabilities for full input rows X, through `cache` if there is one."""
+    X = model_input(model, np.asarray(X, dtype=float))
+    if cache is not None:
+        return cache.predict(model, X)
+    return model.predict_proba(X)[:, 1]
+
+
+def score_each(model, rows, cache=None, stats=None):
+    """
+    Fallback after a failed batch: each row on its own, None for the rows
+    that fail again. Counts into the batcher's `stats` (rows / unscored).
+    """
+    probs = []
+    for row in rows:
+        try:
+            probs.append(float(predict(model, np.array([row], dtype=float), cache)[0]))
+            if stats is not None:
+                stats["rows"] += 1
+        except Exception as e:
+            if stats is not None:
+                stats["unscored"] += 1
+            log.error(f"❌ Inference failed for row {list(row)}: {e}")
+            probs.append(None)
+    return probs
+
+
+class InferenceCache:
+    """
+    LRU cache of failure probabilities in front of the model, for motors in
+    steady state that send nearly the same reading over and over.
+
+    Readings are quantized to `resolutions` (one step per feature, e.g.
+    0.1 °C, 0.01 m/s², 10 rpm; a dict by feature name covers models with
+    different inputs) and every cell is scored once, at its quantized
+    point, so all readings in a cell get the same probability whatever
+    order they come in. Holds up to `max_size` cells and is cleared
+    whenever it is used with a different model (hot reload).
+    Not thread-safe: use it from the one thread that scores.
+    """
+
+    def __init__(self, resolutions, max_size=10000):
+        steps = resolutions.values() if isinstance(resolutions, dict) else resolutions
+        if any(step <= 0 for step in steps):
+            raise ValueError("Cache resolutions must be positive")
+        self.resolutions = resolutions
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.model = None
+        self.steps = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _use(self, model):
+        if isinstance(self.resolutions, dict):
+            features = model_features(model)
+            missing = [name for name in features if name not in self.resolutions]
+            if missing:
+                raise ValueError(f"No cache resolution for {missing}")
+            self.steps = np.array([self.resolutions[name] for name in features], dtype=float)
+        else:
+            self.steps = np.asarray(self.resolutions, dtype=float)
+        if self.entries:
+            self.stats["invalidations"] += 1
+        self.entries.clear()
+        self.model = model
+
+    def predict(self, model, X):
+        """Failure probability for each row of X (the model's inputs), scoring only the cells not cached yet."""
+        if model is not self.model:
+            self._use(model)
+        cells = np.round(np.asarray(X, dtype=float) / self.steps).astype(np.int64)
+        keys = list(map(tuple, cells.tolist()))
+        probs = np.empty(len(keys))
+        missing = {}
+        for i, key in enumerate(keys):
+            prob = self.entries.get(key)
+            if prob is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                self.entries.move_to_end(key)
+                probs[i] = prob
+        self.stats["hits"] += len(keys) - sum(map(len, missing.values()))
+        self.stats["misses"] += len(missing)
+
+        if missing:
+            rows = [missing_rows[0] for missing_rows in missing.values()]
+            scored = model.predict_proba(cells[rows] * self.steps)[:, 1]
+            for (key, indexes), prob in zip(missing.items(), scored):
+                probs[indexes] = prob
+                self.entries[key] = float(prob)
+            overflow = len(self.entries) - self.max_size
+            for _ in range(max(0, overflow)):
+                self.entries.popitem(last=False)
+            self.stats["evictions"] += max(0, overflow)
+        return probs
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+
+class MicroBatcher:
+    """
+    Collects input rows (features.INPUT_FEATURES) for up to `window` seconds (or until `max_batch_size`
+    rows are waiting), scores them in one call and hands each probability to
+    the callback that was submitted with the row.
+
+    Callbacks run on the batcher thread in submission order. `model` and
+    `shadow` may be replaced at any time (model_manager.py): each batch is
+    scored by the model set when it starts. A shadow scorer sees every
+    batch after its callbacks have run. With a `cache` (InferenceCache)
+    only rows not seen before reach the model. If a batch fails, its rows
+    are scored one by one; a row that still fails gets None.
+    """
+
+    def __init__(self, model, window=0.005, max_batch_size=64, name="inference", cache=None):
+        self.model = model
+        self.shadow = None
+        self.cache = cache
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue()
+        self.stats = {"batches": 0, "rows": 0, "errors": 0, "unscored": 0}
+        self.batch_latency = Histogram("inference_batch_seconds", "Model time per predict_proba batch")
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, features, callback):
+        """Queues one row of features; `callback(raw_prob)` is called once scored (None if it failed)."""
+        self.queue.put((features, callback))
+
+    def call_soon(self, fn):
+        """Runs `fn()` on the batcher thread after the callbacks of every row submitted so far."""
+        self.queue.put((None, fn))
+
+    def _collect(self):
+        try:
+            first = self.queue.get(timeout=0.2)
+        except queue.Empty:
+            return []
+
+        items = [first]
+        deadline = time.monotonic() + self.window
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Window closed: still take anything that is already waiting
+                    items.append(self.queue.get_nowait())
+                else:
+                    items.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            items = self._collect()
+            if not items:
+                continue
+
+            rows = [features for features, _ in items if features is not None]
+            scores = None
+            probs = iter(())
+            if rows:
+                try:
+                    X = np.array(rows, dtype=float)
+                    start = time.perf_counter()
+                    scores = predict(self.model, X, self.cache)
+                    elapsed = time.perf_counter() - start
+                    self.batch_latency.observe(elapsed)
+                    self.stats["batches"] += 1
+                    self.stats["rows"] += len(rows)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    log.error(f"❌ Batch inference failed ({len(rows)} rows), scoring them one by one: {e}")
+                    probs = iter(score_each(self.model, rows, self.cache, self.stats))
+                else:
+                    probs = (float(prob) for prob in scores)
+
+            for features, callback in items:
+                try:
+                    if features is None:
+                        callback()
+                    else:
+                        callback(next(probs))
+                except Exception as e:
+                    log.error(f"❌ Error processing prediction: {e}")
+
+            shadow = self.shadow
+            if shadow is not None and scores is not None:
+                shadow.compare(X, scores, elapsed)
+
+    def close(self, timeout=10.0):
+        """Scores everything still queued, then stops the batcher thread."""
+        self._stopping.set()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+
+class AsyncMicroBatcher:
+    """
+    MicroBatcher for asyncio: `await predict(features)` returns the raw
+    probability, or None if the model failed on the row (a failed batch is
+    scored again row by row). Rows awaited within `window` seconds (up to
+    `max_batch_size`) share one predict_proba call, which runs in a worker
+    thread so the event loop keeps serving I/O meanwhile.
+
+    Results are delivered in submission order, so coroutines that await
+    `predict` for the same device resume in the order they submitted.
+    Call `start()` from the running loop and `await close()` at shutdown.
+    `model`, `shadow` and `cache` work as in MicroBatcher.
+    """
+
+    def __init__(self, model, window=0.005, max_batch_size=64, cache=None):
+        self.model = model
+        self.shadow = None
+        self.cache = cache
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.queue = asyncio.Queue()
+        self.stats = {"batches": 0, "rows": 0, "errors": 0, "unscored": 0}
+        self.batch_latency = Histogram("inference_batch_seconds", "Model time per predict_proba batch")
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def predict(self, features):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((features, future))
+        return await future
+
+    async def _collect(self):
+        items = [await self.queue.get()]
+        if self.window > 0 and self.queue.qsize() < self.max_batch_size - 1:
+            # Let the other coroutines submit their rows for this batch
+            await asyncio.sleep(self.window)
+        while len(items) < self.max_batch_size and not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+    def _score(self, X):
+        start = time.perf_counter()
+        scores = predict(self.model, X, self.cache)
+        elapsed = time.perf_counter() - start
+        self.batch_latency.observe(elapsed)
+        return scores, elapsed
+
+    def _compare(self, X, scores, elapsed):
+        shadow = self.shadow
+        if shadow is not None:
+            shadow.compare(X, scores, elapsed)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            try:
+                X = np.array([features for features, _ in items], dtype=float)
+                probs, elapsed = await loop.run_in_executor(None, self._score, X)
+            except Exception as e:
+                self.stats["errors"] += 1
+                log.error(f"❌ Batch inference failed ({len(items)} rows), scoring them one by one: {e}")
+                rows = [features for features, _ in items]
+                probs = await loop.run_in_executor(None, score_each, self.model, rows, self.cache, self.stats)
+                for (_, future), prob in zip(items, probs):
+                    if not future.done():
+                        future.set_result(prob)
+            else:
+                self.stats["batches"] += 1
+                self.stats["rows"] += len(items)
+                for (_, future), prob in zip(items, probs):
+                    if not future.done():
+                        future.set_result(float(prob))
+                if self.shadow is not None:
+                    # Off the loop, after the results were handed out
+                    loop.run_in_executor(None, self._compare, X, probs, elapsed)
+            for _ in items:
+                self.queue.task_done()
+
+    async def close(self):
+        """Scores everything still queued, then stops the batch task."""
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
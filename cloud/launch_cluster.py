@@ -0,0 +1,109 @@
+"""
+Runs several subscriber processes on one machine as one cluster (see
+cluster.py), one per CPU core by default.
+
+Each child is `mqtt_subscriber.py` with CLUSTER_GROUP set, its own
+CLUSTER_MEMBER (<hostname>-<n>) and METRICS_PORT (base port + n); every
+other setting comes from the environment / .env as usual. A child that
+exits unexpectedly is restarted with a growing delay. SIGTERM / Ctrl+C is
+passed on to all children, which hand their devices over and drain their
+queues before exiting.
+
+Usage (from the cloud/ folder):
+    python launch_cluster.py
+    python launch_cluster.py --processes 4 --group subscribers
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+from metrics import setup_logging
+
+log = logging.getLogger("launch_cluster")
+
+
+class Child:
+    def __init__(self, command, env):
+        self.command = command
+        self.env = env
+        self.process = None
+        self.started = 0.0
+        self.restarts = 0
+        self.next_start = 0.0
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, env=self.env)
+        self.started = time.monotonic()
+        log.info(f"🚀 Started subscriber {self.env['CLUSTER_MEMBER']} (pid {self.process.pid})")
+
+
+def launch(processes, group, metrics_port, script, stop_timeout):
+    host = socket.gethostname()
+    children = []
+    for i in range(processes):
+        env = dict(os.environ, CLUSTER_GROUP=group, CLUSTER_MEMBER=f"{host}-{i}")
+        env["METRICS_PORT"] = str(metrics_port + i) if metrics_port else "0"
+        children.append(Child([sys.executable, script], env))
+    for child in children:
+        child.start()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        time.sleep(0.5)
+        for child in children:
+            if child.process is None:
+                if time.monotonic() >= child.next_start and not stopping:
+                    child.start()
+                continue
+            code = child.process.poll()
+            if code is None or stopping:
+                continue
+            # Crashed (or exited on its own): restart with backoff, reset after a healthy minute
+            if time.monotonic() - child.started > 60:
+                child.restarts = 0
+            delay = min(30, 2 ** child.restarts)
+            child.restarts += 1
+            child.process = None
+            child.next_start = time.monotonic() + delay
+            log.warning(f"⚠️ Subscriber {child.env['CLUSTER_MEMBER']} exited with {code}, restarting in {delay}s")
+
+    log.info("🛑 Stopping subscribers...")
+    running = [c.process for c in children if c.process is not None and c.process.poll() is None]
+    for process in running:
+        process.send_signal(signal.SIGTERM)
+    deadline = time.monotonic() + stop_timeout
+    for process in running:
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            log.warning(f"⚠️ Subscriber pid {process.pid} did not stop in time, killing it")
+            process.kill()
+    log.info("✅ All subscribers stopped")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="default: number of CPU cores")
+    parser.add_argument("--group", default=os.getenv("CLUSTER_GROUP") or "subscribers")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", 9100)),
+                        help="port of the first child's /metrics, 0 disables")
+    parser.add_argument("--script", default="mqtt_subscriber.py")
+    parser.add_argument("--stop-timeout", type=float, default=60, help="seconds to wait for the children on shutdown")
+    args = parser.parse_args()
+
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+    launch(args.processes, args.group, args.metrics_port, args.script, args.stop_timeout)
@@ -0,0 +1,375 @@
+"""
+Lightweight in-process metrics, logging setup and an on-demand profiler.
+
+- Counter / Gauge / CounterFn / Histogram / RateMeter collected in a Registry and served
+  in Prometheus text format on http://<host>:<port>/metrics
+- setup_logging(): leveled text or JSON logs, with sampling of the
+  per-message log lines so they don't cost stdout I/O at volume
+- SignalProfiler: cProfile toggled with a signal (default SIGUSR1) while the
+  service keeps running
+- StartupTimer: how long each startup phase took and when it ended
+"""
+
+import bisect
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers sub-millisecond inference up to multi-second HTTP calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+class Gauge:
+    """A value that is read from `fn` at scrape time (e.g. a queue depth)."""
+
+    type = "gauge"
+
+    def __init__(self, name, fn, help=""):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", f"{self.name} {self.fn()}"]
+
+
+class CounterFn(Gauge):
+    """A total counted elsewhere (e.g. in a component's stats), read from `fn` at scrape time."""
+
+    type = "counter"
+
+
+class Histogram:
+    """Bucketed latency histogram (seconds) that also tracks mean and max."""
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def time(self):
+        """Context manager: `with histogram.time(): ...`"""
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            mean = self.total / self.count if self.count else 0.0
+            return {"count": self.count, "mean_ms": mean * 1000, "max_ms": self.max * 1000}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{self.name}_sum {self.total}")
+            lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class RateMeter:
+    """Events per second over a sliding window of one-second buckets."""
+
+    def __init__(self, name, help="", window=10):
+        self.name = name
+        self.help = help
+        self.window = window
+        self._buckets = deque()
+        self._lock = threading.Lock()
+
+    def mark(self, n=1):
+        second = int(time.time())
+        with self._lock:
+            if self._buckets and self._buckets[-1][0] == second:
+                self._buckets[-1][1] += n
+            else:
+                self._buckets.append([second, n])
+            while self._buckets and self._buckets[0][0] <= second - self.window:
+                self._buckets.popleft()
+
+    def rate(self):
+        cutoff = int(time.time()) - self.window
+        with self._lock:
+            return sum(n for second, n in self._buckets if second > cutoff) / self.window
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.rate()}"]
+
+
+class StartupTimer:
+    """
+    Duration of each named startup phase and the time from `started`
+    (time.perf_counter()) to its end. Phases may overlap and end on any
+    thread; a phase is recorded once.
+    """
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name, since=None):
+        """Ends phase `name`, begun at `since` (default: a point in time, no duration)."""
+        end = time.perf_counter()
+        seconds = end - since if since is not None else 0.0
+        with self._lock:
+            if name in self.phases:
+                return
+            self.phases[name] = {"seconds": round(seconds, 4), "at": round(end - self.started, 4)}
+        logging.getLogger(__name__).info(f"⏱️ Startup {name}: {seconds:.3f}s (at {end - self.started:.3f}s)")
+
+    def phase(self, name):
+        """Context manager timing the phase `name`."""
+        return _Phase(self, name)
+
+    def report(self):
+        with self._lock:
+            return dict(self.phases)
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.timer.mark(self.name, self.start)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help=""):
+        return self.register(Counter(name, help))
+
+    def gauge(self, name, fn, help=""):
+        return self.register(Gauge(name, fn, help))
+
+    def counter_fn(self, name, fn, help=""):
+        return self.register(CounterFn(name, fn, help))
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    def meter(self, name, help="", window=10):
+        return self.register(RateMeter(name, help, window))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# error rendering {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(registry, port=9100, host="0.0.0.0"):
+    """Serves the registry on /metrics from a daemon thread. Returns the server."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# ---------- Logging ----------
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only `rate` of the records logged with extra={"sampled": True}."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False) and self.rate < 1.0:
+            return random.random() < self.rate
+        return True
+
+
+# Pass as `extra=` on per-message log lines so they are subject to sampling
+SAMPLED = {"sampled": True}
+
+
+def setup_logging(level="INFO", fmt="text", sample_rate=1.0):
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+
+
+# ---------- Profiling ----------
+class SignalProfiler:
+    """
+    cProfile switched on and off at runtime (e.g. with `kill -USR1 <pid>`).
+
+    cProfile only sees the thread it runs in, so each worker thread profiles
+    its own calls made through `call()`; the profiles are merged when
+    profiling stops and written to `out_dir` as a .pstats file.
+
+    Install `request` as the signal handler: it only sets an event, and a
+    helper thread (`start()`) toggles, writes and logs. Logging in the
+    handler itself could deadlock on a lock the interrupted code holds.
+    """
+
+    def __init__(self, out_dir="profiles", top=20):
+        self.out_dir = out_dir
+        self.top = top
+        self.active = False
+        self._profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._requested = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._serve, name="profiler", daemon=True).start()
+        return self
+
+    def request(self, signum=None, frame=None):
+        """Signal handler: asks the helper thread to toggle profiling."""
+        self._requested.set()
+
+    def _serve(self):
+        while True:
+            self._requested.wait()
+            self._requested.clear()
+            self.toggle()
+
+    def call(self, fn, *args):
+        if not self.active:
+            return fn(*args)
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        try:
+            return profile.runcall(fn, *args)
+        except ValueError:
+            # Python 3.12+ allows only one active profiler at a time
+            return fn(*args)
+
+    def toggle(self):
+        if not self.active:
+            self.active = True
+            logging.getLogger(__name__).info("🔬 Profiling started")
+        else:
+            self.active = False
+            path = self.dump()
+            logging.getLogger(__name__).info(f"🔬 Profiling stopped, stats written to {path}")
+
+    def dump(self):
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+        # New thread-local profiles next time profiling starts
+        self._local = threading.local()
+        if not profiles:
+            return None
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"profile-{int(time.time())}.pstats")
+        stats.dump_stats(path)
+
+        summary = io.StringIO()
+        pstats.Stats(path, stream=summary).sort_stats("cumulative").print_stats(self.top)
+        logging.getLogger(__name__).info(summary.getvalue())
+        return path
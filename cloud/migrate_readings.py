@@ -0,0 +1,96 @@
+"""
+Migrates sensor_data + predictions pairs into single `readings` documents
+(STORAGE_MODE=combined).
+
+Each pair becomes one document with the sensor_data id as its id, so the
+migration can be re-run safely (e.g. with --since for the readings written
+between the first run and switching the subscriber over). A sensor_data
+document without a prediction (the model failed on it) becomes a document
+with `unscored: true`.
+
+Usage (from the cloud/ folder):
+    python migrate_readings.py --dry-run
+    python migrate_readings.py
+    python migrate_readings.py --since 2026-10-01T00:00 --delete-source
+"""
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from firestore_writer import BatchedFirestoreWriter, PREDICTION_FIELDS, delete_documents, iter_readings
+from metrics import setup_logging
+from smoothing import DEFAULT_DEVICE_ID
+
+log = logging.getLogger("migrate_readings")
+
+READING_FIELDS = ("device_id", "temperature", "vibration", "rpm", "failure_probability", "timestamp",
+                  *PREDICTION_FIELDS)
+
+
+def migrate(db, writer, since=None, device_id=None, delete_source=False, dry_run=False):
+    """Copies every joined pair into `readings`. Returns a stats dict."""
+    stats = {"migrated": 0, "deleted": 0}
+    migrated = []
+    for reading_id, reading, prediction_id in iter_readings(db, "split", since, device_id, unpaired=True):
+        doc = {field: reading[field] for field in READING_FIELDS if field in reading}
+        doc.setdefault("device_id", DEFAULT_DEVICE_ID)
+        if prediction_id is None:
+            doc["unscored"] = True
+        if not dry_run:
+            writer.write_combined_reading(doc, doc_id=reading_id)
+        migrated.append((reading_id, prediction_id))
+        stats["migrated"] += 1
+        if stats["migrated"] % 5000 == 0:
+            log.info(f"⏳ {stats['migrated']} readings queued")
+
+    if dry_run:
+        return stats
+    writer.flush()
+    if writer.stats["failed"] or writer.stats["dropped"]:
+        # Never delete a source pair whose combined copy may not exist
+        log.error(f"❌ {writer.stats['failed'] + writer.stats['dropped']} writes failed, source pairs kept")
+        return stats
+
+    if delete_source:
+        refs = []
+        for reading_id, prediction_id in migrated:
+            refs.append(db.collection("sensor_data").document(reading_id))
+            if prediction_id is not None:
+                refs.append(db.collection("predictions").document(prediction_id))
+        stats["deleted"] = delete_documents(db, refs)
+    return stats
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since", help="only pairs at or after this ISO date/time (UTC)")
+    parser.add_argument("--device", help="only this device id")
+    parser.add_argument("--delete-source", action="store_true",
+                        help="delete the sensor_data/predictions pairs once all copies are committed")
+    parser.add_argument("--dry-run", action="store_true", help="count the pairs, write nothing")
+    args = parser.parse_args()
+
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+    if os.getenv("FIRESTORE_BACKEND", "firestore") == "fake":
+        from fake_firestore import FakeFirestoreClient
+        db = FakeFirestoreClient()
+    else:
+        from google.cloud import firestore
+        db = firestore.Client()
+
+    since = None
+    if args.since:
+        since = datetime.fromisoformat(args.since)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
+    # Offline tool: wait for queue space rather than dropping writes
+    writer = BatchedFirestoreWriter(db, block_timeout=300)
+    start = time.time()
+    stats = migrate(db, writer, since, args.device, args.delete_source, args.dry_run)
+    writer.close()
+    log.info(f"✅ Migration finished in {time.time() - start:.1f}s: {stats}")
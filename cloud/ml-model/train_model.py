@@ -1,96 +1,372 @@
-import pickle
-import numpy as np
-import os
-from sklearn.ensemble import RandomForestClassifier
-
-# Ensure we're saving in the ml-model directory
-script_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(script_dir, "motor_model.pkl")
-
 """
+Trains the motor failure model on synthetic scenario data.
+
 Goal: ensure model probability responds to abnormal vibration/temperature
 without any preprocessing (raw features only).
 Approach:
 1) Rebalance synthetic data so failures can occur at normal RPM when vib/temp are high,
     and add normal 'idle' samples at low RPM but with low vib/temp.
 2) Use a tree ensemble (RandomForestClassifier) which is insensitive to feature scaling.
+
+Rows are drawn from the SCENARIOS below in `--mix` proportions, generated
+chunk by chunk straight into one preallocated float32 array, so millions of
+rows cost 12 bytes each and no intermediate copies. Forests are fitted on
+all cores (n_jobs=-1).
+
+With --sweep every combination of --trees, --depth and --leaf is trained
+and scored on a separate validation set. Since the subscriber scores every
+message, each candidate's inference latency is measured too (compiled
+forest, as deployed): single row and one micro-batch. The fastest candidate
+whose F1 is within --tolerance of the best one wins (or the best one under
+--max-latency-us).
+
+With --window-features the model also gets the sliding-window features the
+subscriber computes per device (features.py). Rows then come from
+simulated time series, one per device, `--series-length` readings
+`--interval` seconds apart: a base point from the scenarios plus a trend
+from TRENDS, which adds failures that stay inside the normal ranges and
+only show as a trend. The window features are computed by the same
+features.history_features code the subscriber's windows use, with
+--window / --min-samples, which should match its FEATURE_WINDOW /
+FEATURE_MIN_SAMPLES. The model is written as motor_model.pkl (not with
+--window-features: the pickle fallback takes the 3 base features) and as a
+new version in the model registry (model_store.py, ml-model/models/), whose
+manifest records the feature order, version, parameters, training ranges,
+validation metrics and measured latency. The new version becomes CURRENT, which running
+subscribers pick up on their own, unless --no-promote is given (e.g. to
+shadow-score it first, see model_manager.py).
+
+Usage (from the cloud/ folder):
+    python ml-model/train_model.py
+    python ml-model/train_model.py --rows 2000000 --sweep --trees 25 50 100 --depth 0 10 --leaf 2 10
+    python ml-model/train_model.py --window-features --rows 200000
 """
 
-# Generate synthetic training data
-np.random.seed(42)
-
-# --- Normal operation (running): temp 20-30°C, vib 0.3-0.6 m/s², rpm 2000-3000
-n_run = 4000
-normal_run_temp = np.random.uniform(20, 35, n_run)
-normal_run_vib = np.random.uniform(0, 0.9, n_run)
-normal_run_rpm = np.random.uniform(2000, 3000, n_run)
-normal_run_labels = np.zeros(n_run)
-
-
-# --- Failure A: high temp, normal RPM and VIB
-n_fail_a = 1000
-failure_a_temp = np.random.uniform(36, 90, n_fail_a)
-failure_a_vib = np.random.uniform(0, 0.9, n_fail_a)
-failure_a_rpm = np.random.uniform(2000, 3000, n_fail_a)
-failure_a_labels = np.ones(n_fail_a)
-
-# --- Failure B: high vib, normal RPM and TEMP
-n_fail_b = 1000
-failure_b_temp = np.random.uniform(20, 35, n_fail_b)
-failure_b_vib = np.random.uniform(1.0, 9.0, n_fail_b)
-failure_b_rpm = np.random.uniform(2000, 3000, n_fail_b)
-failure_b_labels = np.ones(n_fail_b)
-
-# --- Failure C: low RPM, normal TEMP and VIB
-n_fail_c = 1000
-failure_c_temp = np.random.uniform(20, 35, n_fail_c)
-failure_c_vib = np.random.uniform(0, 0.9, n_fail_c)
-failure_c_rpm = np.random.uniform(0, 1999, n_fail_c)
-failure_c_labels = np.ones(n_fail_c)
-
-# --- Failure D: All abnormal: high TEMP, high VIB, low RPM
-n_fail_d = 1000
-failure_d_temp = np.random.uniform(36, 90, n_fail_d)
-failure_d_vib = np.random.uniform(1.0, 9.0, n_fail_d)
-failure_d_rpm = np.random.uniform(0, 1999, n_fail_d)
-failure_d_labels = np.ones(n_fail_d)
-
-# Stack dataset
-X = np.vstack([
-    np.column_stack([normal_run_temp, normal_run_vib, normal_run_rpm]),
-    np.column_stack([failure_a_temp, failure_a_vib, failure_a_rpm]),
-    np.column_stack([failure_b_temp, failure_b_vib, failure_b_rpm]),
-    np.column_stack([failure_c_temp, failure_c_vib, failure_c_rpm]),
-    np.column_stack([failure_d_temp, failure_d_vib, failure_d_rpm])
-])
-y = np.concatenate([
-    normal_run_labels,
-    failure_a_labels,
-    failure_b_labels,
-    failure_c_labels,
-    failure_d_labels
-])
-
-# Train model (no preprocessing)
-model = RandomForestClassifier(
-    n_estimators=300,
-    max_depth=None,
-    min_samples_split=4,
-    min_samples_leaf=2,
-    random_state=42,
-)
-model.fit(X, y)
-
-# Save model in the same directory as this script
-with open(model_path, "wb") as f:
-    pickle.dump(model, f)
-
-# Quick sanity checks: hold rpm/temperature fixed; increase vibration
-sample_normal = np.array([[28.0, 0.4, 2300],
-                          [40.0, 0.5, 2990],
-                          [31.0, 1.5, 2100],
-                          [31.0, 0.5, 1800],
-                          [40.0, 1.5, 1800]])
-prob = model.predict_proba(sample_normal)[:,1]
-print(f"✓ Model trained and saved at: {model_path}")
-print(f"{prob} ")
+import argparse
+import itertools
+import os
+import pickle
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+
+# Ensure we're saving in the ml-model directory
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(script_dir))
+from features import INPUT_FEATURES, input_rows
+from forest_engine import CompiledForest, export_forest
+from model_store import FEATURES, save_artifact, set_current
+
+# name -> (label, temperature range, vibration range, rpm range)
+SCENARIOS = {
+    # Normal operation (running): temp 20-35°C, vib 0-0.9 m/s², rpm 2000-3000
+    "NORMAL": (0, (20, 35), (0, 0.9), (2000, 3000)),
+    # Failure A: high temp, normal RPM and VIB
+    "HIGH TEMP": (1, (36, 90), (0, 0.9), (2000, 3000)),
+    # Failure B: high vib, normal RPM and TEMP
+    "HIGH VIB": (1, (20, 35), (1.0, 9.0), (2000, 3000)),
+    # Failure C: low RPM, normal TEMP and VIB
+    "STALL": (1, (20, 35), (0, 0.9), (0, 1999)),
+    # Failure D: All abnormal: high TEMP, high VIB, low RPM
+    "ALL ABNORMAL": (1, (36, 90), (1.0, 9.0), (0, 1999)),
+}
+# Same proportions as the original 4000/1000/1000/1000/1000 rows
+DEFAULT_MIX = "NORMAL=0.5,HIGH TEMP=0.125,HIGH VIB=0.125,STALL=0.125,ALL ABNORMAL=0.125"
+
+# Trends of the simulated series (--window-features), applied to NORMAL
+# devices; the failure scenarios always run STEADY.
+# name -> (label or None for the scenario's, temperature °C/min,
+#          vibration noise std m/s², rpm/min), drawn uniformly per series
+TRENDS = {
+    "STEADY": (None, (-0.2, 0.2), (0.01, 0.08), (-20, 20)),
+    # Failure E: temperature climbing while still in the normal range
+    "OVERHEATING": (1, (1.5, 6.0), (0.01, 0.08), (-20, 20)),
+    # Failure F: vibration mean normal, but it scatters
+    "BEARING WEAR": (1, (-0.2, 0.2), (0.25, 0.6), (-20, 20)),
+    # Failure G: speed falling before it reaches the stall range
+    "SLOWING DOWN": (1, (-0.2, 0.2), (0.01, 0.08), (-600, -150)),
+}
+DEFAULT_TREND_MIX = "STEADY=0.7,OVERHEATING=0.1,BEARING WEAR=0.1,SLOWING DOWN=0.1"
+# Sensor noise per reading: temperature (°C), rpm
+SERIES_NOISE = (0.1, 15.0)
+
+# Deployed parameters, used without --sweep
+DEFAULT_PARAMS = {"n_estimators": 300, "max_depth": None, "min_samples_leaf": 2, "min_samples_split": 4}
+
+# Hold rpm/temperature fixed; increase vibration
+SANITY_SAMPLES = np.array([[28.0, 0.4, 2300],
+                           [40.0, 0.5, 2990],
+                           [31.0, 1.5, 2100],
+                           [31.0, 0.5, 1800],
+                           [40.0, 1.5, 1800]])
+
+
+def parse_mix(text, known=SCENARIOS):
+    """'NORMAL=0.8,STALL=0.2' -> (["NORMAL", "STALL"], [0.8, 0.2])"""
+    names, weights = [], []
+    for part in text.split(","):
+        name, weight = part.split("=")
+        name = name.strip().upper()
+        if name not in known:
+            raise ValueError(f"Unknown scenario {name!r}, expected one of {list(known)}")
+        names.append(name)
+        weights.append(float(weight))
+    return names, weights
+
+
+def generate_chunks(rows, mix, chunk_size=100_000, seed=42, label_noise=0.0):
+    """
+    Yields (X, y) chunks of synthetic readings, `rows` in total. Each row
+    picks a scenario by weight and draws every feature uniformly from that
+    scenario's range; `label_noise` is the fraction of labels flipped.
+    """
+    names, weights = mix
+    rng = np.random.default_rng(seed)
+    p = np.asarray(weights, dtype=float) / sum(weights)
+    labels = np.array([SCENARIOS[n][0] for n in names], dtype=np.uint8)
+    low = np.array([[r[0] for r in SCENARIOS[n][1:]] for n in names], dtype=float)
+    span = np.array([[r[1] - r[0] for r in SCENARIOS[n][1:]] for n in names], dtype=float)
+
+    for start in range(0, rows, chunk_size):
+        n = min(chunk_size, rows - start)
+        scenario = rng.choice(len(names), size=n, p=p)
+        X = low[scenario] + rng.random((n, len(FEATURES))) * span[scenario]
+        y = labels[scenario]
+        if label_noise:
+            y = y ^ (rng.random(n) < label_noise).astype(np.uint8)
+        yield X, y
+
+
+def make_dataset(rows, mix, chunk_size=100_000, seed=42, label_noise=0.0):
+    """Fills float32 arrays (what the sklearn trees use internally) chunk by chunk."""
+    X = np.empty((rows, len(FEATURES)), dtype=np.float32)
+    y = np.empty(rows, dtype=np.uint8)
+    offset = 0
+    for X_chunk, y_chunk in generate_chunks(rows, mix, chunk_size, seed, label_noise):
+        X[offset:offset + len(X_chunk)] = X_chunk
+        y[offset:offset + len(y_chunk)] = y_chunk
+        offset += len(X_chunk)
+    return X, y
+
+
+def make_series_dataset(rows, mix, trend_mix, length=60, interval=2.0, window=30, min_samples=5, seed=42):
+    """
+    `rows` readings with their window features (INPUT_FEATURES columns),
+    from simulated devices of `length` readings each, in time order per
+    device like the subscriber receives them.
+    """
+    names, weights = mix
+    trend_names, trend_weights = trend_mix
+    rng = np.random.default_rng(seed)
+    devices = -(-rows // length)
+
+    def uniform(table, keys, field, picked):
+        """A value per device, uniform in the range `table[key][field]` of its key."""
+        bounds = np.array([table[key][field] for key in keys], dtype=float)[picked]
+        return bounds[..., 0] + rng.random(bounds.shape[:-1]) * (bounds[..., 1] - bounds[..., 0])
+
+    scenario = rng.choice(len(names), size=devices, p=np.asarray(weights, dtype=float) / sum(weights))
+    trend = rng.choice(len(trend_names), size=devices, p=np.asarray(trend_weights, dtype=float) / sum(trend_weights))
+    if "STEADY" in trend_names:
+        trend[np.array(names)[scenario] != "NORMAL"] = trend_names.index("STEADY")
+    base = uniform(SCENARIOS, names, slice(1, 4), scenario)
+    temp_slope, vib_noise, rpm_slope = (uniform(TRENDS, trend_names, field, trend) for field in (1, 2, 3))
+
+    minutes = np.arange(length) * interval / 60.0
+    temperature = base[:, :1] + temp_slope[:, None] * minutes + rng.normal(0, SERIES_NOISE[0], (devices, length))
+    vibration = np.abs(base[:, 1:2] + vib_noise[:, None] * rng.standard_normal((devices, length)))
+    rpm = np.maximum(0, base[:, 2:] + rpm_slope[:, None] * minutes + rng.normal(0, SERIES_NOISE[1], (devices, length)))
+
+    trend_labels = np.array([TRENDS[t][0] if TRENDS[t][0] is not None else -1 for t in trend_names])[trend]
+    labels = np.where(trend_labels >= 0, trend_labels,
+                      np.array([SCENARIOS[n][0] for n in names])[scenario]).astype(np.uint8)
+
+    X = np.column_stack([temperature.ravel(), vibration.ravel(), rpm.ravel()])[:rows]
+    device_ids = np.repeat(np.arange(devices), length)[:rows]
+    timestamps = np.tile(minutes * 60.0, devices)[:rows]
+    X = input_rows(device_ids, timestamps, X, window, min_samples).astype(np.float32)
+    return X, np.repeat(labels, length)[:rows]
+
+
+def measure_latency(engine, X, batch_size=64, rows=1000):
+    """Single-row p50/p99 and per-batch time of `engine.predict_proba`, in µs."""
+    X = np.asarray(X, dtype=float)
+    engine.predict_proba(X[:batch_size])  # warm up
+    single = []
+    for i in range(min(rows, len(X))):
+        row = X[i:i + 1]
+        start = time.perf_counter()
+        engine.predict_proba(row)
+        single.append(time.perf_counter() - start)
+    single.sort()
+
+    batches = [X[i:i + batch_size] for i in range(0, len(X) - batch_size + 1, batch_size)][:50]
+    start = time.perf_counter()
+    for batch in batches:
+        engine.predict_proba(batch)
+    per_batch = (time.perf_counter() - start) / max(1, len(batches))
+
+    to_us = lambda seconds: round(seconds * 1e6, 1)
+    return {
+        "single_row": {"p50": to_us(single[len(single) // 2]), "p99": to_us(single[int(len(single) * 0.99)])},
+        "batch": {"size": batch_size, "per_batch": to_us(per_batch), "per_row": to_us(per_batch / batch_size)},
+    }
+
+
+def train(params, X, y, seed=42, max_samples=None):
+    model = RandomForestClassifier(**params, max_samples=max_samples, random_state=seed, n_jobs=-1)
+    start = time.perf_counter()
+    model.fit(X, y)
+    return model, time.perf_counter() - start
+
+
+def evaluate(model, X_val, y_val, batch_size):
+    """Validation metrics and latency of the compiled forest the subscriber runs."""
+    compiled = CompiledForest(export_forest(model))
+    prob = compiled.predict_proba(np.asarray(X_val, dtype=float))[:, 1]
+    pred = prob >= 0.5
+    return {
+        "accuracy": round(float(accuracy_score(y_val, pred)), 5),
+        "f1": round(float(f1_score(y_val, pred)), 5),
+        "roc_auc": round(float(roc_auc_score(y_val, prob)), 5),
+        "nodes": int(len(compiled.feature)),
+    }, measure_latency(compiled, X_val, batch_size)
+
+
+def select(results, tolerance, max_latency_us=None):
+    """Fastest candidate within `tolerance` of the best F1 (among those under the latency budget)."""
+    candidates = [r for r in results
+                  if max_latency_us is None or r["latency_us"]["single_row"]["p50"] <= max_latency_us]
+    if not candidates:
+        raise SystemExit(f"❌ No candidate is under {max_latency_us} µs per row")
+    best_f1 = max(r["metrics"]["f1"] for r in candidates)
+    good = [r for r in candidates if r["metrics"]["f1"] >= best_f1 - tolerance]
+    return min(good, key=lambda r: (r["latency_us"]["single_row"]["p50"], -r["metrics"]["f1"]))
+
+
+def sweep_grid(trees, depths, leaves):
+    for n_estimators, depth, leaf in itertools.product(trees, depths, leaves):
+        yield {"n_estimators": n_estimators, "max_depth": depth or None,
+               "min_samples_leaf": leaf, "min_samples_split": max(2, 2 * leaf)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=8000, help="training rows")
+    parser.add_argument("--val-rows", type=int, default=20000, help="validation rows (separate seed)")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="rows generated per chunk")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. 'NORMAL=0.5,STALL=0.5'")
+    parser.add_argument("--label-noise", type=float, default=0.0, help="fraction of labels flipped")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-samples", type=float, default=None,
+                        help="bootstrap size per tree (fraction of rows), bounds fit time on large sets")
+    parser.add_argument("--sweep", action="store_true", help="train every --trees/--depth/--leaf combination")
+    parser.add_argument("--trees", type=int, nargs="+", default=[25, 50, 100, 300])
+    parser.add_argument("--depth", type=int, nargs="+", default=[0, 8, 12], help="max depth, 0 = unlimited")
+    parser.add_argument("--leaf", type=int, nargs="+", default=[1, 2, 5], help="min samples per leaf")
+    parser.add_argument("--tolerance", type=float, default=0.002, help="F1 given up for a faster model")
+    parser.add_argument("--max-latency-us", type=float, help="single-row p50 budget")
+    parser.add_argument("--batch-size", type=int, default=64, help="batch size for the latency measurement")
+    parser.add_argument("--window-features", action="store_true",
+                        help="train on simulated series with the sliding-window features too")
+    parser.add_argument("--trend-mix", default=DEFAULT_TREND_MIX, help="trend weights of NORMAL series")
+    parser.add_argument("--series-length", type=int, default=60, help="readings per simulated device")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between simulated readings")
+    parser.add_argument("--window", type=int, default=30, help="feature window in readings (FEATURE_WINDOW)")
+    parser.add_argument("--min-samples", type=int, default=5, help="FEATURE_MIN_SAMPLES")
+    parser.add_argument("--version", help="model version (default: UTC timestamp)")
+    parser.add_argument("--out-dir", default=script_dir, help="where motor_model.pkl goes (not written with --window-features)")
+    parser.add_argument("--registry", default=os.path.join(script_dir, "models"))
+    parser.add_argument("--no-promote", action="store_true", help="add the version without making it CURRENT")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    mix = parse_mix(args.mix)
+
+    start = time.perf_counter()
+    if args.window_features:
+        trend_mix = parse_mix(args.trend_mix, TRENDS)
+        series = (args.series_length, args.interval, args.window, args.min_samples)
+        X, y = make_series_dataset(args.rows, mix, trend_mix, *series, seed=args.seed)
+        X_val, y_val = make_series_dataset(args.val_rows, mix, trend_mix, *series, seed=args.seed + 1)
+    else:
+        X, y = make_dataset(args.rows, mix, args.chunk_size, args.seed, args.label_noise)
+        X_val, y_val = make_dataset(args.val_rows, mix, args.chunk_size, args.seed + 1, args.label_noise)
+    features = INPUT_FEATURES if args.window_features else FEATURES
+    print(f"📊 Generated {args.rows} training + {args.val_rows} validation rows "
+          f"in {time.perf_counter() - start:.1f}s ({y.mean():.1%} failures)")
+
+    results = []
+    grid = sweep_grid(args.trees, args.depth, args.leaf) if args.sweep else [DEFAULT_PARAMS]
+    for params in grid:
+        model, fit_seconds = train(params, X, y, args.seed, args.max_samples)
+        metrics, latency = evaluate(model, X_val, y_val, args.batch_size)
+        results.append({"params": params, "fit_seconds": round(fit_seconds, 2),
+                        "metrics": metrics, "latency_us": latency})
+        print(f"  trees={params['n_estimators']:<4} depth={str(params['max_depth']):<5} "
+              f"leaf={params['min_samples_leaf']:<3} f1={metrics['f1']:.4f} "
+              f"auc={metrics['roc_auc']:.4f} nodes={metrics['nodes']:<8} "
+              f"row={latency['single_row']['p50']:.0f}µs batch={latency['batch']['per_row']:.1f}µs/row "
+              f"fit={fit_seconds:.1f}s")
+
+    chosen = select(results, args.tolerance, args.max_latency_us)
+    if chosen is not results[-1]:
+        # Same seed, same forest
+        model, _ = train(chosen["params"], X, y, args.seed, args.max_samples)
+    print(f"🏆 Selected {chosen['params']}")
+
+    model_path = None
+    if not args.window_features:
+        # The pickle fallback takes the 3 base features; window-feature models
+        # only go to the registry, whose manifest records their inputs
+        os.makedirs(args.out_dir, exist_ok=True)
+        model_path = os.path.join(args.out_dir, "motor_model.pkl")
+        with open(model_path, "wb") as f:
+            pickle.dump(model, f)
+
+    metadata = {
+        "params": chosen["params"],
+        "training": {
+            "rows": args.rows,
+            "val_rows": args.val_rows,
+            "mix": dict(zip(*mix)),
+            "label_noise": args.label_noise,
+            "seed": args.seed,
+            "max_samples": args.max_samples,
+            "fit_seconds": chosen["fit_seconds"],
+            # What the subscriber's drift checks treat as in distribution (drift.py)
+            "feature_ranges": {name: [round(float(low), 4), round(float(high), 4)]
+                               for name, low, high in zip(features, X.min(axis=0), X.max(axis=0))},
+        },
+        "features": {"window": args.window, "min_samples": args.min_samples,
+                     "trend_mix": dict(zip(*trend_mix)), "series_length": args.series_length,
+                     "interval": args.interval} if args.window_features else None,
+        "metrics": chosen["metrics"],
+        "latency_us": chosen["latency_us"],
+        "sklearn_version": sklearn.__version__,
+    }
+    if args.sweep:
+        metadata["sweep"] = results
+
+    # The flattened NumPy version used by the subscriber (no sklearn needed at runtime)
+    version = args.version or datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    artifact = save_artifact(export_forest(model), args.registry, version, metadata, features)
+    if not args.no_promote:
+        set_current(args.registry, version)
+
+    sanity = SANITY_SAMPLES
+    if args.window_features:
+        # As readings from a motor in steady state
+        steady = np.column_stack([np.zeros(len(sanity)), sanity[:, 1], np.full(len(sanity), 0.05), np.zeros(len(sanity))])
+        sanity = np.hstack([sanity, steady])
+    prob = model.predict_proba(sanity)[:, 1]
+    if model_path:
+        print(f"✓ Model {version} trained and saved at: {model_path}")
+    print(f"✓ Artifact: {artifact}{'' if args.no_promote else ' (current)'}")
+    print(f"{prob} ")
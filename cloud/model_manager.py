@@ -0,0 +1,288 @@
+"""
+Model hot reload and shadow scoring.
+
+ModelManager owns the model the inference batchers score with. New versions
+come from the model registry (model_store.py): when its CURRENT file
+changes (file watch), or on a command sent to MODEL_COMMAND_TOPIC. A new
+version is loaded, checked and smoke-tested on a background thread, then
+installed with one attribute assignment per batcher. The batch being scored
+finishes on the old model and the next one uses the new model, so no
+reading is dropped or scored twice. A version that fails to load is
+logged and the current model keeps serving.
+
+With MODEL_RELOAD=shadow a new version first runs as a shadow. Every batch
+is also scored by it, after the real results were handed out, and
+ShadowScorer tracks how far it is from the serving model. `promote` makes it
+the serving model; `rollback` goes back to the previous one.
+
+Commands (JSON on MODEL_COMMAND_TOPIC, status replies on MODEL_STATUS_TOPIC):
+    {"action": "load", "version": "20261018-083349"}   serve a version (default: CURRENT)
+    {"action": "shadow", "version": "..."}             shadow-score a version
+    {"action": "promote"}                              serve the shadow model
+    {"action": "discard"}                              stop shadow scoring
+    {"action": "rollback"}                             serve the previous model again
+    {"action": "status"}
+"""
+
+import json
+import logging
+import threading
+import time
+import numpy as np
+import model_store
+from inference import predict
+
+log = logging.getLogger(__name__)
+
+RELOAD_MODES = ("swap", "shadow")
+ACTIONS = ("load", "shadow", "promote", "discard", "rollback", "status")
+
+# Normal, high temperature, high vibration, stall (full input rows, features.INPUT_FEATURES)
+SMOKE_TEST_ROWS = np.array([[28.0, 0.4, 2300, 0.0, 0.4, 0.05, 0.0],
+                            [60.0, 0.5, 2500, 2.0, 0.5, 0.05, 0.0],
+                            [30.0, 5.0, 2500, 0.0, 5.0, 1.5, 0.0],
+                            [30.0, 0.5, 500, 0.0, 0.5, 0.05, 900.0]])
+
+
+class ShadowScorer:
+    """Scores every batch with a candidate model as well and compares it with the serving model."""
+
+    def __init__(self, model, version, threshold=0.8):
+        self.model = model
+        self.version = version
+        self.threshold = threshold
+        self.started = time.time()
+        self.stats = {"batches": 0, "rows": 0, "errors": 0, "disagreements": 0,
+                      "abs_diff_sum": 0.0, "max_abs_diff": 0.0, "serving_seconds": 0.0, "shadow_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def compare(self, X, scores, serving_seconds):
+        """Called by the batcher with a scored batch and the serving model's time for it."""
+        try:
+            start = time.perf_counter()
+            shadow = predict(self.model, X)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            log.warning(f"⚠️ Shadow model {self.version} failed: {e}")
+            return
+        diff = np.abs(shadow - scores)
+        # Raw scores on opposite sides of the alert threshold
+        disagreements = int(np.count_nonzero((shadow >= self.threshold) != (scores >= self.threshold)))
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["rows"] += len(scores)
+            self.stats["disagreements"] += disagreements
+            self.stats["abs_diff_sum"] += float(diff.sum())
+            self.stats["max_abs_diff"] = max(self.stats["max_abs_diff"], float(diff.max()))
+            self.stats["serving_seconds"] += serving_seconds
+            self.stats["shadow_seconds"] += elapsed
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+        rows = stats["rows"]
+        return {
+            "version": self.version,
+            "seconds": round(time.time() - self.started, 1),
+            "rows": rows,
+            "errors": stats["errors"],
+            "mean_abs_diff": round(stats["abs_diff_sum"] / rows, 6) if rows else None,
+            "max_abs_diff": round(stats["max_abs_diff"], 6),
+            "disagreement_rate": round(stats["disagreements"] / rows, 6) if rows else None,
+            # Shadow / serving model time for the same batches
+            "latency_ratio": round(stats["shadow_seconds"] / stats["serving_seconds"], 3)
+            if stats["serving_seconds"] else None,
+        }
+
+
+class ModelManager:
+    """
+    Loads the model from `path` (a registry, artifact, .npz or .pkl, see
+    model_store.load_model) and swaps it in the batchers passed to start().
+
+    - mode: what a change of the registry's CURRENT does, "swap" or "shadow"
+    - watch_interval: seconds between checks of CURRENT, 0 disables
+    - threshold: alert threshold used to count shadow disagreements
+    - publish_status(status): called with the status after every command
+    - load: load the model now; with False it is loaded by load(), e.g.
+      while the subscriber connects to the broker
+    """
+
+    def __init__(self, path, fallback_path=None, mode="swap", watch_interval=0.0,
+                 threshold=0.8, publish_status=None, load=True):
+        if mode not in RELOAD_MODES:
+            raise ValueError(f"Unknown model reload mode: {mode}")
+        self.path = path
+        self.fallback_path = fallback_path
+        self.mode = mode
+        self.watch_interval = watch_interval
+        self.threshold = threshold
+        self.publish_status = publish_status
+        self.targets = []
+        self.stats = {"reloads": 0, "failures": 0, "promotions": 0, "rollbacks": 0}
+        self.shadow = None
+        self.previous = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.model = self.version = self._watched = None
+        if load:
+            self.load()
+
+    def load(self):
+        """Loads the model to serve. Fails loudly: there is nothing to serve without one."""
+        self.model = self._load()
+        self.version = model_store.model_version(self.model)
+        self._watched = self._pointer()
+        return self.model
+
+    def start(self, targets):
+        """Serves the model through `targets` (objects with .model/.shadow) and starts watching."""
+        self.targets = list(targets)
+        for target in self.targets:
+            target.model = self.model
+        if self.watch_interval > 0 and self._pointer() is not None:
+            self._thread = threading.Thread(target=self._watch, name="model-watch", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stopping.set()
+
+    # ---------- Loading ----------
+    def _pointer(self):
+        return model_store.current_version(self.path) if model_store.is_registry(self.path) else None
+
+    def _load(self, version=None):
+        if version is not None:
+            # Versions arrive in MQTT commands: a registry entry name, never a path
+            model_store.check_version(version)
+        model = model_store.load_model(self.path, self.fallback_path, version)
+        # Refuse a model that can't score the subscriber's features before it serves traffic
+        probs = np.asarray(predict(model, SMOKE_TEST_ROWS))
+        if probs.shape != (len(SMOKE_TEST_ROWS),) or not np.all((probs >= 0) & (probs <= 1)):
+            raise model_store.ArtifactError(f"Model {model_store.model_version(model)} fails the smoke test")
+        return model
+
+    def _install(self, model):
+        for target in self.targets:
+            target.model = model
+        self.previous = (self.model, self.version)
+        self.model = model
+        self.version = model_store.model_version(model)
+
+    def _set_shadow(self, scorer):
+        self.shadow = scorer
+        for target in self.targets:
+            target.shadow = scorer
+
+    # ---------- Actions ----------
+    def swap(self, version=None):
+        """Loads `version` (default: CURRENT) and serves it."""
+        with self._lock:
+            model = self._load(version)
+            old = self.version
+            self._install(model)
+            if self.shadow is not None and self.shadow.version == self.version:
+                self._set_shadow(None)
+            self.stats["reloads"] += 1
+        log.info(f"🔁 Serving model {self.version} (was {old})")
+
+    def shadow_version(self, version=None):
+        """Loads `version` (default: CURRENT) and scores every batch with it too."""
+        with self._lock:
+            model = self._load(version)
+            scorer = ShadowScorer(model, model_store.model_version(model), self.threshold)
+            self._set_shadow(scorer)
+        log.info(f"👥 Shadow scoring model {scorer.version} against {self.version}")
+
+    def promote(self):
+        with self._lock:
+            if self.shadow is None:
+                raise ValueError("No shadow model to promote")
+            scorer = self.shadow
+            self._set_shadow(None)
+            old = self.version
+            self._install(scorer.model)
+            self.stats["promotions"] += 1
+        log.info(f"🔁 Promoted model {self.version} (was {old}), shadow results: {json.dumps(scorer.summary())}")
+
+    def discard(self):
+        with self._lock:
+            scorer = self.shadow
+            self._set_shadow(None)
+        if scorer is not None:
+            log.info(f"🗑️ Discarded shadow model {scorer.version}: {json.dumps(scorer.summary())}")
+
+    def rollback(self):
+        with self._lock:
+            if self.previous is None:
+                raise ValueError("No previous model to roll back to")
+            model, _ = self.previous
+            old = self.version
+            self._install(model)
+            self.stats["rollbacks"] += 1
+        log.info(f"⏪ Rolled back to model {self.version} (was {old})")
+
+    def status(self):
+        return {
+            "version": self.version,
+            "previous": self.previous[1] if self.previous else None,
+            "current": self._pointer(),
+            "mode": self.mode,
+            "shadow": self.shadow.summary() if self.shadow else None,
+            **self.stats,
+        }
+
+    # ---------- Triggers ----------
+    def handle_command(self, payload):
+        """Runs a JSON command from MQTT on a background thread (loading can take a while)."""
+        try:
+            command = json.loads(payload)
+            action = command["action"]
+            if action not in ACTIONS:
+                raise ValueError(f"Unknown action {action!r}")
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning(f"⚠️ Invalid model command: {e}")
+            return
+        threading.Thread(target=self._run_command, args=(action, command.get("version")),
+                         name="model-command", daemon=True).start()
+
+    def _run_command(self, action, version):
+        result = {"action": action, "ok": True}
+        try:
+            if action == "load":
+                self.swap(version)
+            elif action == "shadow":
+                self.shadow_version(version)
+            elif action == "promote":
+                self.promote()
+            elif action == "discard":
+                self.discard()
+            elif action == "rollback":
+                self.rollback()
+        except Exception as e:
+            self.stats["failures"] += 1
+            result.update(ok=False, error=str(e))
+            log.error(f"❌ Model {action} failed: {e}")
+        if self.publish_status:
+            self.publish_status(dict(self.status(), last_command=result))
+
+    def _watch(self):
+        while not self._stopping.wait(self.watch_interval):
+            pointer = self._pointer()
+            if pointer is None or pointer == self._watched:
+                continue
+            self._watched = pointer
+            log.info(f"👀 Model registry now points at {pointer}")
+            try:
+                if self.mode == "shadow" and pointer == self.version:
+                    self.discard()
+                elif self.mode == "shadow":
+                    self.shadow_version(pointer)
+                else:
+                    self.swap(pointer)
+            except Exception as e:
+                self.stats["failures"] += 1
+                log.error(f"❌ Could not load model {pointer}, still serving {self.version}: {e}")
@@ -0,0 +1,328 @@
+"""
+Versioned model artifacts and the model registry.
+
+An artifact is a directory with the compiled forest (forest_engine.py) as
+one .npy file per array and a manifest.json describing it: format version,
+model version, feature order, the dtype / shape / sha256 of every array and
+the training metadata. Loading checks the manifest against that schema and
+the arrays against the manifest, then memory-maps them (np.load with
+mmap_mode="r"): nothing is unpickled or copied, and processes on one host
+share the pages.
+
+The registry is a directory of artifacts named by version, plus a CURRENT
+file naming the one to serve:
+
+    ml-model/models/
+        CURRENT                 20261018-083349
+        20261018-083349/
+            manifest.json
+            feature.npy  threshold.npy  right.npy  value.npy  roots.npy
+
+Artifacts are written to a temporary directory and renamed into place, and
+CURRENT is replaced atomically, so a watching subscriber never sees half a
+model.
+
+Usage (from the cloud/ folder):
+    python model_store.py list
+    python model_store.py import ml-model/motor_model.pkl --metadata train.json
+    python model_store.py verify 20261018-083349
+    python model_store.py promote 20261018-083349
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+import numpy as np
+from features import BASE_FEATURES, INPUT_FEATURES
+from forest_engine import CompiledForest, export_forest
+
+FORMAT = "compiled-forest"
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+# Registry entry names: versions come from MQTT commands, never a path
+VERSION_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+# Default model input; a model may use any of the subscriber's INPUT_FEATURES
+# (features.py), its manifest lists which and in what order
+FEATURES = BASE_FEATURES
+
+# Fixed little-endian dtypes, so an artifact and its sha256 are the same on
+# every host. CompiledForest computes with these on 64-bit little-endian
+# hosts, where loading never copies.
+ARRAY_DTYPES = {
+    "feature": np.dtype("<i8"),
+    "threshold": np.dtype("<f8"),
+    "right": np.dtype("<i8"),
+    "value": np.dtype("<f8"),
+    "roots": np.dtype("<i8"),
+}
+
+
+class ArtifactError(ValueError):
+    """The artifact is missing, corrupt or doesn't match the schema."""
+
+
+def check_version(version):
+    """`version` if it is a plain registry entry name (no path separators, not hidden), else ArtifactError."""
+    if not isinstance(version, str) or not VERSION_NAME.fullmatch(version):
+        raise ArtifactError(f"Invalid model version {version!r}")
+    return version
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ---------- Artifacts ----------
+def save_artifact(model, registry, version=None, metadata=None, features=FEATURES):
+    """
+    Writes a fitted sklearn forest (or exported forest arrays) as artifact
+    `version` of the registry and returns its path. Doesn't change CURRENT.
+    """
+    arrays = model if isinstance(model, dict) else export_forest(model)
+    version = check_version(version or datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S"))
+    if int(arrays["n_features"]) != len(features):
+        raise ArtifactError(f"Model has {arrays['n_features']} inputs, features {list(features)}")
+    path = os.path.join(registry, version)
+    if os.path.exists(path):
+        raise ArtifactError(f"Model version {version} already exists in {registry}")
+
+    os.makedirs(registry, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{version}.", dir=registry)
+    try:
+        manifest = {
+            "format": FORMAT,
+            "format_version": FORMAT_VERSION,
+            "version": version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "features": list(features),
+            "n_features": int(arrays["n_features"]),
+            "n_trees": int(len(arrays["roots"])),
+            "max_depth": int(arrays["max_depth"]),
+            "arrays": {},
+            "metadata": metadata or {},
+        }
+        for name, dtype in ARRAY_DTYPES.items():
+            filename = f"{name}.npy"
+            np.save(os.path.join(tmp, filename), np.ascontiguousarray(arrays[name], dtype=dtype))
+            manifest["arrays"][name] = {
+                "file": filename,
+                "dtype": dtype.str,
+                "shape": list(np.shape(arrays[name])),
+                "sha256": _sha256(os.path.join(tmp, filename)),
+            }
+        with open(os.path.join(tmp, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.chmod(tmp, 0o755)  # mkdtemp creates it private
+        os.rename(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return path
+
+
+def validate_manifest(manifest, features=INPUT_FEATURES):
+    """Raises ArtifactError unless `manifest` is a supported, complete forest manifest."""
+    if not isinstance(manifest, dict):
+        raise ArtifactError("Manifest is not a JSON object")
+    if manifest.get("format") != FORMAT:
+        raise ArtifactError(f"Unsupported model format {manifest.get('format')!r}")
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ArtifactError(f"Unsupported format version {manifest.get('format_version')!r}")
+    for key, kind in (("version", str), ("features", list), ("n_features", int),
+                      ("n_trees", int), ("max_depth", int), ("arrays", dict)):
+        if not isinstance(manifest.get(key), kind):
+            raise ArtifactError(f"Manifest field {key!r} is missing or not a {kind.__name__}")
+    missing = [name for name in manifest["features"] if features is not None and name not in features]
+    if missing:
+        raise ArtifactError(f"Model expects features {missing} the subscriber doesn't compute")
+    if manifest["n_features"] != len(manifest["features"]):
+        raise ArtifactError("n_features doesn't match the feature list")
+    for name, dtype in ARRAY_DTYPES.items():
+        spec = manifest["arrays"].get(name)
+        if not isinstance(spec, dict) or not {"file", "dtype", "shape", "sha256"} <= spec.keys():
+            raise ArtifactError(f"Array {name!r} is missing from the manifest")
+        if np.dtype(spec["dtype"]) != dtype:
+            raise ArtifactError(f"Array {name!r} is {spec['dtype']}, expected {dtype.str}")
+        if os.path.basename(spec["file"]) != spec["file"]:
+            raise ArtifactError(f"Array {name!r} points outside the artifact")
+
+
+def _check_arrays(arrays, manifest):
+    """Consistency of the node table, so a bad artifact fails here and not mid-traffic."""
+    nodes = len(arrays["feature"])
+    if not (len(arrays["threshold"]) == len(arrays["right"]) == len(arrays["value"]) == nodes):
+        raise ArtifactError("Node arrays have different lengths")
+    if len(arrays["roots"]) != manifest["n_trees"] or nodes == 0:
+        raise ArtifactError("Tree count doesn't match the manifest")
+    for name in ("roots", "right"):
+        if arrays[name].min() < 0 or arrays[name].max() >= nodes:
+            raise ArtifactError(f"Array {name!r} points outside the node table")
+    if arrays["feature"].min() < 0 or arrays["feature"].max() >= manifest["n_features"]:
+        raise ArtifactError("Node feature index out of range")
+
+
+def load_artifact(path, mmap=True, verify=True, features=INPUT_FEATURES):
+    """
+    Loads the artifact directory `path` as a CompiledForest (its manifest in
+    `.manifest`). `verify` also checks every array's sha256.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"Cannot read manifest of {path}: {e}") from e
+    validate_manifest(manifest, features)
+
+    arrays = {}
+    for name, spec in manifest["arrays"].items():
+        if name not in ARRAY_DTYPES:
+            continue
+        file = os.path.join(path, spec["file"])
+        if verify and _sha256(file) != spec["sha256"]:
+            raise ArtifactError(f"Checksum mismatch for {file}")
+        try:
+            array = np.load(file, mmap_mode="r" if mmap else None, allow_pickle=False)
+        except (OSError, ValueError) as e:
+            raise ArtifactError(f"Cannot load {file}: {e}") from e
+        if array.dtype != ARRAY_DTYPES[name] or list(array.shape) != spec["shape"]:
+            raise ArtifactError(f"{file} doesn't match the manifest")
+        arrays[name] = array
+    _check_arrays(arrays, manifest)
+
+    arrays["max_depth"] = manifest["max_depth"]
+    arrays["n_features"] = manifest["n_features"]
+    return CompiledForest(arrays, manifest)
+
+
+# ---------- Registry ----------
+def is_registry(path):
+    return os.path.isfile(os.path.join(path, CURRENT))
+
+
+def current_version(registry):
+    try:
+        with open(os.path.join(registry, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(registry, version):
+    """Points CURRENT at `version` (atomic rename, safe while subscribers watch it)."""
+    load_artifact(os.path.join(registry, check_version(version)))
+    tmp = os.path.join(registry, f".{CURRENT}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(registry, CURRENT))
+
+
+def list_versions(registry):
+    if not os.path.isdir(registry):
+        return []
+    return sorted(name for name in os.listdir(registry)
+                  if os.path.isfile(os.path.join(registry, name, MANIFEST)))
+
+
+def resolve(path, version=None):
+    """Artifact directory for `path` (a registry or an artifact) and an optional version."""
+    if is_registry(path) or version:
+        version = version or current_version(path)
+        return os.path.join(path, check_version(version))
+    return path
+
+
+def load_model(path, fallback_path="ml-model/motor_model.pkl", version=None):
+    """
+    The model to serve from `path`:
+    - a registry or artifact directory: the (current) versioned artifact
+    - an .npz export: the compiled forest
+    - otherwise the pickled sklearn model (`path` if it is a .pkl, else `fallback_path`)
+    """
+    if os.path.isdir(path):
+        return load_artifact(resolve(path, version))
+    if path.endswith(".npz") and os.path.exists(path):
+        return CompiledForest.load(path)
+    import pickle
+    path = path if path.endswith(".pkl") else fallback_path
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except ModuleNotFoundError as e:
+        # The registry's compiled forests need NumPy only; pickles need scikit-learn
+        raise ArtifactError(f"{path} needs {e.name}: serve it from the registry instead "
+                            f"(model_store.py import, where {e.name} is installed)") from e
+
+
+def model_features(model):
+    """Input features of a loaded model: the artifact's, BASE_FEATURES for other models."""
+    manifest = getattr(model, "manifest", None)
+    return manifest["features"] if manifest else FEATURES
+
+
+def training_ranges(model):
+    """{feature: [min, max]} of the model's training data if its manifest records them, else None."""
+    manifest = getattr(model, "manifest", None)
+    return ((manifest or {}).get("metadata") or {}).get("training", {}).get("feature_ranges")
+
+
+def model_version(model):
+    """Version of a loaded model: the artifact's, or the class name for other models."""
+    manifest = getattr(model, "manifest", None)
+    return manifest.get("version") if manifest else type(model).__name__
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--registry", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml-model", "models"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="versions in the registry")
+    importer = commands.add_parser("import", help="add a pickled sklearn forest as a new version")
+    importer.add_argument("pickle")
+    importer.add_argument("--version")
+    importer.add_argument("--metadata", help="JSON file stored as the manifest's metadata")
+    importer.add_argument("--promote", action="store_true", help="also make it CURRENT")
+    verify = commands.add_parser("verify", help="load a version with all checks")
+    verify.add_argument("version", nargs="?")
+    promote = commands.add_parser("promote", help="make a version CURRENT")
+    promote.add_argument("version")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            current = current_version(args.registry)
+            for version in list_versions(args.registry):
+                print(f"{'*' if version == current else ' '} {version}")
+        elif args.command == "import":
+            import pickle
+            with open(args.pickle, "rb") as f:
+                model = pickle.load(f)
+            metadata = None
+            if args.metadata:
+                with open(args.metadata) as f:
+                    metadata = json.load(f)
+            path = save_artifact(model, args.registry, args.version, metadata)
+            print(f"✓ Saved {path}")
+            if args.promote:
+                set_current(args.registry, os.path.basename(path))
+                print(f"✓ {os.path.basename(path)} is now current")
+        elif args.command == "verify":
+            model = load_artifact(resolve(args.registry, args.version))
+            print(f"✓ {model_version(model)}: {len(model.roots)} trees, {len(model.feature)} nodes, "
+                  f"features {model.manifest['features']}")
+        elif args.command == "promote":
+            set_current(args.registry, args.version)
+            print(f"✓ {args.version} is now current")
+    except ArtifactError as e:
+        sys.exit(f"❌ {e}")
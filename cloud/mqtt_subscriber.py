@@ -1,161 +1,572 @@
-import os
-import json
 import time
-import pickle
-import numpy as np
+# Startup phases are timed from here (metrics.StartupTimer)
+started_at = time.perf_counter()
+import json
+import logging
+import signal
+import threading
 import paho.mqtt.client as mqtt
-from google.cloud import firestore
+from collections import deque
 from datetime import datetime
-import requests
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Configuration
-# Default to public broker for testing if not set
-MQTT_BROKER = os.getenv("MQTT_BROKER", "test.mosquitto.org") 
-MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
-MQTT_TOPIC = "motor/health/data"
-MQTT_ALERT_TOPIC = "motor/health/alert"
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-
-# Initialize Firestore
-db = firestore.Client()
-
-# Load Model
-try:
-    with open("ml-model/motor_model.pkl", "rb") as f:
-        model = pickle.load(f)
-    print("✅ Logic Regression Model Loaded")
-except Exception as e:
-    print(f"❌ Error loading model: {e}")
+from smoothing import SmoothingState
+from features import FeatureState
+from drift import DriftMonitor
+from firestore_writer import BatchedFirestoreWriter, LazyClient, READINGS_COLLECTION, STORAGE_MODES
+from spool import SpooledFirestoreWriter, WriteSpool
+from rollups import RollupAggregator
+from inference import InferenceCache, MicroBatcher
+from pipeline import Pipeline
+from cluster import Cluster, default_member_id
+from forest_engine import CompiledForest
+from model_manager import ModelManager
+from fake_firestore import FakeFirestoreClient
+import payload_codec
+from alerts import AlertManager, TelegramNotifier
+from metrics import Registry, SignalProfiler, StartupTimer, SAMPLED, setup_logging, start_metrics_server
+
+# Configuration (environment / .env)
+from config import *  # noqa: F401,F403
+
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
+log = logging.getLogger("subscriber")
+startup = StartupTimer(started_at)
+startup.mark("imports", started_at)
+
+if STORAGE_MODE not in STORAGE_MODES:
+    log.critical(f"❌ Unknown STORAGE_MODE {STORAGE_MODE!r} (expected one of {', '.join(STORAGE_MODES)})")
     exit(1)
 
-def send_failure_notification(probability, data):
-    """Sends a Telegram notification for high failure risk."""
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        print("⚠️ Telegram credentials not found. Skipping notification.")
-        return
-
-    failure_time = datetime.fromtimestamp(data['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-    
-    message = (
-        f"🚨 *CRITICAL WARNING: Motor Failure Detected* 🚨\n\n"
-        f"⏰ **Time:** {failure_time}\n"
-        f"⚠️ **Failure Probability:** {probability:.1%}\n\n"
-        f"📊 **Sensor Readings:**\n"
-        f"• Temperature: {data['temperature']:.1f} °C\n"
-        f"• Vibration: {data['vibration']:.3f} m/s²\n"
-        f"• RPM: {data['rpm']:.0f}\n\n"
-        f"Please check the equipment immediately!"
+def make_db():
+    if FIRESTORE_BACKEND == "fake":
+        return FakeFirestoreClient()
+    from google.cloud import firestore
+    return firestore.Client()
+
+# Initialize Firestore on first use: warm_up() seeds the rolling windows from it
+db = LazyClient(make_db)
+
+# Background batched writer (keeps Firestore I/O off the MQTT network thread)
+writer_options = dict(
+    max_batch_size=FIRESTORE_BATCH_SIZE,
+    max_batch_age=FIRESTORE_BATCH_AGE,
+    max_queue_size=FIRESTORE_QUEUE_SIZE,
+    overflow_policy=FIRESTORE_OVERFLOW_POLICY,
+)
+if SPOOL_PATH:
+    # Writes land on local disk first and are replayed to Firestore from there
+    writer = SpooledFirestoreWriter(
+        db,
+        WriteSpool(SPOOL_PATH, int(SPOOL_MAX_MB * 1024 * 1024), SPOOL_SYNC),
+        replay_rate=SPOOL_REPLAY_RATE,
+        **writer_options,
     )
-    
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": message,
-        "parse_mode": "Markdown"
-    }
-    
+    log.info(f"💽 Firestore writes spooled to {SPOOL_PATH}")
+else:
+    writer = BatchedFirestoreWriter(db, **writer_options)
+
+# 1m/1h/1d min/max/mean buckets per device, flushed through the same writer
+rollups = RollupAggregator(writer, ROLLUP_RESOLUTIONS, ROLLUP_FLUSH_INTERVAL)
+
+# In-memory rolling window per device (seeded once from Firestore at startup)
+smoothing = SmoothingState(SMOOTHING_METHOD, SMOOTHING_WINDOW, SMOOTHING_ALPHA)
+
+# Sliding-window features per device, updated in O(1) as readings arrive
+feature_state = FeatureState(FEATURE_WINDOW, FEATURE_MIN_SAMPLES)
+
+# Model (versioned registry, swapped at runtime by the model manager), loaded by warm_up()
+models = ModelManager(
+    MODEL_PATH, MODEL_FALLBACK_PATH,
+    mode=MODEL_RELOAD,
+    watch_interval=MODEL_WATCH_INTERVAL,
+    threshold=ALERT_RAISE_THRESHOLD,
+    publish_status=lambda status: client.publish(MODEL_STATUS_TOPIC, json.dumps(status), qos=1),
+    load=False,
+)
+
+# Micro-batched inference: rows arriving within the window share one predict_proba call
+# Steady-state readings repeat: cache probabilities per quantized reading
+cache = InferenceCache(INFERENCE_CACHE_RESOLUTION, INFERENCE_CACHE_SIZE) if INFERENCE_CACHE_SIZE > 0 else None
+# The model is set by models.start() once loaded
+batcher = MicroBatcher(None, INFERENCE_BATCH_WINDOW_MS / 1000.0, INFERENCE_MAX_BATCH, cache=cache)
+# Out-of-distribution / drift checks against the served model's training ranges
+drift = DriftMonitor(DRIFT_MARGIN, DRIFT_HORIZON, DRIFT_Z_THRESHOLD) if DRIFT_MONITOR else None
+
+# Alert state per device + non-blocking Telegram delivery
+alerts = AlertManager(
+    TelegramNotifier(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_API_URL),
+    raise_threshold=ALERT_RAISE_THRESHOLD,
+    clear_threshold=ALERT_CLEAR_THRESHOLD,
+    cooldown=ALERT_COOLDOWN,
+    digest_window=ALERT_DIGEST_WINDOW,
+)
+
+# Metrics (served on /metrics) and the on-demand profiler
+metrics = Registry()
+messages_total = metrics.counter("mqtt_messages_total", "Sensor readings received")
+messages_rate = metrics.meter("mqtt_messages_per_second", "Sensor readings received per second (10 s window)")
+decode_errors = metrics.counter("mqtt_decode_errors_total", "Messages that could not be decoded")
+binary_frames = metrics.counter("mqtt_binary_frames_total", "Messages received in the binary payload format")
+stage_latency = {
+    "decode": metrics.histogram("decode_seconds", "Payload decode time per message (JSON or binary)"),
+    "inference": metrics.histogram("inference_seconds", "Time from queueing a reading to its score"),
+}
+metrics.register(batcher.batch_latency)
+metrics.register(writer.commit_latency)
+metrics.register(alerts.notifier.latency)
+if cache:
+    metrics.counter_fn("inference_cache_hits_total", lambda: cache.stats["hits"], "Readings scored from the cache")
+    metrics.counter_fn("inference_cache_misses_total", lambda: cache.stats["misses"], "Readings that needed the model")
+    metrics.gauge("inference_cache_size", lambda: len(cache.entries), "Quantized readings cached")
+metrics.counter_fn("unscored_readings_total", lambda: batcher.stats["unscored"],
+                   "Readings stored without a prediction because the model failed on them")
+metrics.counter_fn("model_reloads_total", lambda: models.stats["reloads"] + models.stats["promotions"],
+                   "Model versions swapped in at runtime")
+metrics.counter_fn("model_shadow_rows_total", lambda: models.shadow.summary()["rows"] if models.shadow else 0,
+                   "Readings also scored by the shadow model")
+metrics.gauge("model_shadow_disagreement_rate",
+              lambda: (models.shadow.summary()["disagreement_rate"] or 0) if models.shadow else 0,
+              "Share of readings where the shadow model lands on the other side of the alert threshold")
+if drift:
+    metrics.counter_fn("ood_readings_total", lambda: drift.stats["ood"], "Readings with a model input outside its training range")
+    metrics.counter_fn("anomalous_readings_total", lambda: drift.stats["anomalous"],
+                       "Readings far outside their device's running distribution")
+    metrics.gauge("ood_rate", lambda: drift.summary()["ood_rate"], "Share of recent readings out of distribution")
+    metrics.gauge("prediction_mean_recent", lambda: drift.summary()["prediction_mean_recent"],
+                  "Mean raw failure probability of the recent readings")
+    metrics.gauge("prediction_drift", lambda: drift.summary()["prediction_drift"],
+                  "Recent minus long-run mean raw failure probability")
+metrics.gauge("startup_seconds", lambda: startup.phases.get("ready", {}).get("at", 0),
+              "Seconds from the first import until readings were processed (0 while starting)")
+profiler = SignalProfiler(PROFILE_DIR)
+
+# Messages received before warm_up() is done, replayed in order once it is
+ready = threading.Event()
+startup_buffer = deque(maxlen=STARTUP_BUFFER_SIZE)
+startup_lock = threading.Lock()
+startup_stats = {"buffered": 0, "dropped": 0}
+# Set once the client has disconnected at shutdown
+stopping = threading.Event()
+
+def seed_windows():
+    with startup.phase("firestore"):
+        try:
+            seeded = smoothing.seed_from_firestore(db, READINGS_COLLECTION if STORAGE_MODE == "combined" else "predictions")
+            log.info(f"✅ Rolling windows seeded for {seeded} device(s)")
+        except Exception as e:
+            log.warning(f"⚠️ Could not seed rolling window from Firestore: {e}")
+
+def warm_up():
+    """
+    The slow part of startup, run while the client connects and subscribes:
+    loading and smoke-testing the model, and (on a second thread) creating
+    the Firestore client and seeding the rolling windows. The messages
+    received meanwhile are then replayed in order. Returns False if there
+    is no model to serve.
+    """
+    seeding = threading.Thread(target=seed_windows, name="startup-seed", daemon=True)
+    seeding.start()
     try:
-        response = requests.post(url, json=payload, timeout=5)
-        print(f"telegram notification sent: {response.status_code}")
+        with startup.phase("model"):
+            models.load()
     except Exception as e:
-        print(f"Failed to send Telegram notification: {e}")
+        log.critical(f"❌ Error loading model: {e}")
+        return False
+    if isinstance(models.model, CompiledForest):
+        log.info(f"✅ Compiled Random Forest {models.version} Loaded ({len(models.model.roots)} trees)")
+    else:
+        log.info("✅ Random Forest Model Loaded (scikit-learn)")
+    models.start([batcher, drift] if drift else [batcher])
+    seeding.join()
+
+    with startup_lock:
+        replayed = len(startup_buffer)
+        while startup_buffer:
+            handle_message(startup_buffer.popleft())
+        ready.set()
+    startup.mark("ready")
+    log.info(f"✅ Ready, replayed {replayed} buffered message(s) ({startup_stats['dropped']} dropped): "
+             f"{json.dumps(startup.report())}")
+    return True
 
 def process_sensor_data(data):
     """
     Processes received sensor data:
-    1. Predicts failure probability
+    1. Updates the device's window features and queues the reading for
+       (micro-batched) failure prediction
     2. Applies smoothing
-    3. Saves to Firestore
+    3. Queues the documents for a batched Firestore write
     """
-    try:
-        # 1. Prediction
-        X = np.array([[ 
-            data['temperature'],
-            data['vibration'],
-            data['rpm']
-        ]])
-        raw_prob = model.predict_proba(X)[0][1]
-
-        # 2. Smoothing (Rolling Window)
-        previous_preds = db.collection("predictions")\
-            .order_by("timestamp", direction=firestore.Query.DESCENDING)\
-            .limit(4)\
-            .get()
-
-        rolling_values = [raw_prob]
-        for doc in previous_preds:
-            p_data = doc.to_dict()
-            val = p_data.get("raw_failure_probability", p_data.get("failure_probability", 0.0))
-            rolling_values.append(val)
-            
-        mean_prob = sum(rolling_values) / len(rolling_values)
-
-        # 3. Firestore Write (Sensor Data)
-        sensor_ref = db.collection("sensor_data").add({
+    timestamp = data['timestamp'] if isinstance(data['timestamp'], (int, float)) else time.time()
+    features = feature_state.row(data['device_id'], timestamp, data['temperature'], data['vibration'], data['rpm'])
+    submitted_at = time.monotonic()
+
+    def on_scored(raw_prob):
+        stage_latency["inference"].observe(time.monotonic() - submitted_at)
+        # Hand off to the worker pool; one device always goes to the same worker
+        workers.submit(data['device_id'], (data, raw_prob, features))
+
+    batcher.submit(features, on_scored)
+
+def process_sensor_frame(device_id, rows):
+    """
+    Same as process_sensor_data for a decoded binary frame. Rows are plain
+    tuples; the reading dict the workers need is only built once a row has
+    been scored.
+    """
+    submitted_at = time.monotonic()
+    received_ts = int(time.time())
+
+    def scored_callback(row, features):
+        def on_scored(raw_prob):
+            stage_latency["inference"].observe(time.monotonic() - submitted_at)
+            data = payload_codec.to_dict(device_id, row)
+            if not data['timestamp']:
+                data['timestamp'] = received_ts
+            workers.submit(device_id, (data, raw_prob, features))
+        return on_scored
+
+    for row in rows:
+        timestamp, seq, temperature, vibration, rpm = row
+        features = feature_state.row(device_id, timestamp or received_ts, temperature, vibration, rpm)
+        batcher.submit(features, scored_callback(row, features))
+
+def record_unscored(data):
+    """
+    Stores a reading the model failed on without a prediction: no
+    smoothing, alert or MQTT result, but the raw values are kept (and
+    rolled up).
+    """
+    device_id = data['device_id']
+    reading = {
+        "device_id": device_id,
+        "temperature": data['temperature'],
+        "vibration": data['vibration'],
+        "rpm": data['rpm'],
+        "timestamp": datetime.utcnow(),
+    }
+    if STORAGE_MODE == "combined":
+        writer.write_combined_reading(dict(reading, unscored=True))
+    else:
+        writer.write([(writer.db.collection("sensor_data").document(), reading)])
+    if rollups.resolutions:
+        rollups.add(device_id, time.time(), {
             "temperature": data['temperature'],
             "vibration": data['vibration'],
             "rpm": data['rpm'],
-            "timestamp": datetime.utcnow()
-        })
-        sensor_doc_id = sensor_ref[1].id
-
-        # 4. Check Risk
-        if mean_prob > 0.8:
-            send_failure_notification(mean_prob, data)
-
-        # 5. Firestore Write (Prediction)
-        db.collection("predictions").add({
-            "sensor_data_id": sensor_doc_id,
-            "failure_probability": float(mean_prob),
-            "raw_failure_probability": float(raw_prob),
-            "timestamp": datetime.utcnow()
         })
+    log.warning(f"⚠️ Reading from {device_id} stored without a prediction (inference failed)")
+
+def handle_prediction(item):
+    """Runs on a pool worker once the batcher has scored a reading (steps 2-5)."""
+    data, raw_prob, features = item
+    try:
+        if raw_prob is None:
+            record_unscored(data)
+            return
+        # 2. Smoothing (in-memory rolling window, no Firestore read)
+        device_id = data['device_id']
+        mean_prob = smoothing.update(device_id, raw_prob)
+        if cluster:
+            cluster.touch(device_id)
+        # Inputs outside the training ranges / the device's history, prediction drift
+        checks = drift.update(device_id, features, raw_prob) if drift else {}
+
+        # 3. Check Risk (raise / sustain / clear; Telegram is sent in the background)
+        alerts.update(device_id, mean_prob, data)
 
-        print(f"✅ Data Processed: Temp={data['temperature']} Vib={data['vibration']} RPM={data['rpm']} -> Risk={mean_prob:.1%}")
+        # 4. Firestore Write (queued; committed in batches by the writer thread)
+        if STORAGE_MODE == "combined":
+            writer.write_combined_reading({
+                "device_id": device_id,
+                "temperature": data['temperature'],
+                "vibration": data['vibration'],
+                "rpm": data['rpm'],
+                "failure_probability": float(mean_prob),
+                "raw_failure_probability": float(raw_prob),
+                "timestamp": datetime.utcnow(),
+                **checks,
+            })
+        else:
+            # sensor_data + prediction, queued as one ordered batch group
+            writer.write_reading(
+                {
+                    "device_id": device_id,
+                    "temperature": data['temperature'],
+                    "vibration": data['vibration'],
+                    "rpm": data['rpm'],
+                    "timestamp": datetime.utcnow()
+                },
+                {
+                    "device_id": device_id,
+                    "failure_probability": float(mean_prob),
+                    "raw_failure_probability": float(raw_prob),
+                    "timestamp": datetime.utcnow(),
+                    **checks,
+                }
+            )
 
-        # 6. Publish Result back to MQTT (for ESP32 to react)
+        if rollups.resolutions:
+            rollups.add(device_id, time.time(), {
+                "temperature": data['temperature'],
+                "vibration": data['vibration'],
+                "rpm": data['rpm'],
+                "failure_probability": float(mean_prob),
+            })
+
+        log.info(
+            "✅ Data Processed [%s]: Temp=%s Vib=%s RPM=%s -> Risk=%.1f%%",
+            device_id, data['temperature'], data['vibration'], data['rpm'], mean_prob * 100,
+            extra=dict(SAMPLED, fields={"device_id": device_id, "raw_prob": raw_prob, "prob": mean_prob}),
+        )
+
+        # 5. Publish Result back to MQTT (for ESP32 to react)
         alert_payload = {
+            "device_id": device_id,
             "probability": float(mean_prob)
         }
-        client.publish(MQTT_ALERT_TOPIC, json.dumps(alert_payload))
-        print(f"📤 Published result to {MQTT_ALERT_TOPIC}")
+        # Echo the load generator's correlation fields (test_mqtt_publisher.py)
+        if 'seq' in data:
+            alert_payload["seq"] = data['seq']
+        alert_topic = MQTT_ALERT_TOPIC.format(device_id=device_id)
+        client.publish(alert_topic, json.dumps(alert_payload))
+        log.debug("📤 Published result to %s", alert_topic, extra=SAMPLED)
+        if "first_reading" not in startup.phases:
+            startup.mark("first_reading")
 
     except Exception as e:
-        print(f"❌ Error processing data: {e}")
+        log.error(f"❌ Error processing data: {e}")
+
+# Worker pool for the sinks (smoothing, Telegram, Firestore queue, MQTT publish).
+# Goes through the profiler so `kill -USR1` can profile it without a restart.
+workers = Pipeline(lambda item: profiler.call(handle_prediction, item), PIPELINE_WORKERS, PIPELINE_QUEUE_SIZE)
+for stat in workers.latency.values():
+    metrics.register(stat)
+metrics.gauge("pipeline_queue_depth", workers.depth, "Readings waiting for a pool worker")
+metrics.gauge("inference_queue_depth", lambda: batcher.queue.qsize(), "Readings waiting to be scored")
+metrics.gauge("firestore_queue_depth", lambda: writer.depth(), "Write groups waiting for a Firestore commit")
+if SPOOL_PATH:
+    metrics.gauge("spool_bytes", lambda: writer.spool.size_bytes(), "Payload bytes in the local write spool")
+    metrics.gauge("spool_recovering", lambda: int(writer.recovering), "1 while a spooled backlog is being replayed")
+    metrics.gauge("spool_dead_letters", lambda: writer.spool.dead_letters(), "Write groups Firestore rejected")
+
+def export_device_state(device_id):
+    """Rolling windows and alert state of a device, for its next owner (cluster.py)."""
+    return {"smoothing": smoothing.export(device_id), "alert": alerts.export(device_id),
+            "features": feature_state.export(device_id), "drift": drift.export(device_id) if drift else None}
+
+def import_device_state(device_id, state, recent):
+    smoother = smoothing.devices.get(device_id)
+    # Readings processed here before the handoff arrived go on top of the handed-off window
+    recent_values = list(smoother.values)[-recent:] if smoother is not None and recent else []
+    if state.get("smoothing"):
+        smoothing.restore(device_id, state["smoothing"], recent_values)
+    alerts.restore(device_id, state["alert"], merge=bool(recent))
+    if state.get("features"):
+        local = feature_state.export(device_id) if recent else None
+        handed_off = state["features"]["readings"]
+        since = handed_off[-1][0] if handed_off else float("-inf")
+        recent_readings = [reading for reading in local["readings"] if reading[0] > since] if local else []
+        feature_state.restore(device_id, state["features"], recent_readings)
+    # Running statistics: the handed-off ones replace the few readings seen here
+    if drift and state.get("drift"):
+        drift.restore(device_id, state["drift"])
+
+def drop_device_state(device_id):
+    smoothing.drop(device_id)
+    alerts.drop(device_id)
+    feature_state.drop(device_id)
+    if drift:
+        drift.drop(device_id)
+
+# Scale-out: device ownership across subscriber processes sharing one subscription
+cluster = None
+if CLUSTER_GROUP:
+    cluster = Cluster(
+        CLUSTER_GROUP, CLUSTER_MEMBER or default_member_id(), MQTT_TOPIC, CLUSTER_INTAKE,
+        export_state=export_device_state,
+        import_state=import_device_state,
+        drop_state=drop_device_state,
+        known_devices=lambda: smoothing.devices,
+        # State changes run on the device's worker after the readings still
+        # being scored have reached it
+        schedule=lambda device_id, fn: batcher.call_soon(lambda: workers.run_on(device_id, fn)),
+        heartbeat=CLUSTER_HEARTBEAT,
+    )
+    metrics.gauge("cluster_members", lambda: len(cluster.members), "Live members of the subscriber cluster")
+    metrics.gauge("cluster_devices_owned", lambda: len(cluster.active), "Devices whose state lives in this process")
+    metrics.counter_fn("cluster_forwarded_total", lambda: cluster.stats["forwarded"], "Readings forwarded to their owner")
+    metrics.counter_fn("cluster_handoffs_total", lambda: cluster.stats["handoffs_sent"], "Device states handed to another member")
+
+def pipeline_stats():
+    """Queue depths and per-stage latencies of the whole processing pipeline."""
+    stats = workers.stats()
+    stats["latency"].update({stage: stat.snapshot() for stage, stat in stage_latency.items()})
+    stats["inference_queue_depth"] = batcher.queue.qsize()
+    if cache:
+        stats["inference_cache"] = dict(cache.stats, size=len(cache.entries), hit_rate=round(cache.hit_rate(), 4))
+    stats["firestore_queue_depth"] = writer.depth()
+    stats["feature_windows"] = len(feature_state.devices)
+    if drift:
+        stats["drift"] = drift.summary()
+    stats["model"] = models.status()
+    stats["startup"] = dict(startup.report(), **startup_stats)
+    if cluster:
+        stats["cluster"] = dict(cluster.stats, members=len(cluster.members), devices=len(cluster.active))
+    return stats
+
+def report_stats():
+    while True:
+        time.sleep(STATS_INTERVAL)
+        log.info(f"📈 Pipeline stats: {json.dumps(pipeline_stats())}")
+
+def shutdown(signum, frame):
+    """SIGTERM (docker stop): stop receiving, the main thread then drains the pipeline."""
+    log.info("🛑 SIGTERM received, draining in-flight messages...")
+    if cluster:
+        # Hand the devices over while still connected, then disconnect
+        threading.Thread(target=leave_cluster, name="cluster-leave").start()
+    else:
+        client.disconnect()
+        stopping.set()
+
+def leave_cluster():
+    handed_off = cluster.leave()
+    log.info(f"🧩 Left cluster {CLUSTER_GROUP}, handed off {handed_off} device(s)")
+    client.disconnect()
+    stopping.set()
+
+def device_id_from_topic(topic):
+    """Device id taken from the topic level matched by "+" in MQTT_TOPIC."""
+    return payload_codec.device_id_from_topic(topic, MQTT_TOPIC)
+
+def make_client():
+    options = dict(
+        client_id=f"subscriber-{cluster.member_id}" if cluster else "",
+        protocol=mqtt.MQTTv5 if MQTT_PROTOCOL == "5" else mqtt.MQTTv311,
+    )
+    # paho-mqtt 2.x requires the callback API version, 1.x doesn't know it
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, **options)
+    return mqtt.Client(**options)
 
 # MQTT Callbacks
-def on_connect(client, userdata, flags, rc):
-    print(f"📡 Connected to MQTT Broker with result code {rc}")
-    client.subscribe(MQTT_TOPIC)
+def on_connect(client, userdata, flags, rc, properties=None):
+    log.info(f"📡 Connected to MQTT Broker with result code {rc}")
+    if cluster:
+        cluster.join(client)
+    else:
+        client.subscribe(MQTT_TOPIC)
+    if MODEL_COMMAND_TOPIC:
+        client.subscribe(MODEL_COMMAND_TOPIC, qos=1)
+
+def on_connect_fail(client, userdata):
+    log.warning(f"⚠️ Could not connect to {MQTT_BROKER}:{MQTT_PORT}, retrying")
 
 def on_message(client, userdata, msg):
+    if not ready.is_set():
+        with startup_lock:
+            if not ready.is_set():
+                # Still warming up: hold the message (the oldest go beyond STARTUP_BUFFER_SIZE)
+                if len(startup_buffer) == startup_buffer.maxlen:
+                    startup_stats["dropped"] += 1
+                startup_buffer.append(msg)
+                startup_stats["buffered"] += 1
+                return
+    handle_message(msg)
+
+def handle_message(msg):
     try:
+        received_at = time.monotonic()
+        if MODEL_COMMAND_TOPIC and msg.topic == MODEL_COMMAND_TOPIC:
+            models.handle_command(msg.payload)
+            return
+        topic, forwarded = msg.topic, False
+        if cluster:
+            # Cluster topics (membership, handoffs) are consumed here; readings
+            # forwarded by another member come back with their original topic
+            routed = cluster.intercept(msg)
+            if routed is None:
+                return
+            topic, forwarded = routed
+
+        if payload_codec.is_binary(msg.payload):
+            # Compact binary frame (one or a batch of readings), see payload_codec.py
+            device_id, rows = payload_codec.decode_rows(msg.payload)
+            device_id = device_id or device_id_from_topic(topic)
+            if cluster and not cluster.accepts(device_id, forwarded):
+                cluster.forward(topic, msg.payload, device_id)
+                return
+            stage_latency["decode"].observe(time.monotonic() - received_at)
+            binary_frames.inc()
+            messages_total.inc(len(rows))
+            messages_rate.mark(len(rows))
+            process_sensor_frame(device_id, rows)
+            return
+
         payload = msg.payload.decode()
         data = json.loads(payload)
         # Ensure timestamp exists or use current
         if 'timestamp' not in data:
             data['timestamp'] = int(time.time())
-            
+        # Device id from the payload if the device sends one, otherwise from the topic
+        data['device_id'] = str(data.get('device_id') or device_id_from_topic(topic))
+        if cluster and not cluster.accepts(data['device_id'], forwarded):
+            # Another member owns this device (and its rolling window)
+            cluster.forward(topic, msg.payload, data['device_id'])
+            return
+        stage_latency["decode"].observe(time.monotonic() - received_at)
+        messages_total.inc()
+        messages_rate.mark()
+
+        # Only queues the reading; inference and I/O happen off the network thread
         process_sensor_data(data)
-    except json.JSONDecodeError:
-        print("⚠️ Received non-JSON message")
+    except (json.JSONDecodeError, UnicodeDecodeError, payload_codec.PayloadError) as e:
+        decode_errors.inc()
+        log.warning(f"⚠️ Received undecodable message on {msg.topic}: {e}")
     except Exception as e:
-        print(f"❌ Error processing message: {e}")
+        log.error(f"❌ Error processing message: {e}")
 
 # Main Execution
 if __name__ == "__main__":
-    client = mqtt.Client()
+    client = make_client()
+    if cluster:
+        cluster.configure(client)
     client.on_connect = on_connect
+    client.on_connect_fail = on_connect_fail
     client.on_message = on_message
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGUSR1, profiler.start().request)
+
+    if STATS_INTERVAL > 0:
+        threading.Thread(target=report_stats, name="stats", daemon=True).start()
+    if METRICS_PORT:
+        start_metrics_server(metrics, METRICS_PORT)
+        log.info(f"📊 Metrics on http://0.0.0.0:{METRICS_PORT}/metrics")
 
-    print(f"🚀 Connecting to broker: {MQTT_BROKER}:{MQTT_PORT}...")
+    log.info(f"🚀 Connecting to broker: {MQTT_BROKER}:{MQTT_PORT}...")
+    exit_code = 0
     try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.loop_forever()
+        # The network thread connects and subscribes while the model loads
+        client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+        client.loop_start()
+        if warm_up():
+            stopping.wait()
+        else:
+            exit_code = 1
+            client.disconnect()
+    except KeyboardInterrupt:
+        log.info("🛑 Subscriber stopped by user.")
     except Exception as e:
-        print(f"❌ Connection Failed: {e}")
+        log.error(f"❌ Connection Failed: {e}")
+    finally:
+        client.loop_stop()
+        # Drain stage by stage so nothing in flight is lost
+        log.info("💾 Flushing pending predictions and Firestore writes...")
+        models.close()
+        batcher.close()
+        workers.close()
+        rollups.close()
+        writer.close()
+        alerts.close()
+        log.info(f"✅ Shutdown complete: {json.dumps(pipeline_stats())}")
+    exit(exit_code)
@@ -0,0 +1,170 @@
+"""
+Compact binary payload format for sensor readings (alternative to JSON).
+
+All integers and floats are little-endian, no padding.
+
+Single reading frame (kind 0x01):
+
+    version  u8     PAYLOAD_VERSION
+    kind     u8     0x01
+    id_len   u8     length of the device id, 0 = take it from the topic
+    id       bytes  ASCII device id (id_len bytes)
+    record          see RECORD below
+
+Batch frame (kind 0x02), N readings of one device in a single publish:
+
+    version, kind=0x02, id_len, id   as above
+    count    u16    number of records
+    record * count
+
+RECORD (18 bytes):
+
+    timestamp    u32   unix seconds, 0 = "not set" (the subscriber uses now)
+    seq          u32   per-device counter (loss detection / load test matching)
+    temperature  f32   °C
+    vibration    f32   m/s² RMS
+    rpm          u16
+
+A JSON payload always starts with "{", so both formats can share a topic.
+"""
+
+import struct
+import numpy as np
+from smoothing import DEFAULT_DEVICE_ID
+
+PAYLOAD_VERSION = 1
+KIND_READING = 0x01
+KIND_BATCH = 0x02
+
+_HEADER = struct.Struct("<BBB")
+_COUNT = struct.Struct("<H")
+_RECORD = struct.Struct("<IIffH")
+
+# Same layout as _RECORD, for zero-copy decoding of whole batch frames
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<u4"),
+    ("seq", "<u4"),
+    ("temperature", "<f4"),
+    ("vibration", "<f4"),
+    ("rpm", "<u2"),
+])
+assert RECORD_DTYPE.itemsize == _RECORD.size
+
+MAX_BATCH = 0xFFFF
+
+
+class PayloadError(ValueError):
+    """Raised for a binary payload that can't be decoded."""
+
+
+def is_binary(payload):
+    return len(payload) > 0 and payload[0] == PAYLOAD_VERSION
+
+
+def _header(kind, device_id):
+    raw_id = (device_id or "").encode("ascii")
+    if len(raw_id) > 255:
+        raise ValueError("device id longer than 255 bytes")
+    return _HEADER.pack(PAYLOAD_VERSION, kind, len(raw_id)) + raw_id
+
+
+def _device_id(payload, end):
+    try:
+        return bytes(payload[_HEADER.size:end]).decode("ascii") if end > _HEADER.size else None
+    except UnicodeDecodeError:
+        raise PayloadError("device id is not ASCII") from None
+
+
+def encode_reading(temperature, vibration, rpm, timestamp=0, seq=0, device_id=None):
+    """One reading as a single reading frame."""
+    return _header(KIND_READING, device_id) + _RECORD.pack(
+        int(timestamp), int(seq), temperature, vibration, int(rpm))
+
+
+def encode_batch(readings, device_id=None):
+    """
+    Several readings of one device as a batch frame. `readings` is a
+    sequence of (temperature, vibration, rpm, timestamp, seq) tuples.
+    """
+    if len(readings) > MAX_BATCH:
+        raise ValueError(f"at most {MAX_BATCH} readings per frame")
+    records = np.empty(len(readings), dtype=RECORD_DTYPE)
+    for i, (temperature, vibration, rpm, timestamp, seq) in enumerate(readings):
+        records[i] = (int(timestamp), int(seq), temperature, vibration, int(rpm))
+    return _header(KIND_BATCH, device_id) + _COUNT.pack(len(readings)) + records.tobytes()
+
+
+def decode(payload):
+    """
+    Decodes a single or batch frame without building per-reading objects.
+
+    Returns (device_id, records): device_id is None if the frame doesn't
+    carry one, records is a read-only NumPy structured array (RECORD_DTYPE)
+    viewing the payload buffer.
+    """
+    if len(payload) < _HEADER.size:
+        raise PayloadError("payload too short")
+    version, kind, id_len = _HEADER.unpack_from(payload)
+    if version != PAYLOAD_VERSION:
+        raise PayloadError(f"unsupported payload version {version}")
+
+    offset = _HEADER.size + id_len
+    device_id = _device_id(payload, offset)
+
+    if kind == KIND_READING:
+        count = 1
+    elif kind == KIND_BATCH:
+        if len(payload) < offset + _COUNT.size:
+            raise PayloadError("batch frame without count")
+        (count,) = _COUNT.unpack_from(payload, offset)
+        offset += _COUNT.size
+    else:
+        raise PayloadError(f"unknown frame kind {kind:#x}")
+
+    if len(payload) != offset + count * RECORD_DTYPE.itemsize:
+        raise PayloadError(f"expected {count} record(s), got {len(payload) - offset} bytes")
+    return device_id, np.frombuffer(payload, dtype=RECORD_DTYPE, count=count, offset=offset)
+
+
+def decode_rows(payload):
+    """
+    Decodes a frame into (device_id, rows), each row a plain
+    (timestamp, seq, temperature, vibration, rpm) tuple. Single readings
+    take a struct fast path; batches are converted from the NumPy view
+    in one call.
+    """
+    if len(payload) >= _HEADER.size and payload[1] == KIND_READING:
+        version, kind, id_len = _HEADER.unpack_from(payload)
+        offset = _HEADER.size + id_len
+        if version == PAYLOAD_VERSION and len(payload) == offset + _RECORD.size:
+            device_id = _device_id(payload, offset)
+            return device_id, [_RECORD.unpack_from(payload, offset)]
+    device_id, records = decode(payload)
+    return device_id, records.tolist()
+
+
+def to_dict(device_id, row):
+    """The JSON-style reading dict for one decoded row (built past the decode stage)."""
+    timestamp, seq, temperature, vibration, rpm = row
+    return {
+        "device_id": device_id,
+        # float32 on the wire: drop the noise digits (25.3 -> 25.299999237)
+        "temperature": round(temperature, 3),
+        "vibration": round(vibration, 4),
+        "rpm": rpm,
+        "timestamp": timestamp,
+        "seq": seq,
+    }
+
+
+def device_id_from_topic(topic, pattern):
+    """
+    Device id taken from the topic level matched by "+" in the subscription
+    `pattern` (e.g. motor/+/data), for payloads that don't carry one.
+    """
+    pattern = pattern.split("/")
+    if "+" not in pattern:
+        return DEFAULT_DEVICE_ID
+    levels = topic.split("/")
+    index = pattern.index("+")
+    return levels[index] if index < len(levels) else DEFAULT_DEVICE_ID
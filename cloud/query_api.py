@@ -0,0 +1,380 @@
+"""
+Read API for the dashboard, mounted by the FastAPI app (htpp_old_code/main.py).
+
+The dashboard used to scan whole collections for its statistics and CSV
+export. These endpoints answer from the rollups the subscriber maintains
+incrementally (rollups.py) and from bounded range queries, so a request
+costs O(result) documents, not O(history):
+
+    GET /api/summary      count, mean / min / max per metric and the risk
+                          distribution of a device over a time range
+    GET /api/series       the range's rollup buckets, for charts (paginated)
+    GET /api/readings     raw readings, newest first (paginated)
+    GET /api/export.csv   raw readings of the range as a streamed CSV
+
+`start` / `end` are ISO 8601 (UTC without an offset) or epoch seconds; the
+default range is the last 24 hours. Summaries and series are aligned to
+rollup buckets and lag the subscriber by its ROLLUP_FLUSH_INTERVAL. A page
+ends with `next_page_token` (null on the last page), passed back as
+`page_token`. Responses other than the export are cached in process for
+`cache_ttl` seconds, and sent with the same Cache-Control max-age.
+
+Raw readings are looked up by `device_id`; documents stored before the
+subscriber wrote one are not returned.
+"""
+
+import base64
+import csv
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from firestore_writer import READINGS_COLLECTION
+from rollups import METRICS, RESOLUTIONS, ROLLUP_COLLECTION, risk_level, to_epoch
+from smoothing import DEFAULT_DEVICE_ID
+
+DEFAULT_RANGE = timedelta(hours=24)
+# Resolution used for a range up to this long (a few hundred buckets at most)
+AUTO_RESOLUTIONS = (("1m", 12 * 3600), ("1h", 30 * 86400), ("1d", float("inf")))
+# Values per Firestore "in" filter
+IN_LIMIT = 30
+EXPORT_PAGE_SIZE = 500
+CSV_HEADERS = ["Timestamp", "Device", "Temperature (C)", "Vibration (m/s2)", "RPM",
+               "Failure Probability (%)", "Risk Level"]
+
+
+def parse_time(value, default):
+    """ISO 8601 or epoch seconds -> aware UTC datetime; `default` if empty."""
+    if value in (None, ""):
+        return default
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time {value!r}, expected ISO 8601 or epoch seconds") from None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def auto_resolution(seconds):
+    for resolution, longest in AUTO_RESOLUTIONS:
+        if seconds <= longest:
+            return resolution
+
+
+def isoformat(value):
+    return datetime.fromtimestamp(to_epoch(value), timezone.utc).isoformat()
+
+
+def encode_token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def decode_token(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise ValueError("Invalid page_token") from None
+
+
+def decode_time(token):
+    """Bucket start of a series page_token."""
+    try:
+        return datetime.fromisoformat(decode_token(token))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid page_token") from None
+
+
+def encode_cursor(timestamp, doc_id):
+    """page_token after a reading: its exact stored timestamp (to the microsecond) and document id."""
+    if isinstance(timestamp, datetime):
+        value = (timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)).isoformat()
+    else:
+        value = isoformat(timestamp)
+    return encode_token([value, doc_id])
+
+
+def decode_cursor(token):
+    """(naive UTC timestamp, document id) of a readings page_token."""
+    try:
+        timestamp, doc_id = decode_token(token)
+        return _naive(datetime.fromisoformat(timestamp)), str(doc_id)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid page_token") from None
+
+
+class TTLCache:
+    """LRU of computed responses that expire `ttl` seconds after they were computed."""
+
+    def __init__(self, ttl, max_size=256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        if self.ttl <= 0:
+            return compute()
+        now = time.monotonic()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+        # Computed outside the lock: concurrent misses may both query Firestore
+        value = compute()
+        with self._lock:
+            self.entries[key] = (now + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return value
+
+
+class ReadStore:
+    """
+    The queries behind the read API. `storage_mode` is the subscriber's
+    STORAGE_MODE ("split" joins sensor_data with predictions, "combined"
+    reads `readings`).
+    """
+
+    def __init__(self, db, storage_mode="split", cache_ttl=15.0, cache_size=256):
+        self.db = db
+        self.storage_mode = storage_mode
+        self.cache = TTLCache(cache_ttl, cache_size)
+
+    def cached(self, key, compute):
+        return self.cache.get(key, compute)
+
+    # ---------- Rollups ----------
+    def _buckets(self, device_id, resolution, start, end, after=None, limit=None):
+        query = (self.db.collection(ROLLUP_COLLECTION)
+                 .where("device_id", "==", device_id)
+                 .where("resolution", "==", resolution)
+                 .where("bucket_start", ">" if after else ">=", after or _bucket_floor(start, resolution))
+                 .where("bucket_start", "<", end)
+                 .order_by("bucket_start"))
+        if limit is not None:
+            query = query.limit(limit)
+        return (snapshot.to_dict() for snapshot in query.stream())
+
+    def summary(self, device_id, start, end):
+        resolution = auto_resolution((end - start).total_seconds())
+        count, buckets = 0, 0
+        counts, sums, mins, maxs, risk = {}, {}, {}, {}, {"low": 0, "medium": 0, "high": 0}
+        for bucket in self._buckets(device_id, resolution, start, end):
+            if not bucket.get("count"):
+                continue
+            buckets += 1
+            count += bucket["count"]
+            for level, n in (bucket.get("risk") or {}).items():
+                risk[level] = risk.get(level, 0) + n
+            for metric in METRICS:
+                values = bucket.get(metric)
+                if not values:
+                    continue
+                # Rollups written before per-metric counts: every reading had every metric
+                counts[metric] = counts.get(metric, 0) + values.get("count", bucket["count"])
+                sums[metric] = sums.get(metric, 0.0) + values["sum"]
+                mins[metric] = min(mins.get(metric, values["min"]), values["min"])
+                maxs[metric] = max(maxs.get(metric, values["max"]), values["max"])
+        result = {
+            "device_id": device_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "resolution": resolution,
+            "buckets": buckets,
+            "count": count,
+            "risk": risk,
+        }
+        for metric in METRICS:
+            result[metric] = {"mean": sums[metric] / counts[metric], "min": mins[metric], "max": maxs[metric]} \
+                if counts.get(metric) else None
+        return result
+
+    def series(self, device_id, start, end, resolution=None, limit=500, page_token=None):
+        resolution = resolution or auto_resolution((end - start).total_seconds())
+        after = decode_time(page_token) if page_token else None
+        buckets = list(self._buckets(device_id, resolution, start, end, after, limit + 1))
+        more = len(buckets) > limit
+        buckets = buckets[:limit]
+        points = []
+        for bucket in buckets:
+            count = bucket.get("count") or 0
+            point = {"bucket_start": isoformat(bucket["bucket_start"]), "count": count,
+                     "risk": bucket.get("risk") or {}}
+            for metric in METRICS:
+                values = bucket.get(metric)
+                n = values.get("count", count) if values else 0
+                point[metric] = {"mean": values["sum"] / n, "min": values["min"], "max": values["max"]} \
+                    if n else None
+            points.append(point)
+        return {
+            "device_id": device_id,
+            "resolution": resolution,
+            "points": points,
+            "next_page_token": encode_token(points[-1]["bucket_start"]) if more else None,
+        }
+
+    # ---------- Raw readings ----------
+    def readings(self, device_id, start, end, limit=100, page_token=None, newest_first=True):
+        """
+        One page of raw readings (combined document fields) in the range.
+        Documents without a `device_id` (written before devices had ids) don't
+        match the device filter; migrate_readings.py copies them to combined
+        documents with the default device id.
+        """
+        collection = READINGS_COLLECTION if self.storage_mode == "combined" else "sensor_data"
+        # The subscriber stores naive UTC timestamps
+        direction = "DESCENDING" if newest_first else "ASCENDING"
+        query = (self.db.collection(collection)
+                 .where("device_id", "==", device_id)
+                 .where("timestamp", ">=", _naive(start))
+                 .where("timestamp", "<", _naive(end))
+                 .order_by("timestamp", direction)
+                 # Readings with the same timestamp: the document id keeps pages apart
+                 .order_by("__name__", direction)
+                 .limit(limit + 1))
+        if page_token:
+            timestamp, doc_id = decode_cursor(page_token)
+            query = query.start_after({"timestamp": timestamp, "__name__": doc_id})
+        snapshots = list(query.stream())
+        more = len(snapshots) > limit
+        snapshots = snapshots[:limit]
+
+        rows = [dict(snapshot.to_dict(), id=snapshot.id) for snapshot in snapshots]
+        if self.storage_mode != "combined":
+            self._join_predictions(rows)
+        token = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"]) if more else None
+        for row in rows:
+            row["timestamp"] = isoformat(row["timestamp"])
+        return {
+            "device_id": device_id,
+            "readings": rows,
+            "next_page_token": token,
+        }
+
+    def _join_predictions(self, rows):
+        """Adds each sensor_data row's probabilities (one "in" query per IN_LIMIT rows)."""
+        by_id = {row["id"]: row for row in rows}
+        ids = list(by_id)
+        for i in range(0, len(ids), IN_LIMIT):
+            query = self.db.collection("predictions").where("sensor_data_id", "in", ids[i:i + IN_LIMIT])
+            for snapshot in query.stream():
+                prediction = snapshot.to_dict()
+                row = by_id.get(prediction.get("sensor_data_id"))
+                if row is not None:
+                    row["failure_probability"] = prediction.get("failure_probability")
+                    row["raw_failure_probability"] = prediction.get("raw_failure_probability")
+
+    def export_csv(self, device_id, start, end, page_size=EXPORT_PAGE_SIZE):
+        """Yields the range's readings as CSV text, oldest first, one page of queries at a time."""
+        buffer = io.StringIO()
+        out = csv.writer(buffer)
+
+        def flush():
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return text
+
+        out.writerow(CSV_HEADERS)
+        yield flush()
+        token = None
+        while True:
+            page = self.readings(device_id, start, end, page_size, token, newest_first=False)
+            for row in page["readings"]:
+                prob = row.get("failure_probability")
+                out.writerow([
+                    row["timestamp"], row.get("device_id", device_id),
+                    _fixed(row.get("temperature"), 2), _fixed(row.get("vibration"), 4), _fixed(row.get("rpm"), 0),
+                    _fixed(prob * 100 if prob is not None else None, 2),
+                    risk_level(prob).capitalize() if prob is not None else "",
+                ])
+            yield flush()
+            token = page["next_page_token"]
+            if token is None:
+                return
+
+
+def _bucket_floor(start, resolution):
+    """Start of the bucket containing `start`, so a partly covered first bucket counts."""
+    seconds = RESOLUTIONS[resolution]
+    return datetime.fromtimestamp(start.timestamp() // seconds * seconds, timezone.utc)
+
+
+def _naive(value):
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _fixed(value, digits):
+    return "" if value is None else f"{value:.{digits}f}"
+
+
+def make_router(store):
+    """FastAPI routes for `store` (a ReadStore)."""
+    router = APIRouter(prefix="/api", tags=["read"])
+
+    def time_range(start, end):
+        try:
+            end = parse_time(end, datetime.now(timezone.utc))
+            start = parse_time(start, end - DEFAULT_RANGE)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        if start >= end:
+            raise HTTPException(400, "start must be before end")
+        return start, end
+
+    def respond(response, key, compute):
+        if store.cache.ttl > 0:
+            response.headers["Cache-Control"] = f"public, max-age={int(store.cache.ttl)}"
+        try:
+            return store.cached(key, compute)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    @router.get("/summary")
+    def summary(response: Response, device_id: str = DEFAULT_DEVICE_ID,
+                start: str | None = None, end: str | None = None):
+        """Count, mean / min / max per metric and risk distribution over the range (from rollups)."""
+        start_time, end_time = time_range(start, end)
+        return respond(response, ("summary", device_id, start, end),
+                       lambda: store.summary(device_id, start_time, end_time))
+
+    @router.get("/series")
+    def series(response: Response, device_id: str = DEFAULT_DEVICE_ID,
+               start: str | None = None, end: str | None = None,
+               resolution: str | None = Query(None, pattern="^(1m|1h|1d)$"),
+               limit: int = Query(500, ge=1, le=2000), page_token: str | None = None):
+        """Rollup buckets over the range, oldest first; resolution defaults to the range length."""
+        start_time, end_time = time_range(start, end)
+        return respond(response, ("series", device_id, start, end, resolution, limit, page_token),
+                       lambda: store.series(device_id, start_time, end_time, resolution, limit, page_token))
+
+    @router.get("/readings")
+    def readings(response: Response, device_id: str = DEFAULT_DEVICE_ID,
+                 start: str | None = None, end: str | None = None,
+                 limit: int = Query(100, ge=1, le=1000), page_token: str | None = None):
+        """Raw readings with their probabilities, newest first."""
+        start_time, end_time = time_range(start, end)
+        return respond(response, ("readings", device_id, start, end, limit, page_token),
+                       lambda: store.readings(device_id, start_time, end_time, limit, page_token))
+
+    @router.get("/export.csv")
+    def export_csv(device_id: str = DEFAULT_DEVICE_ID, start: str | None = None, end: str | None = None):
+        """Every raw reading in the range as CSV, streamed page by page."""
+        start_time, end_time = time_range(start, end)
+        filename = f"motor_health_{device_id}_{start_time:%Y%m%d%H%M}-{end_time:%Y%m%d%H%M}.csv"
+        return StreamingResponse(store.export_csv(device_id, start_time, end_time), media_type="text/csv",
+                                 headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+    return router
@@ -0,0 +1,349 @@
+"""
+Retention of raw readings: old readings move from Firestore to local
+compressed files, their rollups stay online.
+
+Raw readings (sensor_data + predictions, or `readings` with
+STORAGE_MODE=combined) older than the retention age are
+
+1. exported to the archive, one compressed NumPy file (.npz) per device and
+   UTC day with one array per column, sorted by timestamp:
+
+       archive/
+           health/
+               2026-09-01.npz      id, timestamp, temperature, vibration, rpm,
+               2026-09-02.npz      failure_probability, raw_failure_probability,
+           pump-7/                 anomaly_score, prediction_drift, ood, ood_features
+               ...
+
+   A day that already has a file is merged into it by document id, so a
+   run that stopped half way can simply be run again;
+2. rolled up (rollups.py): the 1m/1h/1d buckets of every archived day are
+   rewritten from its file, so the dashboard's summaries and charts keep
+   covering it. This also corrects buckets the subscriber over-counted
+   when a delta commit was retried;
+3. deleted from Firestore in batches, once every file and rollup is written.
+
+The cutoff (and --since) are rounded down to a UTC midnight, so an archived
+day and its rollup buckets are always complete. ReadingArchive reads the
+files back by device and time range: it only opens the days overlapping
+the range, only decompresses the requested columns and binary-searches
+the timestamps.
+
+Usage (from the cloud/ folder):
+    python retention.py run --dry-run
+    python retention.py run --older-than-days 30
+    python retention.py run --older-than-days 30 --since 2026-01-01 --device health
+    python retention.py read health --start 2026-09-01 --end 2026-09-02T12:00 > health.csv
+    python retention.py list
+"""
+
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote, unquote
+import numpy as np
+from firestore_writer import BatchedFirestoreWriter, READINGS_COLLECTION, delete_documents, iter_readings
+from rollups import METRICS, bucket_readings, to_epoch, write_buckets
+from smoothing import DEFAULT_DEVICE_ID
+
+log = logging.getLogger("retention")
+
+# Archived columns besides the document id; a missing value is NaN (False for ood, "" for ood_features)
+COLUMNS = {
+    "timestamp": np.float64,  # epoch seconds, UTC
+    "temperature": np.float32,
+    "vibration": np.float32,
+    "rpm": np.float32,
+    "failure_probability": np.float32,
+    "raw_failure_probability": np.float32,
+    "anomaly_score": np.float32,
+    "prediction_drift": np.float32,
+    "ood": np.bool_,
+    "ood_features": np.str_,  # comma-separated feature names
+}
+DAY = 86400
+
+
+def day_of(ts):
+    """UTC date (YYYY-MM-DD) of epoch seconds `ts`."""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+def midnight(value):
+    """The UTC midnight at or before `value` (a datetime, naive = UTC), as a naive UTC datetime."""
+    return datetime.fromtimestamp(to_epoch(value) // DAY * DAY, timezone.utc).replace(tzinfo=None)
+
+
+def missing_column(name, count):
+    """A column of `count` missing values."""
+    dtype = COLUMNS[name]
+    if dtype is np.bool_:
+        return np.zeros(count, dtype=dtype)
+    if dtype is np.str_:
+        return np.full(count, "", dtype=dtype)
+    return np.full(count, math.nan, dtype=dtype)
+
+
+def to_columns(ids, readings):
+    """Column arrays of reading dicts (combined document fields)."""
+    columns = {"id": np.array(ids, dtype=str)}
+    for name, dtype in COLUMNS.items():
+        if name == "timestamp":
+            values = [to_epoch(reading["timestamp"]) for reading in readings]
+        elif dtype is np.bool_:
+            values = [bool(reading.get(name)) for reading in readings]
+        elif dtype is np.str_:
+            values = [",".join(reading.get(name) or ()) for reading in readings]
+        else:
+            values = [math.nan if reading.get(name) is None else reading[name] for reading in readings]
+        columns[name] = np.array(values, dtype=dtype)
+    return columns
+
+
+class ReadingArchive:
+    """The archive directory `root`: writes day files and reads them back by device and time range."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _directory(self, device_id):
+        # Device ids come from topic levels; quoted, any id is one safe directory name
+        return os.path.join(self.root, quote(device_id, safe=""))
+
+    def path(self, device_id, day):
+        return os.path.join(self._directory(device_id), f"{day}.npz")
+
+    def devices(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(unquote(name) for name in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, name)))
+
+    def days(self, device_id):
+        """Archived days of a device, oldest first."""
+        directory = self._directory(device_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len(".npz")] for name in os.listdir(directory) if name.endswith(".npz"))
+
+    def load(self, device_id, day, columns=None):
+        """
+        {column: array} of one day file; only the requested columns are
+        decompressed. Columns added since the file was written read as missing values.
+        """
+        with np.load(self.path(device_id, day), allow_pickle=False) as data:
+            count = len(data["id"])
+            return {name: data[name] if name in data.files else missing_column(name, count)
+                    for name in (columns or ["id", *COLUMNS])}
+
+    def write(self, device_id, day, columns):
+        """
+        Merges `columns` (to_columns) into the day's file, by document id,
+        and replaces the file atomically. Returns the merged columns.
+        """
+        if os.path.exists(self.path(device_id, day)):
+            stored = self.load(device_id, day)
+            # New rows first: np.unique keeps the first occurrence of an id
+            columns = {name: np.concatenate([columns[name], stored[name]]) for name in columns}
+            _, keep = np.unique(columns["id"], return_index=True)
+            columns = {name: values[keep] for name, values in columns.items()}
+        order = np.argsort(columns["timestamp"], kind="stable")
+        columns = {name: values[order] for name, values in columns.items()}
+
+        directory = self._directory(device_id)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **columns)
+                f.flush()
+                os.fsync(f.fileno())
+            # Nothing is deleted from Firestore unless the file reads back whole
+            if len(self._read_ids(tmp)) != len(columns["id"]):
+                raise OSError(f"{tmp} doesn't read back")
+            os.replace(tmp, self.path(device_id, day))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return columns
+
+    @staticmethod
+    def _read_ids(path):
+        with np.load(path, allow_pickle=False) as data:
+            return data["id"]
+
+    def read(self, device_id, start=None, end=None, columns=None):
+        """
+        The device's archived readings with start <= timestamp < end
+        (datetimes or epoch seconds, None = unbounded), oldest first, as
+        {column: array}. `columns` defaults to all of them.
+        """
+        start = to_epoch(start) if start is not None else -math.inf
+        end = to_epoch(end) if end is not None else math.inf
+        names = ["timestamp"] + [name for name in (columns or ["id", *COLUMNS]) if name != "timestamp"]
+        first = day_of(start) if start > -math.inf else ""
+        last = day_of(end) if end < math.inf else "9999"
+        parts = []
+        for day in self.days(device_id):
+            if not first <= day <= last:
+                continue
+            data = self.load(device_id, day, names)
+            lo, hi = np.searchsorted(data["timestamp"], [start, end], side="left")
+            if hi > lo:
+                parts.append({name: values[lo:hi] for name, values in data.items()})
+        if not parts:
+            return {name: np.empty(0, dtype=COLUMNS.get(name, str)) for name in names}
+        return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+
+def rollup_rows(device_id, columns):
+    """Reading dicts of a day file for rollups.bucket_readings (NaN metrics as missing)."""
+    metrics = [columns[metric].tolist() for metric in METRICS]
+    for i, ts in enumerate(columns["timestamp"].tolist()):
+        reading = {"device_id": device_id, "timestamp": ts}
+        for metric, values in zip(METRICS, metrics):
+            reading[metric] = None if math.isnan(values[i]) else values[i]
+        yield reading
+
+
+def archive_readings(db, archive, cutoff, storage_mode="split", since=None, device_id=None,
+                     writer=None, resolutions=("1m", "1h", "1d"), delete=True, dry_run=False):
+    """
+    Moves the readings before `cutoff` (at or after `since`), both rounded
+    down to a UTC midnight, from Firestore to `archive`: day files, then
+    rollups (through `writer`), then batched deletes. Returns a stats dict.
+    """
+    cutoff = midnight(cutoff)
+    since = midnight(since) if since is not None else None
+    stats = {"cutoff": cutoff.isoformat(), "readings": 0, "files": 0, "rollups": 0, "deleted": 0}
+    days = {}
+    refs = []
+    # The subscriber stores naive UTC timestamps
+    readings = iter_readings(db, storage_mode, since, device_id, until=cutoff, unpaired=True)
+    for reading_id, reading, prediction_id in readings:
+        if reading.get("timestamp") is None:
+            continue
+        device = reading.get("device_id") or DEFAULT_DEVICE_ID
+        ids, readings = days.setdefault((device, day_of(to_epoch(reading["timestamp"]))), ([], []))
+        ids.append(reading_id)
+        readings.append(reading)
+        refs.append((reading_id, prediction_id))
+        stats["readings"] += 1
+        if stats["readings"] % 50000 == 0:
+            log.info(f"⏳ {stats['readings']} readings read")
+    stats["files"] = len(days)
+    if dry_run or not days:
+        return stats
+
+    buckets = {}
+    for (device, day), (ids, readings) in sorted(days.items()):
+        columns = archive.write(device, day, to_columns(ids, readings))
+        if resolutions:
+            # From the whole day file: earlier runs may have archived part of the day
+            day_buckets, _ = bucket_readings(rollup_rows(device, columns), resolutions)
+            buckets.update(day_buckets)
+    log.info(f"💾 {stats['readings']} readings archived in {len(days)} day file(s) under {archive.root}")
+
+    if resolutions:
+        write_buckets(db, writer, buckets)
+        stats["rollups"] = len(buckets)
+        if writer.stats["failed"] or writer.stats["dropped"]:
+            # Never delete raw readings whose aggregates may be missing
+            log.error(f"❌ {writer.stats['failed'] + writer.stats['dropped']} rollup writes failed, readings kept")
+            return stats
+
+    if delete:
+        stats["deleted"] = delete_documents(db, document_refs(db, storage_mode, refs))
+    return stats
+
+
+def document_refs(db, storage_mode, refs):
+    """Firestore references of the (reading_id, prediction_id) pairs yielded by iter_readings."""
+    for reading_id, prediction_id in refs:
+        if storage_mode == "combined":
+            yield db.collection(READINGS_COLLECTION).document(reading_id)
+        else:
+            yield db.collection("sensor_data").document(reading_id)
+            if prediction_id is not None:
+                yield db.collection("predictions").document(prediction_id)
+
+
+def parse_time(value):
+    """ISO date/time (UTC unless it has an offset) or epoch seconds -> aware datetime."""
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from metrics import setup_logging
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archive", default=os.getenv("ARCHIVE_PATH", "archive"),
+                        help="archive directory (default: $ARCHIVE_PATH or archive)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="archive and delete the readings older than the retention age")
+    run.add_argument("--older-than-days", type=float, default=float(os.getenv("RETENTION_DAYS", 30)),
+                     help="retention age in days (default: $RETENTION_DAYS or 30)")
+    run.add_argument("--since", help="only readings at or after this ISO date (UTC), to archive a long history in slices")
+    run.add_argument("--device", help="only this device id")
+    run.add_argument("--storage-mode", choices=["split", "combined"], default=os.getenv("STORAGE_MODE", "split"),
+                     help="where the raw readings are stored (default: $STORAGE_MODE or split)")
+    run.add_argument("--resolutions", default="1m,1h,1d", help="rollups rewritten for the archived days, empty = none")
+    run.add_argument("--keep-source", action="store_true", help="archive without deleting from Firestore")
+    run.add_argument("--dry-run", action="store_true", help="count the readings and day files, write nothing")
+    read = commands.add_parser("read", help="archived readings of a device as CSV on stdout")
+    read.add_argument("device")
+    read.add_argument("--start", help="ISO date/time (UTC) or epoch seconds")
+    read.add_argument("--end", help="ISO date/time (UTC) or epoch seconds, exclusive")
+    read.add_argument("--columns", help="comma-separated, default all")
+    commands.add_parser("list", help="archived devices and days")
+    args = parser.parse_args()
+
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+    archive = ReadingArchive(args.archive)
+
+    if args.command == "list":
+        for device in archive.devices():
+            days = archive.days(device)
+            print(json.dumps({"device_id": device, "days": len(days), "first": days[0], "last": days[-1]}))
+
+    elif args.command == "read":
+        start = parse_time(args.start) if args.start else None
+        end = parse_time(args.end) if args.end else None
+        data = archive.read(args.device, start, end, args.columns.split(",") if args.columns else None)
+        out = csv.writer(sys.stdout)
+        out.writerow(list(data))
+        columns = [data[name].tolist() for name in data]
+        columns[0] = [datetime.fromtimestamp(ts, timezone.utc).isoformat() for ts in columns[0]]
+        out.writerows(zip(*columns))
+
+    else:
+        if os.getenv("FIRESTORE_BACKEND", "firestore") == "fake":
+            from fake_firestore import FakeFirestoreClient
+            db = FakeFirestoreClient()
+        else:
+            from google.cloud import firestore
+            db = firestore.Client()
+
+        cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+        since = parse_time(args.since) if args.since else None
+        # Offline tool: wait for queue space rather than dropping writes
+        writer = BatchedFirestoreWriter(db, block_timeout=300)
+        start = time.time()
+        stats = archive_readings(db, archive, cutoff, args.storage_mode, since, args.device, writer,
+                                 [r for r in args.resolutions.split(",") if r], not args.keep_source, args.dry_run)
+        writer.close()
+        log.info(f"✅ Retention finished in {time.time() - start:.1f}s: {json.dumps(stats)}")
@@ -0,0 +1,300 @@
+"""
+Time-bucketed rollups of sensor readings for the dashboard's long-range views.
+
+For every device and every 1-minute, 1-hour and 1-day bucket a document in
+the `rollups` collection holds the count plus count / min / max / sum of
+each metric (mean = sum / count of the metric: a reading stored without a
+prediction has no failure_probability) and how many readings fell in each
+risk level of the dashboard (`risk.low` / `risk.medium` / `risk.high`).
+Document id: <device_id>_<resolution>_<bucket start epoch seconds>.
+
+The subscriber maintains them incrementally: readings are aggregated in
+memory and every `flush_interval` seconds the delta of each touched bucket
+is queued on the batched writer as a merge with Increment / Minimum /
+Maximum transforms. No rollup document is ever read, a restart doesn't lose
+the part of a bucket written before it, and a rollup write costs one
+document per bucket and flush instead of one per reading.
+
+The deltas are applied at least once, not exactly once: Increment
+transforms aren't idempotent, so a commit that reached Firestore but
+reported an error (e.g. a timeout) is applied again by the writer's retry,
+or by the spool's replay after a restart, and over-counts `count`, `sum`
+and `risk.*` of its buckets (min / max are unaffected). The counts of the
+online buckets are therefore an upper bound. Exact buckets come from the
+raw readings: the retention job (retention.py) rewrites the buckets of
+every day it archives, and `backfill` rewrites any range on demand.
+
+Backfill from the raw collections (from the cloud/ folder):
+
+    python rollups.py backfill
+    python rollups.py backfill --since 2026-01-01 --device health
+
+Backfilled buckets are recomputed from the stored readings and
+overwritten, so run it while the subscriber is stopped or only for ranges
+it isn't writing any more. `--since` is rounded down to the start of the
+coarsest resolution's bucket (a UTC midnight with 1d), so no bucket is
+overwritten with only part of its readings.
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from smoothing import DEFAULT_DEVICE_ID
+from firestore_writer import BatchedFirestoreWriter, iter_readings
+
+log = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "rollups"
+# Resolution name -> bucket length in seconds
+RESOLUTIONS = {"1m": 60, "1h": 3600, "1d": 86400}
+METRICS = ("temperature", "vibration", "rpm", "failure_probability")
+# Dashboard risk levels of the smoothed probability: high above 0.8, medium above 0.3
+RISK_LEVELS = (("high", 0.8), ("medium", 0.3), ("low", float("-inf")))
+
+
+def risk_level(probability):
+    for level, above in RISK_LEVELS:
+        if probability > above:
+            return level
+
+
+def bucket_start(ts, seconds):
+    """Start (epoch seconds, UTC aligned) of the bucket containing `ts`."""
+    return int(ts // seconds * seconds)
+
+
+def rollup_id(device_id, resolution, start):
+    return f"{device_id}_{resolution}_{start}"
+
+
+def to_epoch(value):
+    """Firestore timestamp / datetime / epoch number -> epoch seconds."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            # The subscriber writes naive datetime.utcnow() timestamps
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+class Bucket:
+    """Running count / min / max / sum of each metric, and readings per risk level."""
+
+    __slots__ = ("count", "counts", "min", "max", "sum", "risk")
+
+    def __init__(self):
+        self.count = 0
+        self.counts = {}
+        self.min = {}
+        self.max = {}
+        self.sum = {}
+        self.risk = {}
+
+    def add(self, values):
+        self.count += 1
+        if values.get("failure_probability") is not None:
+            level = risk_level(values["failure_probability"])
+            self.risk[level] = self.risk.get(level, 0) + 1
+        for metric, value in values.items():
+            if metric in self.sum:
+                self.counts[metric] += 1
+                self.sum[metric] += value
+                if value < self.min[metric]:
+                    self.min[metric] = value
+                if value > self.max[metric]:
+                    self.max[metric] = value
+            else:
+                self.counts[metric] = 1
+                self.min[metric] = self.max[metric] = self.sum[metric] = value
+
+    def _doc(self, device_id, resolution, start, fields):
+        doc = {
+            "device_id": device_id,
+            "resolution": resolution,
+            "bucket_start": datetime.fromtimestamp(start, timezone.utc),
+            "count": fields(None, self.count),
+            "updated_at": datetime.utcnow(),
+        }
+        if self.risk:
+            doc["risk"] = {level: fields(None, count) for level, count in self.risk.items()}
+        for metric in self.sum:
+            doc[metric] = {
+                "count": fields(None, self.counts[metric]),
+                "min": fields("min", self.min[metric]),
+                "max": fields("max", self.max[metric]),
+                "sum": fields("sum", self.sum[metric]),
+            }
+        return doc
+
+    def delta_doc(self, device_id, resolution, start):
+        """
+        Document merging this bucket's readings into the stored one
+        (applied again if its commit is retried, see the module docstring).
+        """
+        # Imported on first flush: the Firestore package is slow to import
+        from google.cloud.firestore_v1.transforms import Increment, Maximum, Minimum
+
+        transforms = {None: Increment, "sum": Increment, "min": Minimum, "max": Maximum}
+        return self._doc(device_id, resolution, start, lambda kind, value: transforms[kind](value))
+
+    def full_doc(self, device_id, resolution, start):
+        """Document replacing the stored one (backfill)."""
+        return self._doc(device_id, resolution, start, lambda kind, value: value)
+
+
+class RollupAggregator:
+    """
+    Aggregates readings per (device, resolution, bucket) in memory and
+    flushes the deltas through a BatchedFirestoreWriter from a background
+    thread every `flush_interval` seconds.
+    """
+
+    def __init__(self, writer, resolutions=("1m", "1h", "1d"), flush_interval=10.0,
+                 collection=ROLLUP_COLLECTION):
+        unknown = set(resolutions) - set(RESOLUTIONS)
+        if unknown:
+            raise ValueError(f"Unknown rollup resolution(s): {', '.join(sorted(unknown))}")
+        self.writer = writer
+        self.resolutions = [(name, RESOLUTIONS[name]) for name in resolutions]
+        self.flush_interval = flush_interval
+        self.collection = writer.db.collection(collection)
+        self.stats = {"readings": 0, "flushes": 0, "documents": 0}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        if self.resolutions and flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+            self._thread.start()
+
+    def add(self, device_id, ts, values):
+        """Adds one reading; `values` maps metric name -> number."""
+        with self._lock:
+            for resolution, seconds in self.resolutions:
+                key = (device_id, resolution, bucket_start(ts, seconds))
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = Bucket()
+                bucket.add(values)
+            self.stats["readings"] += 1
+
+    def flush(self):
+        """Queues the deltas collected since the last flush. Returns the document count."""
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+        for (device_id, resolution, start), bucket in buckets.items():
+            ref = self.collection.document(rollup_id(device_id, resolution, start))
+            self.writer.write([(ref, bucket.delta_doc(device_id, resolution, start), True)])
+        self.stats["flushes"] += 1
+        self.stats["documents"] += len(buckets)
+        return len(buckets)
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                log.error(f"❌ Rollup flush failed: {e}")
+
+    def close(self):
+        """Stops the flush thread and queues what is left (call before writer.close())."""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+
+def bucket_readings(readings, resolutions=("1m", "1h", "1d")):
+    """
+    Aggregates reading dicts (combined document fields) into
+    {(device_id, resolution, start): Bucket}. Returns (buckets, readings counted).
+    """
+    buckets = {}
+    count = 0
+    for reading in readings:
+        # Metrics that are present; e.g. a reading stored without a prediction has no failure_probability
+        values = {metric: reading[metric] for metric in METRICS if reading.get(metric) is not None}
+        if reading.get("timestamp") is None or not values:
+            continue
+        ts = to_epoch(reading["timestamp"])
+        device = reading.get("device_id") or DEFAULT_DEVICE_ID
+        for resolution in resolutions:
+            seconds = RESOLUTIONS[resolution]
+            key = (device, resolution, bucket_start(ts, seconds))
+            buckets.setdefault(key, Bucket()).add(values)
+        count += 1
+    return buckets, count
+
+
+def write_buckets(db, writer, buckets, collection=ROLLUP_COLLECTION):
+    """Queues every bucket as a full rollup document (replacing the stored one) and flushes."""
+    target = db.collection(collection)
+    for (device, resolution, start), bucket in buckets.items():
+        ref = target.document(rollup_id(device, resolution, start))
+        writer.write([(ref, bucket.full_doc(device, resolution, start))])
+    writer.flush()
+
+
+def backfill(db, writer, resolutions=("1m", "1h", "1d"), since=None, device_id=None,
+             storage_mode="split", collection=ROLLUP_COLLECTION):
+    """
+    Rebuilds rollups from the stored readings (sensor_data + predictions, or
+    `readings` in combined storage mode). Returns the number of rollup
+    documents written.
+
+    `since` is rounded down to the start of the coarsest bucket: buckets are
+    replaced, not merged, so each one must be rebuilt from all its readings.
+    """
+    if since is not None:
+        seconds = max(RESOLUTIONS[name] for name in resolutions)
+        start = datetime.fromtimestamp(bucket_start(to_epoch(since), seconds), timezone.utc)
+        if since.tzinfo is None:
+            start = start.replace(tzinfo=None)
+        if start != since:
+            log.info(f"📅 Backfill starts at {start.isoformat()}, the start of the {since.isoformat()} bucket")
+        since = start
+    buckets, readings = bucket_readings(
+        (reading for _, reading, _ in iter_readings(db, storage_mode, since, device_id, unpaired=True)), resolutions)
+    write_buckets(db, writer, buckets, collection)
+    log.info(f"✅ Backfilled {len(buckets)} rollup documents from {readings} readings")
+    return len(buckets)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from metrics import setup_logging
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rollup maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bf = sub.add_parser("backfill", help="rebuild rollups from the stored raw readings")
+    bf.add_argument("--since", help="only readings at or after this ISO date/time (UTC)")
+    bf.add_argument("--device", help="only this device id")
+    bf.add_argument("--resolutions", default="1m,1h,1d")
+    bf.add_argument("--storage-mode", choices=["split", "combined"], default=os.getenv("STORAGE_MODE", "split"),
+                    help="where the raw readings are stored (default: $STORAGE_MODE or split)")
+    args = parser.parse_args()
+
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+    if os.getenv("FIRESTORE_BACKEND", "firestore") == "fake":
+        from fake_firestore import FakeFirestoreClient
+        db = FakeFirestoreClient()
+    else:
+        from google.cloud import firestore
+        db = firestore.Client()
+
+    since = None
+    if args.since:
+        since = datetime.fromisoformat(args.since)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
+    # Offline tool: wait for queue space rather than dropping writes
+    writer = BatchedFirestoreWriter(db, block_timeout=300)
+    start = time.time()
+    backfill(db, writer, [r for r in args.resolutions.split(",") if r], since, args.device, args.storage_mode)
+    writer.close()
+    log.info(f"⏱️ Backfill took {time.time() - start:.1f}s, writer stats: {writer.stats}")
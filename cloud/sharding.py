@@ -0,0 +1,46 @@
+"""
+Consistent hashing of device ids onto workers.
+
+Each worker owns many points ("virtual nodes") on a hash ring; a device
+belongs to the first worker point clockwise from the device's own hash.
+Adding or removing a worker only moves the devices next to its points,
+so per-device state stays where it is for almost every device.
+"""
+
+import bisect
+import hashlib
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            self._nodes[point] = node
+            bisect.insort(self._keys, point)
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            if self._nodes.pop(point, None) is not None:
+                self._keys.remove(point)
+
+    def nodes(self):
+        return sorted(set(self._nodes.values()), key=str)
+
+    def get(self, key):
+        """Node responsible for a key."""
+        if not self._keys:
+            raise ValueError("Hash ring is empty")
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[self._keys[index]]
@@ -0,0 +1,175 @@
+"""
+Per-device smoothing of the raw failure probability.
+
+Each device keeps its own fixed-size ring buffer of recent raw probabilities,
+so the subscriber no longer has to read the last predictions back from
+Firestore for every message.
+"""
+
+from collections import deque
+import statistics
+
+# Device id of readings that carry none (the original single motor on motor/health/data)
+DEFAULT_DEVICE_ID = "health"
+
+
+class Smoother:
+    """Base smoother: a ring buffer of the last `window` raw probabilities."""
+
+    def __init__(self, window=5):
+        self.values = deque(maxlen=window)
+
+    def seed(self, values):
+        """Pre-fill the buffer with historical values (oldest first)."""
+        for value in values:
+            self.update(value)
+
+    def update(self, raw_prob):
+        self.values.append(float(raw_prob))
+        return self.value()
+
+    def value(self):
+        raise NotImplementedError
+
+    def export(self):
+        """The smoother's state as plain data (handed to another process, see cluster.py)."""
+        return {"values": list(self.values)}
+
+    def restore(self, state):
+        self.values.clear()
+        self.values.extend(state["values"])
+
+
+class MeanSmoother(Smoother):
+    """Simple moving average over the window (original behaviour)."""
+
+    def value(self):
+        return sum(self.values) / len(self.values)
+
+
+class MedianSmoother(Smoother):
+    """Moving median, more robust against single outlier readings."""
+
+    def value(self):
+        return statistics.median(self.values)
+
+
+class EwmaSmoother(Smoother):
+    """Exponentially weighted moving average."""
+
+    def __init__(self, window=5, alpha=0.4):
+        super().__init__(window)
+        self.alpha = alpha
+        self.ewma = None
+
+    def update(self, raw_prob):
+        raw_prob = float(raw_prob)
+        self.values.append(raw_prob)
+        if self.ewma is None:
+            self.ewma = raw_prob
+        else:
+            self.ewma = self.alpha * raw_prob + (1 - self.alpha) * self.ewma
+        return self.ewma
+
+    def value(self):
+        return self.ewma
+
+    def export(self):
+        return dict(super().export(), ewma=self.ewma)
+
+    def restore(self, state):
+        super().restore(state)
+        self.ewma = state.get("ewma")
+
+
+SMOOTHERS = {
+    "mean": MeanSmoother,
+    "median": MedianSmoother,
+    "ewma": EwmaSmoother,
+}
+
+
+def make_smoother(method="mean", window=5, alpha=0.4):
+    """Creates a smoother by name ('mean', 'median' or 'ewma')."""
+    if method not in SMOOTHERS:
+        raise ValueError(f"Unknown smoothing method: {method}")
+    if method == "ewma":
+        return EwmaSmoother(window, alpha)
+    return SMOOTHERS[method](window)
+
+
+class SmoothingState:
+    """Holds one smoother per device, created on first use."""
+
+    def __init__(self, method="mean", window=5, alpha=0.4):
+        self.method = method
+        self.window = window
+        self.alpha = alpha
+        self.devices = {}
+
+    def get(self, device_id=DEFAULT_DEVICE_ID):
+        smoother = self.devices.get(device_id)
+        if smoother is None:
+            smoother = self.devices.setdefault(
+                device_id, make_smoother(self.method, self.window, self.alpha)
+            )
+        return smoother
+
+    def update(self, device_id, raw_prob):
+        """Adds a raw probability for a device and returns the smoothed value."""
+        return self.get(device_id).update(raw_prob)
+
+    def seed(self, device_id, values):
+        self.get(device_id).seed(values)
+
+    def export(self, device_id):
+        """A device's window as plain data, or None if the device is unknown."""
+        smoother = self.devices.get(device_id)
+        return smoother.export() if smoother is not None else None
+
+    def restore(self, device_id, state, recent=()):
+        """
+        Replaces a device's window with an exported one, then re-applies the
+        `recent` raw probabilities (readings seen here since, oldest first).
+        """
+        smoother = make_smoother(self.method, self.window, self.alpha)
+        smoother.restore(state)
+        for raw_prob in recent:
+            smoother.update(raw_prob)
+        self.devices[device_id] = smoother
+
+    def drop(self, device_id):
+        self.devices.pop(device_id, None)
+
+    def seed_from_firestore(self, db, collection="predictions", limit=500):
+        """
+        Seeds the device windows once at startup from the latest stored raw
+        probabilities (one query for all devices), so smoothing continues
+        across restarts. Predictions without a device_id belong to the
+        default device. `collection` is "readings" in combined storage mode.
+        """
+        return self.seed_from_snapshots(self._latest_query(db, collection, limit).get())
+
+    async def seed_from_firestore_async(self, db, collection="predictions", limit=500):
+        """seed_from_firestore for a `firestore.AsyncClient` (async_subscriber.py)."""
+        return self.seed_from_snapshots(await self._latest_query(db, collection, limit).get())
+
+    @staticmethod
+    def _latest_query(db, collection, limit):
+        return db.collection(collection)\
+            .order_by("timestamp", direction="DESCENDING")\
+            .limit(limit)
+
+    def seed_from_snapshots(self, previous_preds):
+        """Seeds the windows from prediction snapshots, newest first. Returns the device count."""
+        history = {}
+        for doc in previous_preds:
+            p_data = doc.to_dict()
+            values = history.setdefault(p_data.get("device_id", DEFAULT_DEVICE_ID), [])
+            if len(values) < self.window - 1:
+                values.append(p_data.get("raw_failure_probability", p_data.get("failure_probability", 0.0)))
+
+        # Firestore returns newest first, the windows expect oldest first
+        for device_id, values in history.items():
+            self.seed(device_id, reversed(values))
+        return len(history)
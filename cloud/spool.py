@@ -0,0 +1,400 @@
+"""
+Durable local write-ahead spool for Firestore writes.
+
+With a spool, the writer does not keep queued writes in memory. Each write
+group is appended to an SQLite database in WAL mode on local disk, and a
+drainer thread replays the spool to Firestore in batches. A group is only
+deleted from the spool (the checkpoint) after its batch has been
+committed. A Firestore outage or a restart therefore never loses a
+reading: the backlog waits on disk and is replayed when Firestore is
+reachable again, at a limited rate so the recovery doesn't trip Firestore's
+own write limits. A group Firestore rejects permanently (an invalid value, an
+oversized document) is moved to a dead-letter table instead of blocking the
+groups behind it.
+
+Enable it in the subscriber with SPOOL_PATH (see README).
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from firestore_writer import BatchedFirestoreWriter
+
+log = logging.getLogger(__name__)
+
+# HTTP status of the google.api_core errors that no retry can fix:
+# InvalidArgument / FailedPrecondition / OutOfRange (400) and NotFound (404)
+PERMANENT_STATUS = (400, 404)
+
+
+def is_permanent(error):
+    """True if retrying the commit that raised `error` can't succeed."""
+    if isinstance(error, (ValueError, TypeError)):
+        # The client library rejected the data before sending it
+        return True
+    return getattr(error, "code", None) in PERMANENT_STATUS
+
+
+class WriteSpool:
+    """
+    Append-only queue of write groups in an SQLite WAL database.
+
+    - `max_bytes`: cap on the stored payload size; `append` reports whether a
+      group fits and `drop_oldest` makes room
+    - `sync`: SQLite `synchronous` level. "normal" survives a crash of the
+      process, "full" also a power loss (one fsync per append)
+
+    Groups Firestore rejected are kept in the `dead_letter` table, with the
+    error, for inspection.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, sync="normal"):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={sync.upper()}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created REAL NOT NULL,"
+            " writes INTEGER NOT NULL,"
+            " payload BLOB NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(spool)")]
+        if "done" not in columns:
+            # Writes of the group already committed (oversized groups go in parts)
+            self._conn.execute("ALTER TABLE spool ADD COLUMN done INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            " id INTEGER PRIMARY KEY,"
+            " created REAL NOT NULL,"
+            " failed REAL NOT NULL,"
+            " writes INTEGER NOT NULL,"
+            " done INTEGER NOT NULL,"
+            " error TEXT NOT NULL,"
+            " payload BLOB NOT NULL)"
+        )
+        self._dead = self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+        self._rows, self._writes, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(writes), 0), COALESCE(SUM(LENGTH(payload)), 0) FROM spool").fetchone()
+        if self._rows:
+            log.info(f"💽 Spool {path} has {self._rows} unsent write group(s) to replay")
+
+    # ---------- Serialization ----------
+    @staticmethod
+    def encode(group):
+        """A write group as bytes: document paths instead of client-bound references."""
+        return pickle.dumps([(ref.path, data, *merge) for ref, data, *merge in group],
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def decode(db, payload):
+        return [(db.document(path), data, *merge) for path, data, *merge in pickle.loads(payload)]
+
+    # ---------- Queue operations ----------
+    def fits(self, size):
+        return self._bytes + size <= self.max_bytes
+
+    def append(self, payload, writes):
+        with self._lock:
+            self._conn.execute("INSERT INTO spool (created, writes, payload) VALUES (?, ?, ?)",
+                               (time.time(), writes, payload))
+            self._rows += 1
+            self._writes += writes
+            self._bytes += len(payload)
+
+    def peek(self, max_writes):
+        """
+        Oldest groups, in order, totalling at most `max_writes` writes:
+        a list of (id, writes, payload). The oldest group is always returned,
+        even if it alone is larger than `max_writes` (e.g. the batch size was
+        lowered between restarts), so it can't block the spool.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, writes, payload FROM spool ORDER BY id LIMIT ?",
+                (max_writes,)).fetchall()
+        result, total = [], 0
+        for row_id, writes, payload in rows:
+            if result and total + writes > max_writes:
+                break
+            result.append((row_id, writes, payload))
+            total += writes
+        return result
+
+    def ack(self, last_id):
+        """Checkpoint: removes every group up to and including `last_id`."""
+        return self._delete("id <= ?", (last_id,))
+
+    def drop_oldest(self, count=1):
+        return self._delete("id IN (SELECT id FROM spool ORDER BY id LIMIT ?)", (count,))
+
+    def progress(self, row_id):
+        """Writes of the group already committed."""
+        with self._lock:
+            row = self._conn.execute("SELECT done FROM spool WHERE id = ?", (row_id,)).fetchone()
+        return row[0] if row else 0
+
+    def advance(self, row_id, done):
+        """Checkpoint for part of a group: its first `done` writes are committed."""
+        with self._lock:
+            self._conn.execute("UPDATE spool SET done = ? WHERE id = ?", (done, row_id))
+
+    def dead_letter(self, row_id, error):
+        """Moves a group Firestore rejected from the spool to the `dead_letter` table."""
+        return self._delete("id = ?", (row_id,), error=error)
+
+    def _delete(self, where, args, error=None):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows, writes, size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(writes), 0), COALESCE(SUM(LENGTH(payload)), 0)"
+                    f" FROM spool WHERE {where}", args).fetchone()
+                if error is not None:
+                    self._conn.execute(
+                        "INSERT INTO dead_letter (id, created, failed, writes, done, error, payload)"
+                        f" SELECT id, created, ?, writes, done, ?, payload FROM spool WHERE {where}",
+                        (time.time(), error, *args))
+                    self._dead += rows
+                self._conn.execute(f"DELETE FROM spool WHERE {where}", args)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._rows -= rows
+            self._writes -= writes
+            self._bytes -= size
+            return rows
+
+    def checkpoint(self):
+        """Folds the WAL back into the database file and returns freed pages to the OS."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("PRAGMA incremental_vacuum")
+
+    def oldest_created(self):
+        """Append time of the oldest group, or None if the spool is empty."""
+        with self._lock:
+            row = self._conn.execute("SELECT created FROM spool ORDER BY id LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def depth(self):
+        return self._rows
+
+    def pending_writes(self):
+        return self._writes
+
+    def size_bytes(self):
+        return self._bytes
+
+    def dead_letters(self):
+        return self._dead
+
+    def close(self):
+        self.checkpoint()
+        with self._lock:
+            self._conn.close()
+
+
+class SpooledFirestoreWriter(BatchedFirestoreWriter):
+    """
+    BatchedFirestoreWriter whose queue is a WriteSpool.
+
+    `write` appends to the spool and returns as soon as the group is on local
+    disk, so ingest latency doesn't depend on Firestore. The drainer commits
+    the oldest groups (up to `max_batch_size` writes, or fewer after
+    `max_batch_age`) and checkpoints them after the commit succeeded. A
+    commit that fails with a retryable error is retried with backoff
+    forever. One that fails permanently (`is_permanent`) is not retried: the
+    group that caused it is moved to the dead-letter table and counted in
+    `stats["dead_lettered"]`. Otherwise nothing is dropped except by the
+    spool size cap (`overflow_policy`).
+
+    While a backlog is replayed after a failure, commits are limited to
+    `replay_rate` writes/second (Firestore recommends ramping up from 500/s).
+    """
+
+    STATS = BatchedFirestoreWriter.STATS + ("dead_lettered",)
+
+    def __init__(self, db, spool, replay_rate=500.0, checkpoint_interval=60.0, **kwargs):
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.checkpoint_interval = checkpoint_interval
+        self.recovering = spool.depth() > 0
+        self._wakeup = threading.Event()
+        self._space = threading.Condition()
+        kwargs.pop("on_failure", None)
+        super().__init__(db, **kwargs)
+
+    # ---------- Producer side ----------
+    def write(self, writes, block=True):
+        group = list(writes)
+        if len(group) > self.max_batch_size:
+            raise ValueError("Write group is larger than the batch size")
+        payload = WriteSpool.encode(group)
+
+        if not self.spool.fits(len(payload)):
+            if self.overflow_policy == "drop_oldest":
+                while self.spool.depth() and not self.spool.fits(len(payload)):
+                    self._count(dropped=self.spool.drop_oldest())
+            elif self.overflow_policy == "block" and block:
+                with self._space:
+                    self._space.wait_for(lambda: self.spool.fits(len(payload)), self.block_timeout)
+            if not self.spool.fits(len(payload)):
+                self._count(dropped=1)
+                return False
+
+        self.spool.append(payload, len(group))
+        self._count(enqueued=1)
+        if self.spool.pending_writes() >= self.max_batch_size:
+            self._wakeup.set()
+        return True
+
+    def depth(self):
+        return self.spool.depth()
+
+    # ---------- Drainer ----------
+    def _batch_ready(self):
+        """A full batch is spooled, the oldest group is old enough, or we're catching up."""
+        if self._stopping.is_set() or self.recovering:
+            return True
+        if self.spool.pending_writes() >= self.max_batch_size:
+            return True
+        oldest = self.spool.oldest_created()
+        if oldest is None:
+            return False
+        wait = self.max_batch_age - (time.time() - oldest)
+        if wait <= 0:
+            return True
+        self._wakeup.wait(wait)
+        self._wakeup.clear()
+        return False
+
+    def _drain(self, rows, groups, writes):
+        """
+        Commits the peeked `rows` and checkpoints them. Retryable errors are
+        raised. On a permanent one the groups
+        are committed one at a time, to dead-letter only the group at fault.
+        """
+        if writes > self.max_batch_size:
+            self._commit_parts(rows[0], groups[0])
+            return
+        try:
+            self._commit_once(groups)
+        except Exception as e:
+            if not is_permanent(e):
+                raise
+            if len(rows) == 1:
+                self._dead_letter(rows[0][0], e)
+                return
+            for row, group in zip(rows, groups):
+                self._drain([row], [group], row[1])
+            return
+        self.spool.ack(rows[-1][0])
+        self._count(commits=1, written=writes)
+
+    def _commit_parts(self, row, group):
+        """
+        A single group spooled earlier that is larger than the batch size
+        (e.g. before FIRESTORE_BATCH_SIZE was lowered), committed in parts.
+        Each part is checkpointed, so a failure retries only the rest.
+        """
+        row_id, writes, _ = row
+        for start in range(self.spool.progress(row_id), writes, self.max_batch_size):
+            part = group[start:start + self.max_batch_size]
+            try:
+                self._commit_once([part])
+            except Exception as e:
+                if not is_permanent(e):
+                    raise
+                self._dead_letter(row_id, e)
+                return
+            self.spool.advance(row_id, start + len(part))
+            self._count(commits=1, written=len(part))
+        self.spool.ack(row_id)
+
+    def _dead_letter(self, row_id, error):
+        self.spool.dead_letter(row_id, repr(error))
+        self._count(dead_lettered=1)
+        log.error(f"❌ Firestore rejected a write group ({error}), moved it to the dead-letter table")
+
+    def _run(self):
+        failures = 0
+        last_checkpoint = time.monotonic()
+        last_commit = 0.0
+        while True:
+            if self.spool.depth() == 0:
+                if self._stopping.is_set():
+                    break
+                self._wakeup.wait(0.2)
+                self._wakeup.clear()
+                continue
+            if not self._batch_ready():
+                continue
+
+            rows = self.spool.peek(self.max_batch_size)
+            if not rows:
+                continue
+            groups = [WriteSpool.decode(self.db, payload) for _, _, payload in rows]
+            writes = sum(count for _, count, _ in rows)
+            if self.recovering and self.replay_rate:
+                # Replay rate limit: spread the backlog over time
+                wait = last_commit + writes / self.replay_rate - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            last_commit = time.monotonic()
+
+            try:
+                self._drain(rows, groups, writes)
+            except Exception as e:
+                failures += 1
+                self.recovering = True
+                if self._stopping.is_set():
+                    log.warning(f"⚠️ Firestore unavailable at shutdown, {self.spool.depth()} group(s) stay in the spool")
+                    break
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (failures - 1)))
+                self._count(retries=1)
+                log.warning(f"⚠️ Firestore batch commit failed ({e}), {self.spool.depth()} group(s) spooled, "
+                            f"retrying in {delay:.1f}s")
+                self._stopping.wait(delay)
+                continue
+
+            with self._space:
+                self._space.notify_all()
+            with self._idle:
+                self._idle.notify_all()
+            if failures:
+                log.info(f"✅ Firestore reachable again, replaying {self.spool.depth()} spooled group(s)")
+                failures = 0
+            if self.recovering and self.spool.pending_writes() < self.max_batch_size:
+                self.recovering = False
+                log.info("✅ Spool backlog replayed")
+
+            if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                self.spool.checkpoint()
+                last_checkpoint = time.monotonic()
+
+    def flush(self, timeout=None):
+        """Waits until the spool is empty (everything committed)."""
+        self._wakeup.set()
+        with self._idle:
+            return self._idle.wait_for(lambda: self.spool.depth() == 0, timeout)
+
+    def close(self, timeout=30.0):
+        """Drains what Firestore accepts within `timeout`; the rest stays on disk."""
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        stopped = not self._thread.is_alive()
+        if stopped:
+            self.spool.close()
+        return stopped
@@ -0,0 +1,72 @@
+"""
+Local stand-in for the Telegram Bot API, for testing alerts offline.
+
+Accepts POST /bot<token>/sendMessage, prints the message and answers like
+Telegram. Point the subscriber at it with:
+    TELEGRAM_API_URL=http://localhost:8081 TELEGRAM_BOT_TOKEN=test TELEGRAM_CHAT_ID=1
+
+Usage:
+    python telegram_stub.py [--port 8081] [--delay 0.5] [--fail-rate 0.2]
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(delay=0.0, fail_rate=0.0, messages=None):
+    class TelegramStubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if delay:
+                time.sleep(delay)
+            if not self.path.endswith("/sendMessage"):
+                return self._reply(404, {"ok": False, "description": "Not Found"})
+            if fail_rate and random.random() < fail_rate:
+                return self._reply(500, {"ok": False, "description": "Injected failure"})
+
+            payload = json.loads(body or b"{}")
+            if messages is not None:
+                messages.append(payload)
+            print(f"📨 [{payload.get('chat_id')}] {payload.get('text', '')}\n")
+            self._reply(200, {"ok": True, "result": {"message_id": len(messages or []) or 1}})
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TelegramStubHandler
+
+
+def start_stub(port=8081, delay=0.0, fail_rate=0.0):
+    """Starts the stub in a background thread; returns (server, received messages)."""
+    import threading
+
+    messages = []
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay, fail_rate, messages))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(args.delay, args.fail_rate))
+    print(f"🤖 Telegram stub listening on http://localhost:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Telegram stub stopped.")
@@ -1,9 +1,31 @@
+"""
+Simulated ESP32 publisher and load generator.
+
+With no arguments it behaves like a single ESP32: one random reading every
+2 seconds, printing the alarm result that comes back from the subscriber.
+
+For load testing it simulates many motors with a constant, ramp or burst
+rate profile, matches every reading to its response on motor/<id>/alert and
+reports end-to-end latency percentiles, throughput and drops as JSON:
+
+    python test_mqtt_publisher.py --devices 200 --rate 500 --duration 60 \\
+        --profile burst --json-out results.json
+
+--format binary sends the compact binary payload (payload_codec.py) instead
+of JSON; with --frame-size N each publish is a batch frame of N readings.
+--steady simulates motors in steady state: each one keeps its scenario and
+operating point, and its readings only differ by sensor noise.
+"""
+
 import paho.mqtt.client as mqtt
+import argparse
 import json
 import time
 import random
 import os
+import threading
 from dotenv import load_dotenv
+import payload_codec
 
 # Load environment variables (optional, for broker IP)
 load_dotenv()
@@ -11,112 +33,305 @@ load_dotenv()
 # Configuration
 # Default to localhost if running on the same machine/network as the broker
 # User should replace this with VM External IP if running from a different network
-MQTT_BROKER = os.getenv("MQTT_BROKER", "34.177.80.102") 
+MQTT_BROKER = os.getenv("MQTT_BROKER", "34.177.80.102")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
-MQTT_TOPIC = "motor/health/data"
-MQTT_ALERT_TOPIC = "motor/health/alert"
-
-print(f"🚀 Connecting to MQTT Broker at {MQTT_BROKER}:{MQTT_PORT}...")
-
-# Callback when connected
-def on_connect(client, userdata, flags, rc):
-    connection_codes = {
-        0: "Success",
-        1: "Refused - unacceptable protocol version",
-        2: "Refused - identifier rejected",
-        3: "Refused - server unavailable",
-        4: "Refused - bad username or password",
-        5: "Refused - not authorized"
+MQTT_TOPIC = "motor/{device_id}/data"
+MQTT_ALERT_TOPIC = "motor/+/alert"
+
+# Default scenario mix: 80% normal, 20% anomalies split evenly
+DEFAULT_MIX = "NORMAL=0.8,HIGH TEMP=0.066,HIGH VIB=0.067,STALL=0.067"
+
+
+def generate_reading(status):
+    """Realistic random reading for a scenario."""
+    if status == "NORMAL":
+        temp = random.uniform(20, 35)
+        vib = random.uniform(0.1, 0.5)
+        rpm = random.uniform(2500, 3000)
+    elif status == "HIGH TEMP":
+        temp = random.uniform(60, 80)
+        vib = random.uniform(0.5, 0.8)
+        rpm = random.uniform(2000, 2800)
+    elif status == "HIGH VIB":
+        temp = random.uniform(30, 45)
+        vib = random.uniform(2.0, 5.0)
+        rpm = random.uniform(2000, 2800)
+    else:
+        # Stall
+        temp = random.uniform(50, 65)
+        vib = random.uniform(3.0, 6.0)
+        rpm = random.uniform(0, 500)
+    return {
+        "temperature": round(temp, 1),
+        "vibration": round(vib, 3),
+        "rpm": int(rpm),
+        "timestamp": int(time.time())
+    }
+
+
+# Sensor noise (1 sigma) around a motor's operating point with --steady
+STEADY_NOISE = {"temperature": 0.05, "vibration": 0.004, "rpm": 3.0}
+
+
+def steady_reading(base):
+    """Reading of a motor holding the operating point `base`, plus sensor noise."""
+    return {
+        "temperature": round(random.gauss(base["temperature"], STEADY_NOISE["temperature"]), 1),
+        "vibration": round(max(0.0, random.gauss(base["vibration"], STEADY_NOISE["vibration"])), 3),
+        "rpm": int(max(0.0, random.gauss(base["rpm"], STEADY_NOISE["rpm"]))),
+        "timestamp": int(time.time())
     }
-    print(f"📡 Connection Status: {connection_codes.get(rc, 'Unknown code')}")
-    if rc == 0:
-        print("✅ Simulating sensor data stream...")
-        # Subscribe to the alert topic to verify the full loop
-        client.subscribe(MQTT_ALERT_TOPIC)
-        print(f"👂 Listening for return alerts on: {MQTT_ALERT_TOPIC}")
-
-# Callback when message received (Simulating ESP32 receiving result)
-def on_message(client, userdata, msg):
+
+
+def parse_mix(text):
+    """'NORMAL=0.8,STALL=0.2' -> (["NORMAL", "STALL"], [0.8, 0.2])"""
+    names, weights = [], []
+    for part in text.split(","):
+        name, weight = part.split("=")
+        names.append(name.strip().upper())
+        weights.append(float(weight))
+    return names, weights
+
+
+def rate_at(args, elapsed):
+    """Target publish rate (messages/second, all devices) at `elapsed` seconds."""
+    if args.profile == "ramp":
+        return args.rate + (args.ramp_to - args.rate) * min(1.0, elapsed / args.duration)
+    if args.profile == "burst":
+        in_burst = (elapsed % args.burst_every) < args.burst_length
+        return args.burst_rate if in_burst else args.rate
+    return args.rate
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoadResults:
+    """Tracks sent readings and matches alert responses to them."""
+
+    def __init__(self):
+        self.sent = {}
+        self.latencies = []
+        self.unmatched = 0
+        self.last_response = None
+        self.lock = threading.Lock()
+
+    def on_sent(self, device_id, seq, sent_at):
+        with self.lock:
+            self.sent[(device_id, seq)] = sent_at
+
+    def on_response(self, payload):
+        key = (payload.get("device_id"), payload.get("seq"))
+        with self.lock:
+            sent_at = self.sent.pop(key, None)
+            if sent_at is None:
+                self.unmatched += 1
+                return None
+            self.last_response = time.time()
+            latency = self.last_response - sent_at
+            self.latencies.append(latency)
+            return latency
+
+    def summary(self, total_sent, start, publish_seconds):
+        with self.lock:
+            receive_seconds = (self.last_response - start) if self.last_response else 0
+            latencies = sorted(self.latencies)
+            received = len(latencies)
+            to_ms = lambda v: None if v is None else round(v * 1000, 2)
+            return {
+                "sent": total_sent,
+                "received": received,
+                "dropped": len(self.sent),
+                "unmatched_responses": self.unmatched,
+                "publish_seconds": round(publish_seconds, 2),
+                "sent_per_sec": round(total_sent / publish_seconds, 1) if publish_seconds else None,
+                "received_per_sec": round(received / receive_seconds, 1) if receive_seconds else None,
+                "latency_ms": {
+                    "p50": to_ms(percentile(latencies, 50)),
+                    "p95": to_ms(percentile(latencies, 95)),
+                    "p99": to_ms(percentile(latencies, 99)),
+                    "max": to_ms(latencies[-1] if latencies else None),
+                },
+            }
+
+
+def make_client():
+    # paho-mqtt 2.x requires the callback API version, 1.x doesn't know it
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+    return mqtt.Client()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulated ESP32 publisher / MQTT load generator")
+    parser.add_argument("--broker", default=MQTT_BROKER)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--devices", type=int, default=1, help="number of simulated motors")
+    parser.add_argument("--device-offset", type=int, default=0,
+                        help="number of the first simulated motor (several generators side by side)")
+    parser.add_argument("--profile", choices=["constant", "ramp", "burst"], default="constant")
+    parser.add_argument("--rate", type=float, default=0.5, help="messages/second across all devices (ramp: start rate)")
+    parser.add_argument("--ramp-to", type=float, default=100.0, help="ramp: rate reached at the end of --duration")
+    parser.add_argument("--burst-rate", type=float, default=500.0, help="burst: rate during a burst")
+    parser.add_argument("--burst-every", type=float, default=10.0, help="burst: seconds between burst starts")
+    parser.add_argument("--burst-length", type=float, default=2.0, help="burst: seconds per burst")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to publish (0 = until Ctrl+C)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. 'NORMAL=0.5,STALL=0.5'")
+    parser.add_argument("--steady", action="store_true",
+                        help="each motor keeps one scenario and operating point, readings only vary by sensor noise")
+    parser.add_argument("--format", choices=["json", "binary"], default="json", help="payload encoding")
+    parser.add_argument("--frame-size", type=int, default=1, help="binary: readings per published batch frame")
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1])
+    parser.add_argument("--grace", type=float, default=5.0, help="seconds to wait for late responses")
+    parser.add_argument("--json-out", help="write the results JSON to this file")
+    parser.add_argument("--quiet", action="store_true", help="don't print every reading")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    verbose = not args.quiet and args.devices == 1 and args.rate <= 5
+    scenarios, weights = parse_mix(args.mix)
+    device_ids = ["health"] if args.devices == 1 and not args.device_offset else [
+        f"sim-{i:05d}" for i in range(args.device_offset, args.device_offset + args.devices)]
+    results = LoadResults()
+    # --steady: device -> (scenario, operating point)
+    operating_points = {}
+
+    print(f"🚀 Connecting to MQTT Broker at {args.broker}:{args.port}...")
+
+    # Callback when connected
+    def on_connect(client, userdata, flags, rc):
+        connection_codes = {
+            0: "Success",
+            1: "Refused - unacceptable protocol version",
+            2: "Refused - identifier rejected",
+            3: "Refused - server unavailable",
+            4: "Refused - bad username or password",
+            5: "Refused - not authorized"
+        }
+        print(f"📡 Connection Status: {connection_codes.get(rc, 'Unknown code')}")
+        if rc == 0:
+            print("✅ Simulating sensor data stream...")
+            # Subscribe to the alert topics to verify the full loop
+            client.subscribe(MQTT_ALERT_TOPIC)
+            print(f"👂 Listening for return alerts on: {MQTT_ALERT_TOPIC}")
+
+    # Callback when message received (Simulating ESP32 receiving result)
+    def on_message(client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload.decode())
+            results.on_response(payload)
+            if not verbose:
+                return
+            risk = payload.get("probability", 0.0)
+
+            # Simulate ESP32 Buzzer Logic
+            if risk > 0.8:
+                print(f"\n🚨 [ESP32 SIMULATION] ALARM TRIGGERED! Risk: {risk:.1%} (Threshold > 80%)")
+            else:
+                print(f"\n🟢 [ESP32 SIMULATION] Risk OK: {risk:.1%}")
+
+        except Exception as e:
+            print(f"❌ Error parsing alert: {e}")
+
+    client = make_client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.max_inflight_messages_set(1000)
+
     try:
-        payload = json.loads(msg.payload.decode())
-        risk = payload.get("probability", 0.0)
-        
-        # Simulate ESP32 Buzzer Logic
-        if risk > 0.8:
-            print(f"\n🚨 [ESP32 SIMULATION] ALARM TRIGGERED! Risk: {risk:.1%} (Threshold > 80%)")
-        else:
-            print(f"\n🟢 [ESP32 SIMULATION] Risk OK: {risk:.1%}")
-            
+        client.connect(args.broker, args.port, 60)
+        client.loop_start() # Start background thread for network loop
     except Exception as e:
-        print(f"❌ Error parsing alert: {e}")
-
-def on_publish(client, userdata, mid):
-    # print(f"Message {mid} published.")
-    pass
-
-client = mqtt.Client()
-client.on_connect = on_connect
-client.on_message = on_message
-client.on_publish = on_publish
-
-try:
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    client.loop_start() # Start background thread for network loop
-except Exception as e:
-    print(f"❌ Connection Failed: {e}")
-    print("Ensure Mosquitto is running and port 1883 is open in firewall.")
-    exit(1)
-
-# Simulation Loop
-try:
-    count = 1
-    while True:
-        # Generate realistic data
-        # 80% chance of Normal, 20% Anomalies
-        if random.random() > 0.2:
-            # Normal
-            temp = random.uniform(20, 35)
-            vib = random.uniform(0.1, 0.5)
-            rpm = random.uniform(2500, 3000)
-            status = "NORMAL"
-        else:
-            # Anomaly (High Risk)
-            chance = random.random()
-            if chance < 0.33:
-               # High Temp
-               temp = random.uniform(60, 80)
-               vib = random.uniform(0.5, 0.8)
-               rpm = random.uniform(2000, 2800)
-               status = "HIGH TEMP"
-            elif chance < 0.66:
-               # High Vib
-               temp = random.uniform(30, 45)
-               vib = random.uniform(2.0, 5.0)
-               rpm = random.uniform(2000, 2800)
-               status = "HIGH VIB"
+        print(f"❌ Connection Failed: {e}")
+        print("Ensure Mosquitto is running and port 1883 is open in firewall.")
+        exit(1)
+
+    time.sleep(1)  # let the alert subscription settle
+
+    # Simulation Loop
+    count = 0
+    start = time.time()
+    next_send = start
+    try:
+        while not args.duration or time.time() - start < args.duration:
+            elapsed = time.time() - start
+            rate = max(rate_at(args, elapsed), 0.01)
+
+            device_id = device_ids[count % len(device_ids)]
+            topic = MQTT_TOPIC.format(device_id=device_id)
+            frame_size = args.frame_size if args.format == "binary" else 1
+            sent_at = time.time()
+            readings = []
+            for seq in range(count, count + frame_size):
+                if args.steady:
+                    if device_id not in operating_points:
+                        status = random.choices(scenarios, weights)[0]
+                        operating_points[device_id] = (status, generate_reading(status))
+                    status, base = operating_points[device_id]
+                    payload = steady_reading(base)
+                else:
+                    status = random.choices(scenarios, weights)[0]
+                    payload = generate_reading(status)
+                payload["seq"] = seq
+                readings.append(payload)
+                results.on_sent(device_id, seq, sent_at)
+
+            if args.format == "binary" and frame_size > 1:
+                body = payload_codec.encode_batch(
+                    [(r["temperature"], r["vibration"], r["rpm"], r["timestamp"], r["seq"]) for r in readings])
+            elif args.format == "binary":
+                body = payload_codec.encode_reading(
+                    payload["temperature"], payload["vibration"], payload["rpm"], payload["timestamp"], payload["seq"])
             else:
-               # Stall
-               temp = random.uniform(50, 65)
-               vib = random.uniform(3.0, 6.0)
-               rpm = random.uniform(0, 500)
-               status = "STALL"
-
-        payload = {
-            "temperature": round(temp, 1),
-            "vibration": round(vib, 3),
-            "rpm": int(rpm),
-            "timestamp": int(time.time())
-        }
+                payload["sent_at"] = sent_at
+                body = json.dumps(payload)
+            client.publish(topic, body, qos=args.qos)
+
+            if verbose:
+                print(f"[{count + 1}] Output: {status} | Temp: {payload['temperature']}°C | Vib: {payload['vibration']} m/s² | RPM: {payload['rpm']}")
+            elif count // 1000 != (count + frame_size) // 1000:
+                print(f"📤 {count + frame_size} sent, target {rate:.0f} msg/s")
 
-        json_payload = json.dumps(payload)
-        client.publish(MQTT_TOPIC, json_payload)
-        
-        print(f"[{count}] Output: {status} | Temp: {payload['temperature']}°C | Vib: {payload['vibration']} m/s² | RPM: {payload['rpm']}")
-        
-        count += 1
-        time.sleep(2) # Send every 2 seconds
+            count += frame_size
+            next_send += frame_size / rate
+            delay = next_send - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -1.0:
+                # Can't keep up: don't try to catch up with a huge burst
+                next_send = time.time()
 
-except KeyboardInterrupt:
-    print("\n🛑 Simulation stopped by user.")
+    except KeyboardInterrupt:
+        print("\n🛑 Simulation stopped by user.")
+
+    publish_seconds = time.time() - start
+    if count:
+        print(f"⏳ Waiting {args.grace:.0f}s for remaining responses...")
+        time.sleep(args.grace)
     client.loop_stop()
     client.disconnect()
+
+    summary = results.summary(count, start, publish_seconds)
+    summary["config"] = {
+        "devices": args.devices,
+        "device_offset": args.device_offset,
+        "profile": args.profile,
+        "rate": args.rate,
+        "duration": args.duration,
+        "mix": args.mix,
+        "steady": args.steady,
+        "qos": args.qos,
+        "format": args.format,
+        "frame_size": args.frame_size,
+    }
+    print(json.dumps(summary, indent=2))
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Results written to {args.json_out}")
@@ -0,0 +1,39 @@
+"""Alert texts for readings with unusual timestamps."""
+
+from datetime import datetime, timezone
+import pytest
+from alerts import RAISED, event_time, format_alert
+
+READING = {"temperature": 50.0, "vibration": 1.2, "rpm": 1800}
+
+
+def event(timestamp, received=1_760_000_000.0):
+    return {"device_id": "m1", "state": RAISED, "probability": 0.9,
+            "data": dict(READING, timestamp=timestamp), "time": received}
+
+
+@pytest.mark.parametrize("timestamp", [
+    1_760_000_000,
+    "1760000000",
+    datetime.fromtimestamp(1_760_000_000, timezone.utc),
+    # Naive datetimes are UTC, like the subscriber's
+    datetime.fromtimestamp(1_760_000_000, timezone.utc).replace(tzinfo=None),
+])
+def test_reading_time(timestamp):
+    assert event_time(event(timestamp)) == datetime.fromtimestamp(1_760_000_000)
+
+
+def test_iso_timestamp():
+    assert event_time(event("2026-10-18T09:00:00+00:00")) == datetime.fromtimestamp(1_792_314_000)
+
+
+@pytest.mark.parametrize("timestamp", [None, "", "soon", 1e20])
+def test_falls_back_to_event_time(timestamp):
+    assert event_time(event(timestamp, received=1_700_000_000.0)) == datetime.fromtimestamp(1_700_000_000)
+    assert "Motor Failure Detected" in format_alert(event(timestamp))
+
+
+def test_missing_timestamp():
+    alert = event(None)
+    del alert["data"]["timestamp"]
+    assert "**Time:**" in format_alert(alert)
@@ -0,0 +1,27 @@
+"""AsyncSubscriber readings the model fails on."""
+
+import asyncio
+import pytest
+from fake_firestore import FakeAsyncFirestoreClient
+from test_inference import PickyModel
+
+async_subscriber = pytest.importorskip("async_subscriber")
+
+
+def test_unscored_reading_is_stored(monkeypatch):
+    monkeypatch.setattr(async_subscriber, "STORAGE_MODE", "split")
+
+    async def run():
+        db = FakeAsyncFirestoreClient()
+        subscriber = async_subscriber.AsyncSubscriber(db, PickyModel())
+        subscriber.batcher.start()
+        await subscriber.process_sensor_data({"device_id": "m1", "temperature": -5.0, "vibration": 0.4,
+                                              "rpm": 2500.0, "timestamp": 1})
+        await subscriber.batcher.close()
+        return db, subscriber
+
+    db, subscriber = asyncio.run(run())
+    stored = db.documents("sensor_data")
+    assert [doc["temperature"] for doc in stored.values()] == [-5.0]
+    assert db.count("predictions") == 0
+    assert subscriber.batcher.stats["unscored"] == 1
@@ -0,0 +1,25 @@
+"""FeatureState windows: preview rows without changing state."""
+
+import random
+from features import FeatureState
+
+
+def readings(count, devices=3, seed=0):
+    rng = random.Random(seed)
+    return [(f"motor-{rng.randrange(devices)}", 2.0 * k, rng.uniform(20, 40), rng.uniform(0, 1), rng.uniform(2000, 3000))
+            for k in range(count)]
+
+
+def test_preview_rows_match_row_and_change_nothing():
+    history, batch = readings(60)[:40], readings(60)[40:]
+    previewed, updated = FeatureState(10, 3), FeatureState(10, 3)
+    for reading in history:
+        previewed.update(*reading)
+        updated.update(*reading)
+    before = {device: previewed.export(device) for device in previewed.devices}
+
+    rows = previewed.preview_rows(batch + [("new-motor", 0.0, 25.0, 0.3, 2500.0)])
+
+    assert rows[:-1] == [updated.row(*reading) for reading in batch]
+    assert {device: previewed.export(device) for device in previewed.devices} == before
+    assert "new-motor" not in previewed.devices
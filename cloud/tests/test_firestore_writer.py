@@ -0,0 +1,106 @@
+"""BatchedFirestoreWriter against the in-memory Firestore (fake_firestore.py)."""
+
+import time
+import pytest
+from fake_firestore import FakeFirestoreClient
+from firestore_writer import BatchedFirestoreWriter
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def group(db, doc_id):
+    return [(db.collection("readings").document(doc_id), {"value": doc_id})]
+
+
+def test_flushes_at_batch_size():
+    db = FakeFirestoreClient()
+    writer = BatchedFirestoreWriter(db, max_batch_size=10, max_batch_age=60)
+    for i in range(10):
+        writer.write(group(db, f"d{i}"))
+    # Long before the batch age: the full batch goes out on its own
+    assert wait_for(lambda: db.count("readings") == 10, timeout=2)
+    assert db.commit_count == 1
+    writer.close()
+
+
+def test_flushes_at_batch_age():
+    db = FakeFirestoreClient()
+    writer = BatchedFirestoreWriter(db, max_batch_size=400, max_batch_age=0.3)
+    start = time.monotonic()
+    for i in range(3):
+        writer.write(group(db, f"d{i}"))
+    assert wait_for(lambda: db.count("readings") == 3, timeout=3)
+    assert time.monotonic() - start >= 0.25
+    assert db.commit_count == 1
+    writer.close()
+
+
+def test_group_lands_in_one_batch():
+    db = FakeFirestoreClient()
+    writer = BatchedFirestoreWriter(db, max_batch_size=4, max_batch_age=0.05)
+    writer.write(group(db, "a") * 3)
+    writer.write(group(db, "b") * 3)
+    assert writer.flush(2)
+    assert db.commit_count == 2
+    writer.close()
+
+
+@pytest.mark.parametrize("policy, kept", [
+    ("drop_newest", {"d0", "d1", "d2"}),
+    ("drop_oldest", {"d0", "d2", "d3"}),
+    ("block", {"d0", "d1", "d2"}),
+])
+def test_overflow_policies(policy, kept):
+    # Every commit takes 0.3 s, so the queue (2 groups) fills up behind the first one
+    db = FakeFirestoreClient(latency=0.3)
+    writer = BatchedFirestoreWriter(db, max_batch_size=1, max_batch_age=0, max_queue_size=2,
+                                    overflow_policy=policy, block_timeout=0.05)
+    writer.write(group(db, "d0"))
+    assert wait_for(lambda: writer.depth() == 0)
+    assert writer.write(group(db, "d1"))
+    assert writer.write(group(db, "d2"))
+    accepted = writer.write(group(db, "d3"))
+
+    assert accepted == (policy == "drop_oldest")
+    assert writer.stats["dropped"] == 1
+    assert writer.flush(5)
+    assert set(db.documents("readings")) == kept
+    writer.close()
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        BatchedFirestoreWriter(FakeFirestoreClient(), overflow_policy="spill")
+
+
+def test_retries_after_failed_commits():
+    db = FakeFirestoreClient()
+    db.fail_next(2)
+    writer = BatchedFirestoreWriter(db, max_batch_age=0.01, backoff_base=0.01)
+    writer.write(group(db, "d0"))
+    assert writer.flush(5)
+    assert db.count("readings") == 1
+    assert writer.stats["retries"] == 2
+    assert writer.stats["failed"] == 0
+    writer.close()
+
+
+def test_gives_up_after_max_retries():
+    db = FakeFirestoreClient()
+    db.fail_next(10)
+    failed = []
+    writer = BatchedFirestoreWriter(db, max_batch_age=0.01, max_retries=2, backoff_base=0.01,
+                                    on_failure=failed.extend)
+    writer.write(group(db, "d0"))
+    assert writer.flush(5)
+    assert db.count("readings") == 0
+    assert writer.stats["failed"] == 1
+    assert [ref.id for g in failed for ref, _ in g] == ["d0"]
+    writer.close()
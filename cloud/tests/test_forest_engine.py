@@ -0,0 +1,43 @@
+"""CompiledForest against sklearn's RandomForestClassifier."""
+
+import numpy as np
+import pytest
+from forest_engine import CompiledForest, export_forest
+
+ensemble = pytest.importorskip("sklearn.ensemble")
+
+
+@pytest.fixture(scope="module")
+def model():
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(0, 100, 2000), rng.uniform(0, 10, 2000), rng.uniform(0, 3500, 2000)])
+    y = ((X[:, 0] > 60) | (X[:, 1] > 7) | (X[:, 2] < 500)).astype(int)
+    y ^= rng.random(2000) < 0.05
+    return ensemble.RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0).fit(X, y)
+
+
+def test_matches_sklearn(model):
+    rng = np.random.default_rng(1)
+    X = np.column_stack([rng.uniform(-10, 110, 5000), rng.uniform(0, 12, 5000), rng.uniform(0, 4000, 5000)])
+    compiled = CompiledForest(export_forest(model))
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-12)
+
+
+def test_matches_sklearn_at_thresholds(model):
+    # Values on and one float32 step around every split, plus float64 values
+    # that only differ from the threshold below float32 precision
+    compiled = CompiledForest(export_forest(model))
+    rows = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        for feature, threshold in zip(tree.feature, tree.threshold):
+            if feature < 0:
+                continue
+            t32 = np.float32(threshold)
+            for value in (threshold, threshold + 1e-9, threshold - 1e-9, t32,
+                          np.nextafter(t32, np.float32(np.inf)), np.nextafter(t32, np.float32(-np.inf))):
+                row = np.full(model.n_features_in_, 50.0)
+                row[feature] = value
+                rows.append(row)
+    X = np.array(rows)
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-12)
@@ -0,0 +1,59 @@
+"""MicroBatcher scoring and its fallback when a batch fails."""
+
+import asyncio
+import threading
+import numpy as np
+from features import INPUT_FEATURES
+from inference import AsyncMicroBatcher, MicroBatcher
+
+
+class PickyModel:
+    """Probability temperature / 100; fails on the whole batch if any temperature is negative."""
+
+    def predict_proba(self, X):
+        if (X[:, 0] < 0).any():
+            raise ValueError("negative temperature")
+        return np.column_stack([1 - X[:, 0] / 100, X[:, 0] / 100])
+
+
+def row(temperature):
+    return [temperature, 0.5, 2500] + [0.0] * (len(INPUT_FEATURES) - 3)
+
+
+def score(temperatures, window=0.05):
+    results, done = {}, threading.Event()
+    batcher = MicroBatcher(PickyModel(), window=window, max_batch_size=64)
+    for i, temperature in enumerate(temperatures):
+        batcher.submit(row(temperature), lambda prob, i=i: results.__setitem__(i, prob))
+    batcher.call_soon(done.set)
+    assert done.wait(5)
+    batcher.close()
+    return [results[i] for i in range(len(temperatures))], batcher.stats
+
+
+def test_scores_a_batch():
+    probs, stats = score([20, 40, 60])
+    assert probs == [0.2, 0.4, 0.6]
+    assert stats["batches"] == 1 and stats["rows"] == 3
+
+
+def test_failed_batch_scores_rows_one_by_one():
+    probs, stats = score([20, -1, 60])
+    # Every callback runs; only the row the model can't score gets None
+    assert probs == [0.2, None, 0.6]
+    assert stats["errors"] == 1
+    assert stats["unscored"] == 1
+    assert stats["rows"] == 2
+
+
+def test_async_failed_batch_scores_rows_one_by_one():
+    async def run():
+        batcher = AsyncMicroBatcher(PickyModel(), window=0.01)
+        batcher.start()
+        probs = await asyncio.gather(*(batcher.predict(row(t)) for t in (20, -1, 60)))
+        await batcher.close()
+        return probs, batcher.stats
+
+    probs, stats = asyncio.run(run())
+    assert probs == [0.2, None, 0.6]
+    assert stats["errors"] == 1 and stats["unscored"] == 1
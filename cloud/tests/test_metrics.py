@@ -0,0 +1,33 @@
+"""Metrics registry rendering and the signal profiler."""
+
+import time
+from metrics import Registry, SignalProfiler
+
+
+def test_totals_kept_elsewhere_render_as_counters():
+    registry = Registry()
+    stats = {"ood": 3}
+    registry.counter_fn("ood_readings_total", lambda: stats["ood"], "Readings out of distribution")
+    registry.gauge("ood_rate", lambda: 0.5)
+    text = registry.render()
+    assert "# TYPE ood_readings_total counter\nood_readings_total 3" in text
+    assert "# TYPE ood_rate gauge" in text
+
+
+def test_signal_handler_leaves_the_work_to_the_helper_thread(tmp_path):
+    profiler = SignalProfiler(str(tmp_path))
+    profiler.request()
+    assert not profiler.active
+
+    profiler.start()
+    deadline = time.monotonic() + 5
+    while not profiler.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert profiler.active
+    profiler.call(sum, range(1000))
+
+    profiler.request()
+    while not list(tmp_path.iterdir()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not profiler.active
+    assert [path.suffix for path in tmp_path.iterdir()] == [".pstats"]
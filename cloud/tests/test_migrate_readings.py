@@ -0,0 +1,31 @@
+"""Split sensor_data + predictions pairs migrated to combined readings."""
+
+from datetime import datetime
+from fake_firestore import FakeFirestoreClient
+from firestore_writer import BatchedFirestoreWriter, READINGS_COLLECTION, reading_group
+from migrate_readings import migrate
+
+TIMESTAMP = datetime(2026, 1, 1)
+
+
+def test_migration_keeps_drift_fields():
+    db = FakeFirestoreClient()
+    sensor = {"device_id": "m1", "temperature": 95.0, "vibration": 0.5, "rpm": 2500.0, "timestamp": TIMESTAMP}
+    prediction = {"device_id": "m1", "failure_probability": 0.4, "raw_failure_probability": 0.9,
+                  "ood": True, "ood_features": ["temperature"], "anomaly_score": 7.5,
+                  "prediction_drift": 0.2, "timestamp": TIMESTAMP}
+    batch = db.batch()
+    for ref, doc in reading_group(db, sensor, prediction):
+        batch.set(ref, doc)
+    batch.set(db.collection("sensor_data").document("unscored"), dict(sensor, temperature=30.0))
+    batch.commit()
+
+    writer = BatchedFirestoreWriter(db, max_batch_age=0.01)
+    stats = migrate(db, writer, delete_source=True)
+    writer.close()
+
+    assert stats == {"migrated": 2, "deleted": 3}
+    readings = db.documents(READINGS_COLLECTION)
+    migrated = next(doc for doc_id, doc in readings.items() if doc_id != "unscored")
+    assert migrated == dict(sensor, **{k: v for k, v in prediction.items() if k != "timestamp"})
+    assert readings["unscored"]["unscored"] is True
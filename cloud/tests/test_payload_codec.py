@@ -0,0 +1,67 @@
+"""Binary payload frames: round trips and frames that must be rejected."""
+
+import json
+import numpy as np
+import pytest
+from payload_codec import (MAX_BATCH, PayloadError, decode, decode_rows, device_id_from_topic, encode_batch,
+                           encode_reading, is_binary, to_dict)
+
+READINGS = [(25.3, 0.42, 2500, 1767225600 + k, k) for k in range(5)]
+
+
+@pytest.mark.parametrize("device_id", ["pump-7", None])
+def test_reading_round_trip(device_id):
+    payload = encode_reading(25.3, 0.42, 2500, timestamp=1767225600, seq=9, device_id=device_id)
+    assert is_binary(payload) and not is_binary(json.dumps({"rpm": 1}).encode())
+
+    decoded_id, rows = decode_rows(payload)
+    assert decoded_id == device_id
+    assert to_dict(decoded_id, rows[0]) == {"device_id": device_id, "temperature": 25.3, "vibration": 0.42,
+                                            "rpm": 2500, "timestamp": 1767225600, "seq": 9}
+    _, records = decode(payload)
+    assert records.tolist() == rows
+
+
+def test_batch_round_trip():
+    payload = encode_batch(READINGS, device_id="pump-7")
+    device_id, records = decode(payload)
+    assert device_id == "pump-7" and len(records) == 5
+    assert records["seq"].tolist() == list(range(5))
+    np.testing.assert_allclose(records["temperature"], 25.3, rtol=1e-6)
+    assert not records.flags.writeable
+
+    # Several rows skip the single-reading fast path and match the NumPy view
+    assert decode_rows(payload) == ("pump-7", records.tolist())
+    assert [to_dict("pump-7", row)["timestamp"] for row in decode_rows(payload)[1]] == [r[3] for r in READINGS]
+
+
+def test_empty_batch():
+    assert decode_rows(encode_batch([])) == (None, [])
+
+
+@pytest.mark.parametrize("payload", [
+    b"",
+    b"\x01\x01",
+    encode_reading(25.3, 0.42, 2500, device_id="pump-7")[:-1],
+    encode_reading(25.3, 0.42, 2500) + b"\x00",
+    encode_batch(READINGS)[:-3],
+    encode_batch(READINGS)[:4],
+    b"\x02" + encode_reading(25.3, 0.42, 2500)[1:],
+    b"\x01\x07\x00" + bytes(18),
+    b"\x01\x01\x02\xff\xfe" + bytes(18),
+])
+def test_truncated_or_corrupt_frame(payload):
+    with pytest.raises(PayloadError):
+        decode_rows(payload)
+
+
+def test_limits():
+    with pytest.raises(ValueError):
+        encode_batch([READINGS[0]] * (MAX_BATCH + 1))
+    with pytest.raises(ValueError):
+        encode_reading(25.3, 0.42, 2500, device_id="x" * 256)
+
+
+def test_device_id_from_topic():
+    assert device_id_from_topic("motor/pump-7/data", "motor/+/data") == "pump-7"
+    assert device_id_from_topic("motor/health/data", "motor/health/data") == "health"
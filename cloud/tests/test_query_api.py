@@ -0,0 +1,62 @@
+"""Read API pagination over the in-memory Firestore."""
+
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fake_firestore import FakeFirestoreClient
+from firestore_writer import READINGS_COLLECTION
+from query_api import ReadStore, encode_token, make_router
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def store():
+    db = FakeFirestoreClient()
+    batch = db.batch()
+    for k in range(50):
+        # Five readings per timestamp, e.g. a binary frame stored in one go
+        timestamp = START.replace(tzinfo=None) + timedelta(seconds=k // 5)
+        batch.set(db.collection(READINGS_COLLECTION).document(f"r{k:02d}"),
+                  {"device_id": "m1", "temperature": 20.0 + k, "timestamp": timestamp})
+    batch.commit()
+    return ReadStore(db, "combined", cache_ttl=0)
+
+
+@pytest.mark.parametrize("newest_first", [True, False])
+@pytest.mark.parametrize("limit", [3, 5, 7])
+def test_pages_cover_readings_sharing_a_timestamp(store, newest_first, limit):
+    ids, token = [], None
+    while True:
+        page = store.readings("m1", START, START + timedelta(hours=1), limit, token, newest_first)
+        ids += [row["id"] for row in page["readings"]]
+        token = page["next_page_token"]
+        if token is None:
+            break
+    assert len(ids) == 50
+    assert sorted(ids) == [f"r{k:02d}" for k in range(50)]
+
+
+def test_csv_export_has_every_reading(store):
+    csv_text = "".join(store.export_csv("m1", START, START + timedelta(hours=1), page_size=4))
+    assert len(csv_text.strip().splitlines()) == 51
+
+
+def test_invalid_page_token(store):
+    with pytest.raises(ValueError):
+        store.readings("m1", START, START + timedelta(hours=1), page_token="bm9wZQ==")
+
+
+@pytest.mark.parametrize("path, token", [
+    ("/api/series", encode_token(5)),
+    ("/api/series", encode_token("not a time")),
+    ("/api/readings", encode_token([1, 2])),
+    ("/api/readings", encode_token({"a": 1})),
+    ("/api/readings", "%%%"),
+])
+def test_malformed_page_token_is_a_bad_request(store, path, token):
+    app = FastAPI()
+    app.include_router(make_router(store))
+    response = TestClient(app).get(path, params={"device_id": "m1", "page_token": token})
+    assert response.status_code == 400
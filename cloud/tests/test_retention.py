@@ -0,0 +1,68 @@
+"""Retention job: archived days keep complete rollups."""
+
+from datetime import datetime, timedelta, timezone
+import pytest
+from fake_firestore import FakeFirestoreClient
+from firestore_writer import BatchedFirestoreWriter, READINGS_COLLECTION, reading_group
+from query_api import ReadStore
+from retention import ReadingArchive, archive_readings, to_columns
+from rollups import rollup_id
+
+# The subscriber stores naive UTC timestamps
+DAY = datetime(2026, 1, 1)
+DAY_UTC = DAY.replace(tzinfo=timezone.utc)
+
+
+def store_readings(db, storage_mode):
+    """Four readings of one minute; the last one was stored without a prediction (inference failed)."""
+    batch = db.batch()
+    for k in range(4):
+        sensor = {"device_id": "m1", "temperature": 20.0 + k, "vibration": 0.5, "rpm": 2500.0,
+                  "timestamp": DAY + timedelta(seconds=10 * k)}
+        prediction = {"device_id": "m1", "failure_probability": 0.1 * k, "timestamp": sensor["timestamp"]}
+        if storage_mode == "combined":
+            doc = dict(sensor, **prediction) if k < 3 else dict(sensor, unscored=True)
+            batch.set(db.collection(READINGS_COLLECTION).document(), doc)
+        elif k < 3:
+            for ref, doc in reading_group(db, sensor, prediction):
+                batch.set(ref, doc)
+        else:
+            batch.set(db.collection("sensor_data").document(), sensor)
+    batch.commit()
+
+
+@pytest.mark.parametrize("storage_mode, documents", [("split", 7), ("combined", 4)])
+def test_readings_without_prediction_stay_in_rollups(tmp_path, storage_mode, documents):
+    db = FakeFirestoreClient()
+    store_readings(db, storage_mode)
+
+    writer = BatchedFirestoreWriter(db, max_batch_age=0.01)
+    stats = archive_readings(db, ReadingArchive(str(tmp_path)), DAY + timedelta(days=1), storage_mode, writer=writer)
+    writer.close()
+
+    assert stats["readings"] == 4 and stats["deleted"] == documents
+    bucket = db.documents("rollups")[rollup_id("m1", "1m", int(DAY_UTC.timestamp()))]
+    assert bucket["count"] == 4
+    assert bucket["temperature"]["count"] == 4 and bucket["temperature"]["sum"] == 86.0
+    assert bucket["failure_probability"]["count"] == 3
+    assert sum(bucket["risk"].values()) == 3
+
+    summary = ReadStore(db, storage_mode).summary("m1", DAY_UTC, DAY_UTC + timedelta(hours=1))
+    assert summary["count"] == 4
+    assert summary["temperature"]["mean"] == pytest.approx(21.5)
+    assert summary["failure_probability"]["mean"] == pytest.approx(0.1)
+
+
+def test_archive_keeps_ood_features_and_reads_older_files(tmp_path):
+    archive = ReadingArchive(str(tmp_path))
+    ts = DAY_UTC.timestamp()
+    old = to_columns(["a"], [{"timestamp": ts, "temperature": 20.0}])
+    del old["ood_features"]
+    archive.write("m1", "2026-01-01", old)
+
+    archive.write("m1", "2026-01-01", to_columns(["b"], [{"timestamp": ts + 1, "temperature": 95.0, "ood": True,
+                                                          "ood_features": ["temperature", "rpm"]}]))
+    data = archive.read("m1", columns=["id", "ood", "ood_features"])
+    assert data["id"].tolist() == ["a", "b"]
+    assert data["ood"].tolist() == [False, True]
+    assert data["ood_features"].tolist() == ["", "temperature,rpm"]
@@ -0,0 +1,31 @@
+"""Rollup backfill from the stored readings."""
+
+from datetime import datetime, timedelta, timezone
+from fake_firestore import FakeFirestoreClient
+from firestore_writer import BatchedFirestoreWriter, reading_group
+from rollups import backfill, rollup_id
+
+DAY = datetime(2026, 1, 1)
+DAY_START = int(DAY.replace(tzinfo=timezone.utc).timestamp())
+
+
+def test_backfill_since_mid_hour_rebuilds_whole_buckets():
+    db = FakeFirestoreClient()
+    batch = db.batch()
+    for minute in range(0, 120, 10):
+        ts = DAY + timedelta(minutes=minute)
+        sensor = {"device_id": "m1", "temperature": float(minute), "vibration": 0.5, "rpm": 2500.0, "timestamp": ts}
+        for ref, doc in reading_group(db, sensor, {"device_id": "m1", "failure_probability": 0.1, "timestamp": ts}):
+            batch.set(ref, doc)
+    batch.commit()
+
+    writer = BatchedFirestoreWriter(db, max_batch_age=0.01)
+    backfill(db, writer, since=DAY + timedelta(minutes=90))
+    writer.close()
+
+    rollups = db.documents("rollups")
+    hour = rollups[rollup_id("m1", "1h", DAY_START + 3600)]
+    assert hour["count"] == 6
+    assert hour["temperature"]["min"] == 60.0
+    assert rollups[rollup_id("m1", "1d", DAY_START)]["count"] == 12
+    assert rollup_id("m1", "1m", DAY_START) in rollups
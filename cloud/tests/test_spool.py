@@ -0,0 +1,113 @@
+"""SpooledFirestoreWriter and WriteSpool against the in-memory Firestore."""
+
+from fake_firestore import FakeFirestoreClient, FakeFirestoreError
+from spool import SpooledFirestoreWriter, WriteSpool
+
+
+def group(db, doc_id, writes=1):
+    return [(db.collection("readings").document(f"{doc_id}-{k}"), {"k": k}) for k in range(writes)]
+
+
+def spooled_writer(db, path, **kwargs):
+    kwargs = dict(dict(max_batch_age=0.05, backoff_base=0.05, backoff_max=0.2), **kwargs)
+    return SpooledFirestoreWriter(db, WriteSpool(str(path)), **kwargs)
+
+
+def test_replays_after_outage(tmp_path):
+    db = FakeFirestoreClient()
+    db.outage(0.5)
+    writer = spooled_writer(db, tmp_path / "spool.db")
+    for i in range(20):
+        assert writer.write(group(db, f"d{i}"))
+    assert writer.depth() > 0
+
+    assert writer.flush(10)
+    assert db.count("readings") == 20
+    assert writer.stats["retries"] >= 1
+    assert writer.stats["written"] == 20
+    assert writer.close()
+
+
+def test_spool_survives_restart(tmp_path):
+    path = tmp_path / "spool.db"
+    down = FakeFirestoreClient()
+    down.outage(60)
+    writer = spooled_writer(down, path)
+    for i in range(5):
+        writer.write(group(down, f"d{i}", writes=2))
+    assert writer.close(timeout=5)
+    assert down.count("readings") == 0
+
+    db = FakeFirestoreClient()
+    writer = spooled_writer(db, path)
+    assert writer.recovering
+    assert writer.flush(10)
+    assert db.count("readings") == 10
+    assert writer.close()
+
+
+def test_peek_returns_oversized_oldest_group(tmp_path):
+    db = FakeFirestoreClient()
+    spool = WriteSpool(str(tmp_path / "spool.db"))
+    spool.append(WriteSpool.encode(group(db, "big", writes=10)), 10)
+    spool.append(WriteSpool.encode(group(db, "small")), 1)
+
+    rows = spool.peek(4)
+    assert [writes for _, writes, _ in rows] == [10]
+    spool.close()
+
+
+def test_replays_group_larger_than_batch_size(tmp_path):
+    # E.g. spooled before FIRESTORE_BATCH_SIZE was lowered
+    db = FakeFirestoreClient()
+    path = str(tmp_path / "spool.db")
+    spool = WriteSpool(path)
+    spool.append(WriteSpool.encode(group(db, "big", writes=10)), 10)
+    spool.append(WriteSpool.encode(group(db, "small")), 1)
+    spool.close()
+
+    writer = SpooledFirestoreWriter(db, WriteSpool(path), max_batch_size=4, max_batch_age=0.05)
+    assert writer.flush(5)
+    assert db.count("readings") == 11
+    assert writer.stats["written"] == 11
+    assert writer.close()
+
+
+def test_rejected_group_is_dead_lettered(tmp_path):
+    db = FakeFirestoreClient()
+    spool = WriteSpool(str(tmp_path / "spool.db"))
+    writer = SpooledFirestoreWriter(db, spool, max_batch_age=0.05)
+    writer.write(group(db, "a"))
+    writer.write([(db.collection("readings").document("bad"), {"tags": {"x", "y"}})])
+    writer.write(group(db, "b"))
+
+    assert writer.flush(5)
+    assert sorted(db.documents("readings")) == ["a-0", "b-0"]
+    assert writer.stats["dead_lettered"] == 1
+    assert writer.stats["retries"] == 0
+    assert spool.dead_letters() == 1
+    assert writer.close()
+
+
+class FailSecondCommit(FakeFirestoreClient):
+    def _commit(self, ops):
+        if self.commit_count == 1 and not self.failed_commits:
+            self.failed_commits += 1
+            raise FakeFirestoreError("Injected Firestore failure")
+        super()._commit(ops)
+
+
+def test_split_group_resumes_after_last_committed_part(tmp_path):
+    db = FailSecondCommit()
+    path = str(tmp_path / "spool.db")
+    spool = WriteSpool(path)
+    spool.append(WriteSpool.encode(group(db, "big", writes=10)), 10)
+    spool.close()
+
+    writer = SpooledFirestoreWriter(db, WriteSpool(path), max_batch_size=4, max_batch_age=0.05,
+                                    backoff_base=0.05)
+    assert writer.flush(5)
+    assert db.count("readings") == 10
+    assert db.write_count == 10
+    assert writer.stats["retries"] == 1
+    assert writer.close()
@@ -29,6 +29,20 @@ let isPaused = false;
 let currentTimeValue = 30;
 let currentTimeUnit = 'minutes';
 
+// Motor whose history is charted (the original single motor publishes as "health")
+const DEVICE_ID = 'health';
+
+// Must match the cloud subscriber's STORAGE_MODE:
+// 'split' = sensor_data + predictions joined on sensor_data_id,
+// 'combined' = one `readings` document per reading (no join reads)
+const STORAGE_MODE = 'split';
+
+// Read API (cloud/htpp_old_code/main.py, routes in cloud/query_api.py), e.g.
+// 'https://motor-health-api-....run.app'. When set, the reading count,
+// long-range charts and CSV export come from its aggregates and paginated
+// queries instead of Firestore reads in the browser. Empty = Firestore only.
+const API_URL = '';
+
 
 // Data storage for charts
 
@@ -438,38 +452,55 @@ setInterval(() => {
 }, 1000);
 
 // Listen to sensor data changes and update charts
-// Listen to new predictions (and fetch associated sensor data)
-// This avoids the race condition where sensor_data exists but prediction is not yet written.
-db.collection('predictions')
-    .orderBy('timestamp', 'desc')
-    .limit(1)
-    .onSnapshot((snapshot) => {
-        if (!snapshot.empty) {
-            const pred = snapshot.docs[0].data();
-            const predId = snapshot.docs[0].id;
-
-            lastUpdateEl.textContent = new Date().toLocaleString();
-
-            // Fetch corresponding sensor data
-            db.collection('sensor_data')
-                .doc(pred.sensor_data_id)
-                .get()
-                .then((sensorDoc) => {
-                    if (sensorDoc.exists) {
-                        const data = sensorDoc.data();
+if (STORAGE_MODE === 'combined') {
+    // One document already holds the sensor values and the prediction
+    db.collection('readings')
+        .orderBy('timestamp', 'desc')
+        .limit(1)
+        .onSnapshot((snapshot) => {
+            if (!snapshot.empty) {
+                const reading = snapshot.docs[0].data();
+                lastUpdateEl.textContent = new Date().toLocaleString();
+                updateCharts(reading, reading.timestamp.toDate(), reading.failure_probability);
+                if (!isPaused) {
+                    updateLatestReading(reading, reading);
+                }
+            }
+        });
+} else {
+    // Listen to new predictions (and fetch associated sensor data)
+    // This avoids the race condition where sensor_data exists but prediction is not yet written.
+    db.collection('predictions')
+        .orderBy('timestamp', 'desc')
+        .limit(1)
+        .onSnapshot((snapshot) => {
+            if (!snapshot.empty) {
+                const pred = snapshot.docs[0].data();
+                const predId = snapshot.docs[0].id;
+
+                lastUpdateEl.textContent = new Date().toLocaleString();
+
+                // Fetch corresponding sensor data
+                db.collection('sensor_data')
+                    .doc(pred.sensor_data_id)
+                    .get()
+                    .then((sensorDoc) => {
+                        if (sensorDoc.exists) {
+                            const data = sensorDoc.data();
 
-                        // Update charts with new data
-                        updateCharts(data, pred.timestamp.toDate(), pred.failure_probability);
+                            // Update charts with new data
+                            updateCharts(data, pred.timestamp.toDate(), pred.failure_probability);
 
-                        // Only update latest reading box if NOT paused
-                        if (!isPaused) {
-                            updateLatestReading(data, pred);
+                            // Only update latest reading box if NOT paused
+                            if (!isPaused) {
+                                updateLatestReading(data, pred);
+                            }
                         }
-                    }
-                })
-                .catch(err => console.error("Error fetching sensor data for prediction:", err));
-        }
-    });
+                    })
+                    .catch(err => console.error("Error fetching sensor data for prediction:", err));
+            }
+        });
+}
 
 // Function to update the latest reading box
 function updateLatestReading(sensorData, predictionData) {
@@ -646,6 +677,138 @@ function formatTimeLabel(date) {
 }
 
 
+// Helper: Rollup resolution for a time range (null = read raw sensor_data).
+// Rollups are maintained by the cloud subscriber (cloud/rollups.py); each
+// choice keeps a view at a few hundred documents.
+function rollupResolution(duration) {
+    const hour = 60 * 60 * 1000;
+    if (duration <= hour) return null;
+    if (duration <= 12 * hour) return '1m';
+    if (duration <= 30 * 24 * hour) return '1h';
+    return '1d';
+}
+
+// 4a. Long-range history from the rollups collection (min/max/sum/count per bucket)
+function loadRollupHistory(resolution, startTime) {
+    db.collection('rollups')
+        .where('device_id', '==', DEVICE_ID)
+        .where('resolution', '==', resolution)
+        .where('bucket_start', '>', startTime)
+        .orderBy('bucket_start', 'asc')
+        .get()
+        .then((snapshot) => {
+            snapshot.forEach((doc) => {
+                const bucket = doc.data();
+                if (!bucket.count || !bucket.failure_probability) return;
+                // Per-metric count: readings stored without a prediction have no failure_probability
+                const mean = (metric) => bucket[metric].sum / (bucket[metric].count || bucket.count);
+                const time = bucket.bucket_start.toDate();
+
+                chartData.labels.push(formatTimeLabel(time));
+                chartData.timestamps.push(time.getTime());
+                chartData.temperature.push(mean('temperature'));
+                chartData.vibration.push(mean('vibration'));
+                chartData.rpm.push(mean('rpm'));
+                chartData.risk.push(mean('failure_probability') * 100);
+            });
+
+            console.log(`Loaded ${snapshot.size} ${resolution} rollups`);
+            updateChartDensity(chartData.labels.length);
+            temperatureChart.update();
+            vibrationChart.update();
+            rpmChart.update();
+            riskChart.update();
+            combinedChart.update();
+        })
+        .catch((error) => {
+            console.error('Error loading rollups:', error);
+        });
+}
+
+// 4a'. Same from the read API, page by page (/api/series)
+async function loadApiSeries(resolution, startTime) {
+    try {
+        let pageToken = null;
+        do {
+            const params = new URLSearchParams({ device_id: DEVICE_ID, resolution, start: startTime.toISOString(), limit: 2000 });
+            if (pageToken) params.set('page_token', pageToken);
+            const response = await fetch(`${API_URL}/api/series?${params}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const page = await response.json();
+            page.points.forEach((point) => {
+                if (!point.count || !point.failure_probability) return;
+                const time = new Date(point.bucket_start);
+                chartData.labels.push(formatTimeLabel(time));
+                chartData.timestamps.push(time.getTime());
+                chartData.temperature.push(point.temperature.mean);
+                chartData.vibration.push(point.vibration.mean);
+                chartData.rpm.push(point.rpm.mean);
+                chartData.risk.push(point.failure_probability.mean * 100);
+            });
+            pageToken = page.next_page_token;
+        } while (pageToken);
+
+        updateChartDensity(chartData.labels.length);
+        temperatureChart.update();
+        vibrationChart.update();
+        rpmChart.update();
+        riskChart.update();
+        combinedChart.update();
+    } catch (error) {
+        console.error('Error loading series from the API:', error);
+    }
+}
+
+// Reading count of the selected range, from the API's rollup summary
+function loadApiSummary(startTime) {
+    const params = new URLSearchParams({ device_id: DEVICE_ID, start: startTime.toISOString() });
+    fetch(`${API_URL}/api/summary?${params}`)
+        .then((response) => response.json())
+        .then((summary) => {
+            totalReadingsEl.textContent = summary.count;
+        })
+        .catch((error) => {
+            console.error('Error loading summary from the API:', error);
+        });
+}
+
+// 4b. Short-range history from combined `readings` documents (no join query)
+function loadCombinedHistory(startTime) {
+    db.collection('readings')
+        .where('timestamp', '>', startTime)
+        .orderBy('timestamp', 'asc')
+        .get()
+        .then((snapshot) => {
+            let readings = snapshot.docs.map((doc) => doc.data());
+            readings = downsampleData(readings);
+
+            readings.forEach((reading) => {
+                const time = reading.timestamp.toDate();
+                chartData.labels.push(formatTimeLabel(time));
+                chartData.timestamps.push(time.getTime());
+                chartData.temperature.push(reading.temperature);
+                chartData.vibration.push(reading.vibration);
+                chartData.rpm.push(reading.rpm);
+                chartData.risk.push(reading.failure_probability * 100);
+            });
+
+            updateChartDensity(chartData.labels.length);
+            temperatureChart.update();
+            vibrationChart.update();
+            rpmChart.update();
+            riskChart.update();
+            combinedChart.update();
+
+            if (readings.length) {
+                const latest = readings[readings.length - 1];
+                updateLatestReading(latest, latest);
+            }
+        })
+        .catch((error) => {
+            console.error('Error loading historical data:', error);
+        });
+}
+
 // 4. Time-Based History Loading
 function loadHistoricalData() {
     // Clear existing data arrays in place to preserve Chart.js references
@@ -659,6 +822,25 @@ function loadHistoricalData() {
     const duration = getDurationInMillis();
     const startTime = new Date(Date.now() - duration);
 
+    if (API_URL) {
+        loadApiSummary(startTime);
+    }
+
+    const resolution = rollupResolution(duration);
+    if (resolution) {
+        console.log(`Loading ${resolution} rollups since: ${startTime.toLocaleString()}`);
+        if (API_URL) {
+            loadApiSeries(resolution, startTime);
+        } else {
+            loadRollupHistory(resolution, startTime);
+        }
+        return;
+    }
+    if (STORAGE_MODE === 'combined') {
+        loadCombinedHistory(startTime);
+        return;
+    }
+
     console.log(`Loading data since: ${startTime.toLocaleString()} (${currentTimeValue} ${currentTimeUnit})`);
 
     db.collection('sensor_data')
@@ -792,45 +974,60 @@ loadHistoricalData();
 let allPredictions = [];
 
 // Listen to recent predictions
-db.collection('predictions')
-    .orderBy('timestamp', 'desc')
-    .limit(50)
-    .onSnapshot((snapshot) => {
-        totalReadingsEl.textContent = snapshot.size;
+if (STORAGE_MODE === 'combined') {
+    db.collection('readings')
+        .orderBy('timestamp', 'desc')
+        .limit(50)
+        .onSnapshot((snapshot) => {
+            if (!API_URL) totalReadingsEl.textContent = snapshot.size;
+            allPredictions = snapshot.docs.map((doc) => ({
+                id: doc.id,
+                prediction: doc.data(),
+                sensor: doc.data()
+            }));
+            displayPredictions(allPredictions);
+        });
+} else {
+    db.collection('predictions')
+        .orderBy('timestamp', 'desc')
+        .limit(50)
+        .onSnapshot((snapshot) => {
+            if (!API_URL) totalReadingsEl.textContent = snapshot.size;
 
-        // Store all predictions with their IDs
-        allPredictions = [];
-        const promises = [];
+            // Store all predictions with their IDs
+            allPredictions = [];
+            const promises = [];
 
-        snapshot.forEach((doc) => {
-            const predData = doc.data();
+            snapshot.forEach((doc) => {
+                const predData = doc.data();
 
-            // Fetch corresponding sensor data
-            const promise = db.collection('sensor_data')
-                .doc(predData.sensor_data_id)
-                .get()
-                .then((sensorDoc) => {
-                    if (sensorDoc.exists) {
-                        allPredictions.push({
-                            id: doc.id,
-                            prediction: predData,
-                            sensor: sensorDoc.data()
-                        });
-                    }
-                });
+                // Fetch corresponding sensor data
+                const promise = db.collection('sensor_data')
+                    .doc(predData.sensor_data_id)
+                    .get()
+                    .then((sensorDoc) => {
+                        if (sensorDoc.exists) {
+                            allPredictions.push({
+                                id: doc.id,
+                                prediction: predData,
+                                sensor: sensorDoc.data()
+                            });
+                        }
+                    });
 
-            promises.push(promise);
-        });
+                promises.push(promise);
+            });
 
-        // Wait for all sensor data to be fetched
-        Promise.all(promises).then(() => {
-            // Sort by timestamp
-            allPredictions.sort((a, b) =>
-                b.prediction.timestamp.toDate() - a.prediction.timestamp.toDate()
-            );
-            displayPredictions(allPredictions);
+            // Wait for all sensor data to be fetched
+            Promise.all(promises).then(() => {
+                // Sort by timestamp
+                allPredictions.sort((a, b) =>
+                    b.prediction.timestamp.toDate() - a.prediction.timestamp.toDate()
+                );
+                displayPredictions(allPredictions);
+            });
         });
-    });
+}
 
 // Display predictions
 function displayPredictions(predictions) {
@@ -998,6 +1195,15 @@ clearAllBtn.addEventListener('click', async () => {
         await Promise.all(sensorDeletePromises);
         console.log(`Deleted ${sensorDeletePromises.length} sensor data records`);
 
+        // Delete all combined readings (STORAGE_MODE = 'combined')
+        const readingsSnapshot = await db.collection('readings').get();
+        const readingDeletePromises = [];
+        readingsSnapshot.forEach((doc) => {
+            readingDeletePromises.push(doc.ref.delete());
+        });
+        await Promise.all(readingDeletePromises);
+        console.log(`Deleted ${readingDeletePromises.length} readings`);
+
         // Clear chart data
         chartData.labels = [];
         chartData.temperature = [];
@@ -1029,7 +1235,7 @@ clearAllBtn.addEventListener('click', async () => {
         riskValueEl.textContent = '--%';
         riskValueEl.classList.remove('risk-low', 'risk-medium', 'risk-high');
 
-        alert(`✅ Successfully deleted all data!\n\nPredictions: ${predictionDeletePromises.length}\nSensor Data: ${sensorDeletePromises.length}`);
+        alert(`✅ Successfully deleted all data!\n\nPredictions: ${predictionDeletePromises.length}\nSensor Data: ${sensorDeletePromises.length}\nReadings: ${readingDeletePromises.length}`);
 
     } catch (error) {
         console.error('Error deleting data:', error);
@@ -1071,6 +1277,16 @@ pauseBtn.addEventListener('click', () => {
 
 // 3. Export to CSV Functionality
 exportBtn.addEventListener('click', () => {
+    if (API_URL) {
+        // Every reading of the selected range, streamed by the API
+        const params = new URLSearchParams({
+            device_id: DEVICE_ID,
+            start: new Date(Date.now() - getDurationInMillis()).toISOString()
+        });
+        window.location.href = `${API_URL}/api/export.csv?${params}`;
+        return;
+    }
+
     if (allPredictions.length === 0) {
         alert('No data available to export.');
         return;
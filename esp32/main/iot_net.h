@@ -12,6 +12,12 @@ static const char *MQTT_TOPIC = "motor/health/data";
 static const char *MQTT_SUB_TOPIC = "motor/health/alert";
 static const char *MQTT_CLIENT_PREFIX = "ESP32Client-";
 
+// 1 = publish the compact binary payload (see cloud/payload_codec.py, ~21 bytes)
+// instead of JSON (~80 bytes). The cloud subscriber accepts both.
+#ifndef PAYLOAD_BINARY
+#define PAYLOAD_BINARY 0
+#endif
+
 // Shared variable for risk (0.0 to 1.0)
 float latestRisk = 0.0;
 
@@ -143,6 +149,27 @@ inline float publishData(float temperature, float vibration, int rpm, unsigned l
         connectMQTT();
     }
 
+#if PAYLOAD_BINARY
+    // Single reading frame: version, kind, id length (0 = device id from topic),
+    // then timestamp u32, seq u32, temperature f32, vibration f32, rpm u16.
+    // The ESP32 is little-endian like the wire format, so memcpy is enough.
+    static uint32_t seq = 0;
+    uint8_t frame[3 + 18];
+    uint32_t ts32 = (uint32_t)timestamp;
+    uint32_t seq32 = seq++;
+    uint16_t rpm16 = rpm < 0 ? 0 : (uint16_t)rpm;
+    frame[0] = 1;    // payload version
+    frame[1] = 0x01; // single reading
+    frame[2] = 0;
+    memcpy(frame + 3, &ts32, 4);
+    memcpy(frame + 7, &seq32, 4);
+    memcpy(frame + 11, &temperature, 4);
+    memcpy(frame + 15, &vibration, 4);
+    memcpy(frame + 19, &rpm16, 2);
+
+    Serial.print("📤 Publishing to MQTT (binary)... ");
+    bool published = client.publish(MQTT_TOPIC, frame, sizeof(frame));
+#else
     StaticJsonDocument<200> doc;
     doc["temperature"] = temperature;
     doc["vibration"] = vibration;
@@ -153,7 +180,10 @@ inline float publishData(float temperature, float vibration, int rpm, unsigned l
     serializeJson(doc, payload);
 
     Serial.print("📤 Publishing to MQTT... ");
-    if (client.publish(MQTT_TOPIC, payload.c_str()))
+    bool published = client.publish(MQTT_TOPIC, payload.c_str());
+#endif
+
+    if (published)
     {
         Serial.println("✓ Success!");
         return latestRisk; // Return the latest known risk from cloud